@@ -0,0 +1,433 @@
+"""Chunking benchmarks over fixed corpora, with a stored baseline.
+
+Runs offline: the corpora are `tests/test_code_index_project` plus synthetic
+files generated here (a huge and a deeply nested file per language). For
+every corpus and chunking mode it reports chunks/s, MB/s, traced peak memory
+and how the time splits between tree-sitter parsing and Python-side
+chunking.
+
+    python benchmarks/bench_chunking.py                      # run and print
+    python benchmarks/bench_chunking.py --save-baseline      # refresh baseline.json
+    python benchmarks/bench_chunking.py --compare            # exit 1 on regression
+
+Before timings are compared, limits are relaxed by how much slower a short
+calibration loop runs than when the baseline was recorded, so a baseline
+from a fast machine stays usable on a slower one.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import importlib.metadata
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+from mini_code_index.chunking import Config, TreeSitterChunker, pooled_parser  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+PROJECT_CORPUS = REPO_ROOT / "tests" / "test_code_index_project"
+MODES = ("file", "type", "function", "auto_ast")
+
+
+# ---------------------------------------------------------------------------
+# Corpora
+# ---------------------------------------------------------------------------
+
+
+def _python_huge(n: int) -> str:
+    parts = ["import os\nimport sys\n\n"]
+    for i in range(n):
+        parts.append(
+            f"class Service{i}:\n"
+            f'    """Service number {i}."""\n\n'
+            f"    def __init__(self, value):\n        self.value = value + {i}\n\n"
+            f"    def compute(self, x):\n"
+            f"        total = 0\n"
+            f"        for k in range(x):\n"
+            f"            if k % {i % 7 + 2} == 0:\n"
+            f"                total += k * self.value\n"
+            f"        return total\n\n\n"
+            f"def helper_{i}(a, b):\n    # combine two values\n    return a * {i} + b\n\n\n"
+        )
+    return "".join(parts)
+
+
+def _python_nested(depth: int) -> str:
+    lines = []
+    for d in range(depth):
+        pad = "    " * d
+        kind = "class" if d % 2 == 0 else "def"
+        lines.append(f"{pad}{kind} n{d}{'' if kind == 'class' else '(self)'}:")
+        lines.append(f"{pad}    x{d} = {d}")
+    return "\n".join(lines) + "\n"
+
+
+def _java_huge(n: int) -> str:
+    parts = ["package bench;\n\nimport java.util.List;\n\n"]
+    for i in range(n):
+        parts.append(
+            f"public class Service{i} {{\n"
+            f"    private final int value = {i};\n\n"
+            f"    /** Computes a total. */\n"
+            f"    public int compute(List<Integer> xs) {{\n"
+            f"        int total = 0;\n"
+            f"        for (int x : xs) {{\n"
+            f"            if (x % {i % 7 + 2} == 0) {{\n"
+            f"                total += x * value;\n"
+            f"            }}\n"
+            f"        }}\n"
+            f"        return total;\n"
+            f"    }}\n\n"
+            f"    public static int helper{i}(int a, int b) {{ return a * {i} + b; }}\n"
+            f"}}\n\n"
+        )
+    return "".join(parts)
+
+
+def _java_nested(depth: int) -> str:
+    opens = "".join(f"{'  ' * d}class N{d} {{\n{'  ' * d}  int f{d}() {{ return {d}; }}\n" for d in range(depth))
+    closes = "".join(f"{'  ' * d}}}\n" for d in reversed(range(depth)))
+    return opens + closes
+
+
+def _js_huge(n: int) -> str:
+    parts = []
+    for i in range(n):
+        parts.append(
+            f"export class Widget{i} {{\n"
+            f"  constructor(value) {{ this.value = value + {i}; }}\n"
+            f"  render(items) {{\n"
+            f"    return items.filter((x) => x % {i % 7 + 2} === 0).map((x) => x * this.value);\n"
+            f"  }}\n"
+            f"}}\n\n"
+            f"function helper{i}(a, b) {{\n  // combine two values\n  return a * {i} + b;\n}}\n\n"
+        )
+    return "".join(parts)
+
+
+def _js_nested(depth: int) -> str:
+    return "".join(f"function f{d}() {{\n" for d in range(depth)) + "return 1;\n" + "}\n" * depth
+
+
+def _json_huge(n: int) -> str:
+    rows = ",\n".join(
+        f'  {{"id": {i}, "name": "item {i}", "tags": ["a", "b", "c"], "score": {i * 0.5}}}' for i in range(n)
+    )
+    return "[\n" + rows + "\n]\n"
+
+
+def _json_nested(depth: int) -> str:
+    return "".join(f'{{"k{d}": ' for d in range(depth)) + "1" + "}" * depth + "\n"
+
+
+# name -> (file name, generator, size parameter at scale 1.0)
+SYNTHETIC: dict[str, tuple[str, Callable[[int], str], int]] = {
+    "python-huge": ("huge.py", _python_huge, 1500),
+    "python-nested": ("nested.py", _python_nested, 90),
+    "java-huge": ("Huge.java", _java_huge, 1200),
+    "java-nested": ("Nested.java", _java_nested, 300),
+    "javascript-huge": ("huge.js", _js_huge, 1500),
+    "javascript-nested": ("nested.js", _js_nested, 600),
+    "json-huge": ("huge.json", _json_huge, 8000),
+    "json-nested": ("nested.json", _json_nested, 2000),
+}
+
+
+def project_files() -> list[Path]:
+    # Byte-code caches (e.g. from `compileall`) are not part of the corpus.
+    return sorted(
+        p
+        for p in PROJECT_CORPUS.rglob("*")
+        if p.is_file()
+        and not any(part == "__pycache__" or part.startswith(".") for part in p.relative_to(PROJECT_CORPUS).parts)
+    )
+
+
+def synthetic_files(directory: Path, *, scale: float = 1.0, names: Optional[Iterable[str]] = None) -> dict[str, Path]:
+    """Write the synthetic corpora into `directory`; returns corpus -> path."""
+
+    out: dict[str, Path] = {}
+    for name in names or SYNTHETIC:
+        file_name, generate, size = SYNTHETIC[name]
+        path = directory / file_name
+        path.write_text(generate(max(2, int(size * scale))), encoding="utf-8")
+        out[name] = path
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class Result:
+    corpus: str
+    mode: str
+    files: int
+    bytes: int
+    chunks: int
+    seconds: float
+    parse_seconds: float
+    peak_bytes: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.corpus}/{self.mode}"
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    @property
+    def python_seconds(self) -> float:
+        return max(0.0, self.seconds - self.parse_seconds)
+
+
+def calibrate() -> float:
+    """Seconds for a fixed pure-Python workload (best of 5)."""
+
+    def _work() -> int:
+        acc = 0
+        table: dict[int, int] = {}
+        for i in range(200_000):
+            acc += i % 7
+            table[i & 1023] = acc
+        return acc + len(table)
+
+    best = float("inf")
+    for _ in range(5):
+        t0 = time.perf_counter()
+        _work()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _chunk_files(chunker: TreeSitterChunker, files: list[tuple[str, bytes]]) -> tuple[int, dict[str, str]]:
+    chunks = 0
+    languages: dict[str, str] = {}
+    for path, data in files:
+        for c in chunker.chunk(path, data=data):
+            chunks += 1
+            if c.language and path not in languages:
+                languages[path] = c.language
+    return chunks, languages
+
+
+def measure(corpus: str, paths: list[Path], mode: str, *, chunk_size: int = 2500, repeat: int = 3) -> Result:
+    files = [(str(p), p.read_bytes()) for p in paths]
+    chunker = TreeSitterChunker(Config(mode=mode, chunk_size=chunk_size))
+    chunks, languages = _chunk_files(chunker, files)  # warm-up: parsers, lexers, caches
+
+    best = parse_best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        # As in `timeit`: collector pauses depend on everything else alive
+        # in the process, not on the code being measured.
+        gc.disable()
+        try:
+            t0 = time.perf_counter()
+            _chunk_files(chunker, files)
+            best = min(best, time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            for path, data in files:
+                lang = languages.get(path)
+                if lang is not None:
+                    pooled_parser(lang).parse(data)
+            parse_best = min(parse_best, time.perf_counter() - t0)
+        finally:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _chunk_files(chunker, files)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        corpus=corpus,
+        mode=mode,
+        files=len(files),
+        bytes=sum(len(d) for _, d in files),
+        chunks=chunks,
+        seconds=best,
+        parse_seconds=min(parse_best, best),
+        peak_bytes=peak,
+    )
+
+
+def run(
+    *,
+    modes: Iterable[str] = MODES,
+    corpora: Optional[Iterable[str]] = None,
+    scale: float = 1.0,
+    repeat: int = 3,
+    chunk_size: int = 2500,
+    work_dir: Optional[Path] = None,
+) -> list[Result]:
+    wanted = list(corpora) if corpora is not None else ["project", *SYNTHETIC]
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        generated = synthetic_files(Path(tmp), scale=scale, names=[c for c in wanted if c in SYNTHETIC])
+        results: list[Result] = []
+        for corpus in wanted:
+            paths = project_files() if corpus == "project" else [generated[corpus]]
+            for mode in modes:
+                results.append(measure(corpus, paths, mode, chunk_size=chunk_size, repeat=repeat))
+        return results
+
+
+# ---------------------------------------------------------------------------
+# Baseline
+# ---------------------------------------------------------------------------
+
+
+def _package_version(name: str) -> Optional[str]:
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def to_payload(results: list[Result], *, calibration_s: float, scale: float) -> dict:
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "tree_sitter": _package_version("tree-sitter"),
+            "tree_sitter_language_pack": _package_version("tree-sitter-language-pack"),
+            "calibration_s": calibration_s,
+            "scale": scale,
+        },
+        "results": {r.key: asdict(r) for r in results},
+    }
+
+
+def compare(
+    results: list[Result],
+    baseline: dict,
+    *,
+    calibration_s: float,
+    max_slowdown: float = 0.5,
+    max_memory_growth: float = 0.25,
+    min_delta_s: float = 0.005,
+) -> list[str]:
+    """Regressions of `results` against `baseline` (empty when none).
+
+    A slower calibration reading than the baseline's relaxes the time limits
+    in proportion; a faster one never tightens them, as calibration noise is
+    larger than the gain. Differences under `min_delta_s` are ignored. Chunk
+    counts must match exactly, since a change there is a behaviour change.
+    """
+
+    base_results: dict[str, dict] = baseline.get("results", {})
+    base_cal = float(baseline.get("meta", {}).get("calibration_s") or calibration_s)
+    speed = max(1.0, calibration_s / base_cal) if base_cal else 1.0
+    problems: list[str] = []
+    for r in results:
+        base = base_results.get(r.key)
+        if base is None:
+            continue
+        if base["bytes"] != r.bytes:
+            problems.append(f"{r.key}: corpus changed ({base['bytes']} -> {r.bytes} bytes); refresh the baseline")
+            continue
+        if base["chunks"] != r.chunks:
+            problems.append(f"{r.key}: chunk count {base['chunks']} -> {r.chunks}")
+        allowed = max(base["seconds"] * speed * (1 + max_slowdown), base["seconds"] + min_delta_s)
+        if r.seconds > allowed:
+            problems.append(
+                f"{r.key}: {r.seconds * 1e3:.1f}ms > {allowed * 1e3:.1f}ms "
+                f"(baseline {base['seconds'] * 1e3:.1f}ms x{speed:.2f} machine speed)"
+            )
+        if r.peak_bytes > base["peak_bytes"] * (1 + max_memory_growth):
+            problems.append(f"{r.key}: peak memory {base['peak_bytes']} -> {r.peak_bytes} bytes")
+    return problems
+
+
+def format_table(results: list[Result]) -> str:
+    header = (
+        f"{'corpus/mode':32s} {'files':>5s} {'MB':>7s} {'chunks':>7s} {'ms':>9s} "
+        f"{'chunks/s':>10s} {'MB/s':>7s} {'parse ms':>9s} {'py ms':>9s} {'peakMB':>7s}"
+    )
+    rows = [header, "-" * len(header)]
+    for r in results:
+        rows.append(
+            f"{r.key:32s} {r.files:5d} {r.bytes / 1e6:7.2f} {r.chunks:7d} {r.seconds * 1e3:9.1f} "
+            f"{r.chunks_per_s:10.0f} {r.mb_per_s:7.2f} {r.parse_seconds * 1e3:9.1f} "
+            f"{r.python_seconds * 1e3:9.1f} {r.peak_bytes / 1e6:7.1f}"
+        )
+    return "\n".join(rows)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", action="append", choices=MODES, help="limit to these modes (repeatable)")
+    parser.add_argument("--corpus", action="append", choices=["project", *SYNTHETIC], help="limit to these corpora")
+    parser.add_argument("--scale", type=float, default=1.0, help="size factor for the synthetic corpora")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per measurement (best is kept)")
+    parser.add_argument("--chunk-size", type=int, default=2500)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    parser.add_argument("--compare", action="store_true", help="compare with --baseline; exit 1 on regression")
+    parser.add_argument("--max-slowdown", type=float, default=0.5, help="allowed time growth after calibration")
+    parser.add_argument("--max-memory-growth", type=float, default=0.25, help="allowed traced peak memory growth")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    before = calibrate()
+    results = run(
+        modes=args.mode or MODES,
+        corpora=args.corpus,
+        scale=args.scale,
+        repeat=args.repeat,
+        chunk_size=args.chunk_size,
+    )
+    # CPU clocks drift during a run; the slower reading avoids false alarms.
+    calibration_s = max(before, calibrate())
+    print(format_table(results))
+    payload = to_payload(results, calibration_s=calibration_s, scale=args.scale)
+    if args.json is not None:
+        args.json.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"baseline written to {os.path.relpath(args.baseline)}")
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if float(baseline.get("meta", {}).get("scale", 1.0)) != args.scale:
+            print("baseline was recorded at another --scale; nothing to compare")
+            return 1
+        problems = compare(
+            results,
+            baseline,
+            calibration_s=calibration_s,
+            max_slowdown=args.max_slowdown,
+            max_memory_growth=args.max_memory_growth,
+        )
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            return 1
+        print("no regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
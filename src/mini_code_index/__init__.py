@@ -1,9 +1,21 @@
 __all__ = [
 	"chunking",
+	"chunk_pool",
 	"db",
 	"embedding",
+	"embedding_cache",
+	"git_changes",
+	"ignore",
 	"indexing",
+	"local_embedding",
+	"manifest",
+	"pathfilter",
+	"pipeline",
+	"ratelimit",
+	"tokenizer",
+	"tree_cache",
 	"vectorise",
+	"watch",
 	"query",
 	"cli",
 ]
@@ -0,0 +1,59 @@
+"""Process-pool chunking backend.
+
+Tree-sitter parsing and the chunk generators in `TreeSitterChunker` are
+CPU-bound Python that holds the GIL, so chunking in threads barely scales.
+`ProcessChunkPool` runs `TreeSitterChunker.chunk` in worker processes instead.
+
+Each worker keeps one chunker per chunk config (`shared_chunker`) and its
+parsers, so they stay warm across files. Chunks travel back in the compact
+form from `pack_chunks`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from .chunking import Chunk, Config as ChunkConfig, PackedChunks, pack_chunks, shared_chunker, unpack_chunks
+
+
+def _chunk_file_in_worker(
+    file_path: str, chunk_cfg: ChunkConfig, sha256: Optional[str] = None
+) -> PackedChunks:
+    return pack_chunks(list(shared_chunker(chunk_cfg).chunk(file_path, sha256=sha256)))
+
+
+class ProcessChunkPool:
+    """Chunk files in a pool of worker processes.
+
+    Workers are started with the "spawn" method: the indexer runs an event
+    loop and helper threads, which do not survive a `fork()` safely.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    async def chunk(
+        self, file_path: str, chunk_cfg: ChunkConfig, *, sha256: Optional[str] = None
+    ) -> list[Chunk]:
+        loop = asyncio.get_running_loop()
+        packed = await loop.run_in_executor(
+            self._executor, _chunk_file_in_worker, file_path, chunk_cfg, sha256
+        )
+        return unpack_chunks(packed)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "ProcessChunkPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -1,18 +1,21 @@
 import hashlib
+import json
 import logging
 import os
 import re
+import threading
 from bisect import bisect_left, bisect_right
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, fields
 import uuid
 from enum import Enum
-from functools import cache
+from functools import lru_cache
 from io import TextIOWrapper
-from typing import Generator, Optional, Protocol
+from typing import Any, Callable, Generator, Iterable, Iterator, NamedTuple, Optional, Pattern, Protocol, Sequence
 
 from pygments.lexer import Lexer
-from pygments.lexers import get_lexer_for_filename
-from pygments.util import ClassNotFound
+from pygments.lexers import find_lexer_class, get_all_lexers
+
+from .tree_cache import PointShifter, Segment, TreeCache, TreeEntry, clone, compute_edit
 
 try:  # tree-sitter is optional at runtime for learning/debugging
     from tree_sitter import Node, Point  # type: ignore
@@ -22,8 +25,7 @@ try:  # tree-sitter is optional at runtime for learning/debugging
 except Exception:  # pragma: nocover
     Node = object  # type: ignore
 
-    @dataclass(frozen=True)
-    class Point:  # type: ignore
+    class Point(NamedTuple):  # type: ignore[no-redef]
         row: int
         column: int
 
@@ -67,8 +69,37 @@ class ScopeKind(str, Enum):
     FUNCTION = "function"
 
 
-@dataclass
+def _slotted(cls: type) -> type:
+    """Rebuild a dataclass with `__slots__` (`dataclass(slots=True)` needs 3.10).
+
+    Chunks and scopes exist by the hundred thousand during a large index
+    run; slots drop the per-instance `__dict__`.
+    """
+
+    names = tuple(f.name for f in fields(cls))
+    ns = {k: v for k, v in cls.__dict__.items() if k not in names and k not in ("__dict__", "__weakref__")}
+    ns["__slots__"] = names
+    if cls.__dataclass_params__.frozen:  # type: ignore[attr-defined]
+        # The default slot state restore goes through the frozen __setattr__.
+        def __getstate__(self):
+            return tuple(getattr(self, n) for n in names)
+
+        def __setstate__(self, state):
+            for n, v in zip(names, state):
+                object.__setattr__(self, n, v)
+
+        ns["__getstate__"] = __getstate__
+        ns["__setstate__"] = __setstate__
+    new_cls = type(cls)(cls.__name__, cls.__bases__, ns)
+    new_cls.__qualname__ = cls.__qualname__
+    return new_cls
+
+
+@_slotted
+@dataclass(frozen=True)
 class Scope:
+    """One named scope (file, type or function). Immutable, so chunks share it."""
+
     kind: ScopeKind
     name: str
     # Original tree-sitter node.type that produced this scope (debugging/extension aid).
@@ -80,6 +111,7 @@ class Scope:
     end: "Point | None" = None
 
 
+@_slotted
 @dataclass
 class Chunk:
     """
@@ -88,6 +120,9 @@ class Chunk:
     Conventions (matching VectorCode):
     - rows are 1-indexed
     - columns are 0-indexed
+
+    Chunks emitted by `TreeSitterChunker` hold interned scope tuples from the
+    file's `ScopeTable`, shared by every chunk with the same path.
     """
 
     text: str
@@ -108,12 +143,160 @@ class Chunk:
     group_index: Optional[int] = None
 
     # Full scope path from outermost -> innermost.
-    scope_path: list[Scope] = field(default_factory=list)
+    scope_path: Sequence[Scope] = ()
 
     # If a chunk contains multiple inner scopes (e.g. class A method m + method n
     # when mode="type"), keep scope_path truncated to the configured
     # scope prefix and record the distinct inner scopes here.
-    contained_scopes: list[Scope] = field(default_factory=list)
+    contained_scopes: Sequence[Scope] = ()
+
+
+class ScopeTable:
+    """The interned scopes of one file.
+
+    Equal scopes become one shared instance and equal scope paths one shared
+    tuple, so chunks only hold references. `ids()` is the index form used to
+    ship chunks between processes.
+    """
+
+    __slots__ = ("scopes", "_index", "_paths")
+
+    def __init__(self) -> None:
+        self.scopes: list[Scope] = []
+        self._index: dict[Scope, int] = {}
+        self._paths: dict[tuple[Scope, ...], tuple[Scope, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.scopes)
+
+    def index(self, scope: Scope) -> int:
+        idx = self._index.get(scope)
+        if idx is None:
+            idx = self._index[scope] = len(self.scopes)
+            self.scopes.append(scope)
+        return idx
+
+    def intern(self, scope: Scope) -> Scope:
+        return self.scopes[self.index(scope)]
+
+    def path(self, scopes: Iterable[Scope]) -> tuple[Scope, ...]:
+        key = tuple(scopes)
+        shared = self._paths.get(key)
+        if shared is None:
+            shared = self._paths[key] = tuple(self.intern(s) for s in key)
+        return shared
+
+    def ids(self, scopes: Iterable[Scope]) -> tuple[int, ...]:
+        return tuple(self.index(s) for s in scopes)
+
+
+# Compact, picklable chunk form used to ship chunks between processes.
+# Scopes are shared by many chunks, so they are interned into a table and
+# chunks refer to them by index. Points are plain (row, column) tuples.
+PackedScope = tuple
+PackedChunk = tuple
+PackedChunks = tuple[list[PackedScope], list[PackedChunk]]
+
+
+def _pack_point(p: "Point | None") -> Optional[tuple[int, int]]:
+    return None if p is None else (int(p.row), int(p.column))
+
+
+def _unpack_point(p: Optional[tuple[int, int]]) -> "Point | None":
+    return None if p is None else Point(p[0], p[1])  # type: ignore[call-arg]
+
+
+def pack_chunks(chunks: list[Chunk]) -> PackedChunks:
+    table = ScopeTable()
+    rows: list[PackedChunk] = []
+    for c in chunks:
+        rows.append(
+            (
+                c.text,
+                _pack_point(c.start),
+                _pack_point(c.end),
+                c.path,
+                c.sha256,
+                c.language,
+                c.mode,
+                _pack_point(c.scope_start),
+                _pack_point(c.scope_end),
+                c.group_id,
+                c.group_index,
+                table.ids(c.scope_path),
+                table.ids(c.contained_scopes),
+            )
+        )
+    scopes: list[PackedScope] = [
+        (
+            getattr(scope.kind, "value", str(scope.kind)),
+            scope.name,
+            scope.raw_type,
+            scope.rel_path,
+            _pack_point(scope.start),
+            _pack_point(scope.end),
+        )
+        for scope in table.scopes
+    ]
+    return scopes, rows
+
+
+def unpack_chunks(packed: PackedChunks) -> list[Chunk]:
+    packed_scopes, rows = packed
+    # Rebuilt scopes are shared between chunks, just like the originals.
+    scopes = [
+        Scope(
+            kind=ScopeKind(kind),
+            name=name,
+            raw_type=raw_type,
+            rel_path=rel_path,
+            start=_unpack_point(start),
+            end=_unpack_point(end),
+        )
+        for kind, name, raw_type, rel_path, start, end in packed_scopes
+    ]
+    paths: dict[tuple[int, ...], tuple[Scope, ...]] = {}
+
+    def _path(ids: tuple[int, ...]) -> tuple[Scope, ...]:
+        shared = paths.get(ids)
+        if shared is None:
+            shared = paths[ids] = tuple(scopes[i] for i in ids)
+        return shared
+
+    chunks: list[Chunk] = []
+    for (
+        text,
+        start,
+        end,
+        path,
+        sha256,
+        language,
+        mode,
+        scope_start,
+        scope_end,
+        group_id,
+        group_index,
+        scope_path,
+        contained_scopes,
+    ) in rows:
+        chunks.append(
+            Chunk(
+                text=text,
+                start=_unpack_point(start),
+                end=_unpack_point(end),
+                path=path,
+                sha256=sha256,
+                language=language,
+                mode=mode,
+                scope_start=_unpack_point(scope_start),
+                scope_end=_unpack_point(scope_end),
+                group_id=group_id,
+                group_index=group_index,
+                scope_path=_path(scope_path),
+                contained_scopes=_path(contained_scopes),
+            )
+        )
+    return chunks
 
 
 def format_scope(scope: Scope) -> str:
@@ -168,6 +351,11 @@ def print_chunks(title: str, chunks: list[Chunk], *, include_text: bool = True)
         print(format_chunk(c, i, include_text=include_text))
 
 
+# Config options added after fingerprints were first stored, with the
+# default that reproduces the earlier behaviour.
+_LATER_OPTION_DEFAULTS: dict[str, Any] = {"fallback_line_snap": False}
+
+
 @dataclass
 class Config:
     chunk_size: int = 2500
@@ -184,6 +372,9 @@ class Config:
     # - "function": function/method as primary unit (but small types are emitted whole)
     # - "auto_ast": legacy "AST window packing" (best-effort structural chunks)
     mode: Optional[str] = None # "file", "type", "function", "auto_ast"
+    # Fallback (non-parseable text) windows end at the last line break they
+    # contain and start on a line, when there is one.
+    fallback_line_snap: bool = False
 
     def __post_init__(self) -> None:
         if self.chunk_filters is None:
@@ -207,6 +398,18 @@ class Config:
         if not (0 <= self.overlap_ratio < 1):
             raise ValueError("overlap_ratio must be in [0, 1).")
 
+    def fingerprint(self) -> str:
+        """Stable hash of every option that affects chunk output."""
+
+        options = asdict(self)
+        # Options added later are left out at their defaults, so existing
+        # fingerprints (and manifests keyed by them) stay valid.
+        for name, default in _LATER_OPTION_DEFAULTS.items():
+            if options.get(name) == default:
+                del options[name]
+        payload = json.dumps(options, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
 
 class Chunker(Protocol):
     def chunk(self, data: str) -> Generator[Chunk, None, None]: ...
@@ -285,13 +488,419 @@ class StringChunker:
             i += step_size
 
 
+# Line breaks other than "\n" / "\r\n" that `str.splitlines` also honours.
+_OTHER_LINE_BREAKS = ("\x0b", "\x0c", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029")
+
+
+def _has_other_line_breaks(data: str) -> bool:
+    # Single-character `in` checks are memchr-fast, unlike a regex class.
+    breaks = _OTHER_LINE_BREAKS[:5] if data.isascii() else _OTHER_LINE_BREAKS
+    if "\r" in data and data.count("\r") != data.count("\r\n"):
+        return True
+    return any(ch in data for ch in breaks)
+
+
+class RollingStringChunker:
+    """Fallback chunker with the same windows as `StringChunker`, computed
+    in one forward pass.
+
+    Row/column cursors only move forward, so no line table is built and no
+    per-chunk bisect is needed. With `Config.fallback_line_snap`, windows
+    end after the last line break they contain and the next window starts at
+    a line start, when the window has one.
+    """
+
+    def __init__(self, config: Optional[Config] = None) -> None:
+        self.config = config or Config()
+        self._legacy = StringChunker(self.config)
+
+    def chunk(self, data: str, *, start_pos: "Point | None" = None):
+        if start_pos is None:
+            start_pos = Point(row=1, column=0)  # type: ignore
+
+        size = self.config.chunk_size
+        snap = self.config.fallback_line_snap
+        if size < 0 or (not snap and _has_other_line_breaks(data)):
+            # Exotic line breaks shift `StringChunker`'s rows; keep its output.
+            yield from self._legacy.chunk(data, start_pos=start_pos)
+            return
+
+        mode = self.config.mode
+        row0, col0 = start_pos.row, start_pos.column
+        step = max(1, int(size * (1 - self.config.overlap_ratio)))
+        n = len(data)
+        # Row cursors for window starts and ends: offset scanned up to, line
+        # breaks before it and the start of its line.
+        s_pos = s_lines = s_line_start = 0
+        e_pos = e_lines = e_line_start = 0
+        i = 0
+        while i < n:
+            j = i + size
+            if j >= n:
+                j = n
+            elif snap:
+                cut = data.rfind("\n", i, j)
+                if cut >= 0:
+                    j = cut + 1
+
+            k = data.count("\n", s_pos, i)
+            if k:
+                s_lines += k
+                s_line_start = data.rfind("\n", s_pos, i) + 1
+            s_pos = i
+            if s_lines:
+                start = Point(row0 + s_lines, i - s_line_start)  # type: ignore
+            else:
+                start = Point(row0, col0 + i)  # type: ignore
+
+            k = data.count("\n", e_pos, j)
+            if k:
+                e_lines += k
+                e_line_start = data.rfind("\n", e_pos, j) + 1
+            e_pos = j
+            # End convention of `StringChunker`: a window ending right after a
+            # line break ends at column -1 of the next row, and so does one
+            # ending with an unterminated last line.
+            if data[j - 1] == "\n" or j == n:
+                end_lines, end_col = (e_lines if data[j - 1] == "\n" else e_lines + 1), -1
+            else:
+                end_lines, end_col = e_lines, j - e_line_start - 1
+            if end_lines:
+                end = Point(row0 + end_lines, end_col)  # type: ignore
+            else:
+                end = Point(row0, col0 + end_col)  # type: ignore
+
+            yield Chunk(text=data[i:j], start=start, end=end, mode=mode)
+
+            if j >= n:
+                break
+            nxt = i + step
+            if snap:
+                cut = data.rfind("\n", i, min(nxt, j))
+                nxt = cut + 1 if cut >= i else min(nxt, j)
+            i = nxt
+
+
+# ---------------------------------------------------------------------------
+# Process-wide parser / language resolution caches
+#
+# Tree-sitter parsers are not thread-safe, so each thread keeps its own parser
+# per language; they outlive any chunker, so a fresh `TreeSitterChunker` (or a
+# thread-pool thread picking up the next file) starts warm. Language
+# resolution (filetype_map regexes, pygments filename lookup) is memoized per
+# extension / file name.
+# ---------------------------------------------------------------------------
+
+_THREAD_PARSERS = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _language_supported(language: str) -> bool:
+    if not _HAS_TREESITTER:
+        return False
+    try:
+        get_parser(language)  # type: ignore[arg-type]
+    except LookupError:
+        return False
+    return True
+
+
+def pooled_parser(language: str):
+    """This thread's tree-sitter parser for `language` (LookupError if unsupported)."""
+
+    parsers: Optional[dict] = getattr(_THREAD_PARSERS, "parsers", None)
+    if parsers is None:
+        parsers = _THREAD_PARSERS.parsers = {}
+    parser = parsers.get(language)
+    if parser is None:
+        if not _language_supported(language):
+            raise LookupError(f"no tree-sitter parser for {language!r}")
+        parser = parsers[language] = get_parser(language)  # type: ignore[arg-type]
+    return parser
+
+
+FiletypeRules = tuple[tuple[str, Pattern[str]], ...]
+
+
+@lru_cache(maxsize=64)
+def _compile_filetype_map(items: tuple[tuple[str, tuple[str, ...]], ...]) -> FiletypeRules:
+    return tuple(
+        (language.lower(), re.compile("|".join(f"(?:{p})" for p in patterns)))
+        for language, patterns in items
+        if patterns
+    )
+
+
+def compile_filetype_map(filetype_map: Optional[dict[str, list[str]]]) -> FiletypeRules:
+    if not filetype_map:
+        return ()
+    return _compile_filetype_map(tuple((k, tuple(v)) for k, v in filetype_map.items()))
+
+
+@lru_cache(maxsize=4096)
+def _language_for_extension(rules: FiletypeRules, ext: str) -> Optional[str]:
+    for language, rx in rules:
+        if rx.search(ext):
+            return language
+    return None
+
+
+_PYGMENTS_INDEX_LOCK = threading.Lock()
+# (lexer name by "*.ext" suffix, other (name, pattern, regex) triples)
+_PYGMENTS_INDEX: Optional[tuple[dict[str, list[tuple[str, str]]], list[tuple[str, str, Pattern[str]]]]] = None
+
+
+def _pygments_index():
+    global _PYGMENTS_INDEX
+    with _PYGMENTS_INDEX_LOCK:
+        if _PYGMENTS_INDEX is None:
+            import fnmatch
+
+            by_suffix: dict[str, list[tuple[str, str]]] = {}
+            other: list[tuple[str, str, Pattern[str]]] = []
+            for name, _aliases, filenames, _mimetypes in get_all_lexers(plugins=True):
+                for pattern in filenames:
+                    rest = pattern[2:]
+                    if pattern.startswith("*.") and not any(c in rest for c in "*?["):
+                        by_suffix.setdefault(rest, []).append((name, pattern))
+                    else:
+                        other.append((name, pattern, re.compile(fnmatch.translate(pattern))))
+            _PYGMENTS_INDEX = (by_suffix, other)
+        return _PYGMENTS_INDEX
+
+
+@lru_cache(maxsize=4096)
+def _lexer_candidates(basename: str) -> tuple[tuple[str, str], ...]:
+    """(lexer name, filename pattern) pairs whose pattern matches `basename`."""
+
+    by_suffix, other = _pygments_index()
+    found: list[tuple[str, str]] = []
+    idx = basename.find(".")
+    while idx != -1:
+        found.extend(by_suffix.get(basename[idx + 1 :], ()))
+        idx = basename.find(".", idx + 1)
+    found.extend((name, pattern) for name, pattern, rx in other if rx.match(basename))
+    return tuple(found)
+
+
+def guess_lexer_class(path: str, content: str) -> Optional[type[Lexer]]:
+    """Same choice as `pygments.lexers.find_lexer_class_for_filename(path, content)`.
+
+    Candidates are memoized per file name; `analyse_text` only runs when
+    several lexers claim the name.
+    """
+
+    candidates = _lexer_candidates(os.path.basename(path))
+    if not candidates:
+        return None
+    classes = [(find_lexer_class(name), pattern) for name, pattern in candidates]
+    classes = [(cls, pattern) for cls, pattern in classes if cls is not None]
+    if not classes:
+        return None
+    if len(classes) == 1:
+        return classes[0][0]
+
+    def _rating(item):
+        cls, pattern = item
+        # Explicit file names get a bonus, as in pygments.
+        bonus = 0.5 if "*" not in pattern else 0
+        if content:
+            return cls.analyse_text(content) + bonus, cls.__name__
+        return cls.priority + bonus, cls.__name__
+
+    return max(classes, key=_rating)[0]
+
+
+# ---------------------------------------------------------------------------
+# AST traversal
+#
+# Walks are iterative (a TreeCursor, or an explicit stack of suspended
+# frames in the chunkers), so deeply nested input (JSON, minified bundles,
+# generated parsers) is bounded by memory rather than the recursion limit.
+# Whether a node type can open a scope at all is decided once per
+# (language, type); only candidates pay for the name lookup.
+# ---------------------------------------------------------------------------
+
+_PYTHON_FUNCTION_TYPES = frozenset({"function_definition", "async_function_definition"})
+_JAVA_TYPE_TYPES = frozenset({"class_declaration", "interface_declaration", "enum_declaration", "record_declaration"})
+_JAVA_FUNCTION_TYPES = frozenset({"method_declaration", "constructor_declaration"})
+_SCOPE_TYPE_MARKERS = ("class", "interface", "enum", "record", "struct", "trait", "protocol")
+_SCOPE_FUNC_MARKERS = ("function", "method", "constructor")
+_NAME_NODE_TYPES = frozenset({"identifier", "type_identifier", "property_identifier"})
+
+
+@lru_cache(maxsize=8192)
+def _scope_kind_for(language: str, node_type: str) -> Optional[ScopeKind]:
+    """The scope kind a `node_type` node opens in `language`, if it is named."""
+
+    language = language.lower()
+    if language == "python":
+        if node_type == "class_definition":
+            return ScopeKind.TYPE
+        if node_type in _PYTHON_FUNCTION_TYPES:
+            return ScopeKind.FUNCTION
+    if language == "java":
+        if node_type in _JAVA_TYPE_TYPES:
+            return ScopeKind.TYPE
+        if node_type in _JAVA_FUNCTION_TYPES:
+            return ScopeKind.FUNCTION
+
+    # Generic fallback for other languages: conservative heuristics based on node.type names.
+    # This intentionally only covers common declaration nodes to avoid false positives.
+    tl = node_type.lower()
+    is_type = any(m in tl for m in _SCOPE_TYPE_MARKERS) and (
+        "declaration" in tl or "definition" in tl or "specifier" in tl or tl in _SCOPE_TYPE_MARKERS
+    )
+    if is_type:
+        return ScopeKind.TYPE
+    is_func = any(m in tl for m in _SCOPE_FUNC_MARKERS) and (
+        "declaration" in tl or "definition" in tl or "item" in tl or tl in _SCOPE_FUNC_MARKERS
+    )
+    if is_func:
+        return ScopeKind.FUNCTION
+    return None
+
+
+def _node_text(node: Optional["Node"], text_bytes: bytes) -> Optional[str]:
+    if node is None:
+        return None
+    try:
+        return text_bytes[node.start_byte : node.end_byte].decode()
+    except Exception:
+        return None
+
+
+def _node_name(node: "Node", text_bytes: bytes) -> Optional[str]:
+    name = _node_text(node.child_by_field_name("name"), text_bytes)
+    if name:
+        return name
+    # Best-effort: many grammars use 'identifier' / 'type_identifier' / 'name' tokens.
+    for ch in node.children:
+        if ch.type in _NAME_NODE_TYPES:
+            return _node_text(ch, text_bytes)
+    return None
+
+
+def walk_preorder(node: "Node") -> Generator["Node", None, None]:
+    """Every node of the subtree rooted at `node`, in pre-order."""
+
+    cursor = node.walk()
+    while True:
+        yield cursor.node
+        if cursor.goto_first_child():
+            continue
+        # The cursor can't leave the subtree it was created for, so running
+        # out of parents means the walk is done.
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return
+
+
+class _ScopeIndex:
+    """All scope nodes of a tree in pre-order, for subtree lookups.
+
+    Pre-order start bytes never decrease, so the scopes below a node are a
+    contiguous run found by bisection instead of another walk of the subtree.
+    """
+
+    __slots__ = ("entries", "_starts")
+
+    def __init__(self, entries: list[tuple["Node", Scope]]) -> None:
+        self.entries = entries
+        self._starts = [n.start_byte for n, _ in entries]
+
+    def within(self, node: "Node") -> list[Scope]:
+        """Scopes of `node` and its descendants, in pre-order."""
+
+        start, end = node.start_byte, node.end_byte
+        out: list[Scope] = []
+        entries = self.entries
+        for i in range(bisect_left(self._starts, start), len(entries)):
+            n, sc = entries[i]
+            if n.start_byte >= end:
+                break
+            if n.end_byte > end:
+                continue
+            if n.start_byte == start and n.end_byte == end and not _is_self_or_ancestor(node, n):
+                # Same range but above `node` (a wrapper around it).
+                continue
+            out.append(sc)
+        return out
+
+
+class IntervalIndex:
+    """Static set of closed intervals answering overlap queries in O(log n + k).
+
+    Intervals are sorted by start over an implicit segment tree holding the
+    largest end of each subtree. A query only looks at intervals starting at
+    or before the window's end and skips every subtree whose intervals all
+    end before the window starts.
+    """
+
+    __slots__ = ("_order", "_starts", "_max_end", "_size")
+
+    def __init__(self, intervals: list[tuple[tuple[int, int], tuple[int, int]]]) -> None:
+        # Sorting is stable: equal starts keep their original order.
+        self._order = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+        self._starts = [intervals[i][0] for i in self._order]
+        size = 1
+        while size < len(intervals):
+            size *= 2
+        self._size = size
+        max_end: list[tuple[int, int]] = [_NO_END] * (2 * size)
+        for pos, i in enumerate(self._order):
+            max_end[size + pos] = intervals[i][1]
+        for node in range(size - 1, 0, -1):
+            max_end[node] = max(max_end[2 * node], max_end[2 * node + 1])
+        self._max_end = max_end
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def overlapping(self, lo: tuple[int, int], hi: tuple[int, int]) -> list[int]:
+        """Positions (in the input list, ascending) of intervals meeting [lo, hi]."""
+
+        limit = bisect_right(self._starts, hi)
+        if limit == 0:
+            return []
+        max_end = self._max_end
+        found: list[int] = []
+        stack = [(1, 0, self._size)]
+        while stack:
+            node, left, right = stack.pop()
+            if left >= limit or max_end[node] < lo:
+                continue
+            if right - left == 1:
+                found.append(self._order[left])
+                continue
+            mid = (left + right) // 2
+            stack.append((2 * node + 1, mid, right))
+            stack.append((2 * node, left, mid))
+        found.sort()
+        return found
+
+
+# Sorts before any real (row, column) point.
+_NO_END = (-1, -1)
+
+
+def _is_self_or_ancestor(node: "Node", of: "Node") -> bool:
+    rng = (of.start_byte, of.end_byte)
+    n: Optional["Node"] = of
+    while n is not None and (n.start_byte, n.end_byte) == rng:
+        if n == node:
+            return True
+        n = n.parent
+    return False
+
+
 class TreeSitterChunker:
     """
     Minimal Tree-sitter chunker (learning-first):
     - input is a file path
     - try select parser by config.filetype_map or pygments guess
     - chunk by concatenating AST children until chunk_size
-    - fallback to StringChunker when no parser is available
+    - fallback to RollingStringChunker when no parser is available
 
     Notes:
     - start/end rows follow the same convention as VectorCode (1-indexed rows).
@@ -300,10 +909,20 @@ class TreeSitterChunker:
 
     def __init__(self, config: Optional[Config] = None) -> None:
         self.config = config or Config()
-        self._fallback = StringChunker(self.config)
-
-    def _load_file(self, path: str) -> tuple[str, bytes]:
-        raw = open(path, "rb").read()
+        self._fallback = RollingStringChunker(self.config)
+        self._filetype_rules = compile_filetype_map(self.config.filetype_map)
+        # language -> combined chunk_filters pattern ("" when none).
+        self._filter_patterns: dict[Optional[str], str] = {}
+
+    def _parser_for(self, language: str):
+        return pooled_parser(language)
+
+    def _load_file(self, path: str, data: Optional[bytes] = None) -> tuple[str, bytes]:
+        if data is None:
+            with open(path, "rb") as f:
+                raw = f.read()
+        else:
+            raw = data
         if self.config.encoding == "_auto":
             from charset_normalizer import from_bytes
 
@@ -492,107 +1111,35 @@ class TreeSitterChunker:
     ) -> Optional[Scope]:
         if language is None or not _HAS_TREESITTER:
             return None
-        lang = language.lower()
-        t = getattr(node, "type", None)
-
-        def _decode(n: Optional["Node"]) -> Optional[str]:
-            if n is None:
-                return None
-            try:
-                return text_bytes[n.start_byte : n.end_byte].decode()
-            except Exception:
-                return None
-
-        def _scope_range(n: "Node") -> tuple["Point | None", "Point | None"]:
-            try:
-                sp = n.start_point
-                ep = n.end_point
-                return (
-                    Point(row=sp.row + 1, column=sp.column),  # type: ignore
-                    Point(row=ep.row + 1, column=ep.column),  # type: ignore
-                )
-            except Exception:
-                return None, None
-
-        def _name_from_field() -> Optional[str]:
-            name_node = node.child_by_field_name("name")  # type: ignore[attr-defined]
-            if name_node is None:
-                return None
-            return _decode(name_node)
-
-        def _name_from_first_identifier() -> Optional[str]:
-            # Best-effort: many grammars use 'identifier' / 'type_identifier' / 'name' tokens.
-            for ch in getattr(node, "children", []):
-                if getattr(ch, "type", None) in {"identifier", "type_identifier", "property_identifier"}:
-                    return _decode(ch)
+        kind = _scope_kind_for(language, node.type)
+        if kind is None:
             return None
+        name = _node_name(node, text_bytes)
+        if not name:
+            return None
+        sp = node.start_point
+        ep = node.end_point
+        return Scope(
+            kind=kind,
+            name=name,
+            raw_type=node.type,
+            start=Point(row=sp.row + 1, column=sp.column),  # type: ignore
+            end=Point(row=ep.row + 1, column=ep.column),  # type: ignore
+        )
 
-        def _get_name() -> Optional[str]:
-            return _name_from_field() or _name_from_first_identifier()
-
-        if lang == "python":
-            if t == "class_definition":
-                n = _get_name()
-                if not n:
-                    return None
-                s, e = _scope_range(node)
-                return Scope(kind=ScopeKind.TYPE, name=n, raw_type=str(t), start=s, end=e)
-            if t in {"function_definition", "async_function_definition"}:
-                n = _get_name()
-                if not n:
-                    return None
-                # Methods are also functions for our mode="function" purposes.
-                s, e = _scope_range(node)
-                return Scope(kind=ScopeKind.FUNCTION, name=n, raw_type=str(t), start=s, end=e)
-
-        if lang == "java":
-            if t in {
-                "class_declaration",
-                "interface_declaration",
-                "enum_declaration",
-                "record_declaration",
-            }:
-                n = _get_name()
-                if not n:
-                    return None
-                s, e = _scope_range(node)
-                return Scope(kind=ScopeKind.TYPE, name=n, raw_type=str(t), start=s, end=e)
-            if t in {"method_declaration", "constructor_declaration"}:
-                n = _get_name()
-                if not n:
-                    return None
-                s, e = _scope_range(node)
-                return Scope(kind=ScopeKind.FUNCTION, name=n, raw_type=str(t), start=s, end=e)
-
-        # Generic fallback for other languages: conservative heuristics based on node.type names.
-        # This intentionally only covers common declaration nodes to avoid false positives.
-        if isinstance(t, str):
-            tl = t.lower()
-
-            type_markers = ("class", "interface", "enum", "record", "struct", "trait", "protocol")
-            func_markers = ("function", "method", "constructor")
-
-            is_type = any(m in tl for m in type_markers) and (
-                "declaration" in tl or "definition" in tl or "specifier" in tl or tl in type_markers
-            )
-            is_func = any(m in tl for m in func_markers) and (
-                "declaration" in tl or "definition" in tl or "item" in tl or tl in func_markers
-            )
-
-            if is_type:
-                n = _get_name()
-                if not n:
-                    return None
-                s, e = _scope_range(node)
-                return Scope(kind=ScopeKind.TYPE, name=n, raw_type=t, start=s, end=e)
-            if is_func:
-                n = _get_name()
-                if not n:
-                    return None
-                s, e = _scope_range(node)
-                return Scope(kind=ScopeKind.FUNCTION, name=n, raw_type=t, start=s, end=e)
+    def _iter_scopes(
+        self, node: "Node", *, language: Optional[str], text_bytes: bytes
+    ) -> Generator[tuple["Node", Scope], None, None]:
+        """(node, scope) for every scope node in the subtree of `node`, in pre-order."""
 
-        return None
+        if language is None or not _HAS_TREESITTER:
+            return
+        for n in walk_preorder(node):
+            if _scope_kind_for(language, n.type) is None:
+                continue
+            sc = self._scope_of_node(n, language=language, text_bytes=text_bytes, scope_stack=[])
+            if sc is not None:
+                yield n, sc
 
     def _boundary_prefix(self, scope_path: list[Scope]) -> list[Scope]:
         """Return the scope prefix up to the configured mode.
@@ -632,40 +1179,35 @@ class TreeSitterChunker:
             return []
         return [full_scope_path[len(boundary_prefix)]]
 
-    @cache
-    def _guess_lexer(self, path: str, content: str) -> Optional[Lexer]:
-        try:
-            return get_lexer_for_filename(path, content)
-        except ClassNotFound:
-            return None
+    def _guess_lexer(self, path: str, content: str) -> Optional[type[Lexer]]:
+        return guess_lexer_class(path, content)
 
-    @cache
     def _build_filter_pattern(self, language: Optional[str]) -> str:
+        cached = self._filter_patterns.get(language)
+        if cached is not None:
+            return cached
         patterns: list[str] = []
         if language and language in self.config.chunk_filters:
             patterns.extend(self.config.chunk_filters[language])
         else:
             patterns.extend(self.config.chunk_filters.get("*", []))
-        if not patterns:
-            return ""
-        patterns = [f"(?:{p})" for p in patterns]
-        return f"(?:{'|'.join(patterns)})"
+        pattern = f"(?:{'|'.join(f'(?:{p})' for p in patterns)})" if patterns else ""
+        self._filter_patterns[language] = pattern
+        return pattern
 
     def _get_parser_from_config(self, file_path: str):
         if not _HAS_TREESITTER:
             return None, None
-        if not self.config.filetype_map:
+        if not self._filetype_rules:
             return None, None
 
         ext = os.path.splitext(file_path)[1]
         if ext.startswith("."):
             ext = ext[1:]
-        for _language, patterns in self.config.filetype_map.items():
-            language = _language.lower()
-            for pat in patterns:
-                if re.search(pat, ext):
-                    return get_parser(language), language  # type: ignore[arg-type]
-        return None, None
+        language = _language_for_extension(self._filetype_rules, ext)
+        if language is None:
+            return None, None
+        return self._parser_for(language), language
 
     def _get_parser_by_guess(self, file_path: str, content: str):
         if not _HAS_TREESITTER:
@@ -677,11 +1219,8 @@ class TreeSitterChunker:
 
         lang_names = [lexer.name, *lexer.aliases]
         for name in lang_names:
-            try:
-                parser = get_parser(name.lower())  # type: ignore[arg-type]
-                return parser, name.lower()
-            except LookupError:
-                continue
+            if _language_supported(name.lower()):
+                return self._parser_for(name.lower()), name.lower()
         return None, None
 
     def _chunk_node(
@@ -691,13 +1230,30 @@ class TreeSitterChunker:
         *,
         language: Optional[str],
         scope_stack: list[Scope],
+        children: Optional[list["Node"]] = None,
+        start_after: "Node | None" = None,
+        on_boundary: Optional[Callable[["Node"], bool]] = None,
     ) -> Generator[Chunk, None, None]:
+        """Chunk `node` by walking its children.
+
+        `children` / `start_after` resume the walk at a later child of `node`
+        (`start_after` being the child before it). `on_boundary(child)` is
+        called whenever the walk state is clean after `child`: nothing is
+        buffered, so output up to here doesn't depend on later siblings.
+        Returning True stops the walk there. Used by the tree cache to
+        re-chunk only the changed part of a file.
+
+        Descending into a child suspends the parent's walk state on an
+        explicit stack (no recursion), so nesting depth is not limited by
+        the interpreter's recursion limit.
+        """
+
         current_chunk = ""
         current_start: "Point | None" = None
         current_end: "Point | None" = None
         current_scope_path: list[Scope] = []
         current_contained: list[Scope] = []
-        prev_node: "Node | None" = None
+        prev_node: "Node | None" = start_after
         pending_prefix_text = ""
         pending_prefix_start: "Point | None" = None
         pending_prefix_end: "Point | None" = None
@@ -819,19 +1375,19 @@ class TreeSitterChunker:
             pending_prefix_start = None
             pending_prefix_end = None
 
-        # Leaf node: fallback to string chunking.
-        if len(node.children) == 0 and getattr(node, "text", None):
+        def _leaf_chunks(leaf: "Node", leaf_scope_stack: list[Scope]) -> Generator[Chunk, None, None]:
+            # Leaf node: fallback to string chunking.
             # Important: VectorCode passes node.start_point directly (potential 0/1-base mismatch).
             # For this learning wheel we normalize rows to 1-indexed.
-            sp = node.start_point  # type: ignore[attr-defined]
+            sp = leaf.start_point  # type: ignore[attr-defined]
             start_pos = Point(row=sp.row + 1, column=sp.column)  # type: ignore
-            full_scope_path = scope_stack.copy()
+            full_scope_path = leaf_scope_stack.copy()
             boundary_prefix = self._boundary_prefix(full_scope_path)
             contained_scopes: list[Scope] = []
             for s in self._inner_scopes_for_chunk(full_scope_path=full_scope_path, boundary_prefix=boundary_prefix):
                 if (s.kind, s.name) not in {(x.kind, x.name) for x in contained_scopes}:
                     contained_scopes.append(s)
-            for c in self._fallback.chunk(node.text.decode(), start_pos=start_pos):  # type: ignore[attr-defined]
+            for c in self._fallback.chunk(leaf.text.decode(), start_pos=start_pos):  # type: ignore[attr-defined]
                 scope_start, scope_end = _scope_range_from_path(boundary_prefix)
                 yield Chunk(
                     text=c.text,
@@ -842,9 +1398,94 @@ class TreeSitterChunker:
                     scope_start=scope_start,
                     scope_end=scope_end,
                 )
+
+        if node.child_count == 0 and node.text:
+            yield from _leaf_chunks(node, scope_stack)
             return
 
-        for child in node.children:
+        # Walk state of the ancestors we descended from. The saved `prev_node`
+        # is the value the parent resumes with.
+        suspended: list[tuple] = []
+
+        def _descend(into: "Node", into_scope: Optional[Scope], resume_prev: "Node | None") -> Iterator["Node"]:
+            nonlocal scope_stack, current_chunk, current_start, current_end, current_scope_path, current_contained
+            nonlocal prev_node, pending_prefix_text, pending_prefix_start, pending_prefix_end
+            suspended.append(
+                (
+                    child_iter,
+                    scope_stack,
+                    current_chunk,
+                    current_start,
+                    current_end,
+                    current_scope_path,
+                    current_contained,
+                    resume_prev,
+                    pending_prefix_text,
+                    pending_prefix_start,
+                    pending_prefix_end,
+                )
+            )
+            if into_scope is not None:
+                scope_stack = [*scope_stack, into_scope]
+            current_chunk = ""
+            current_start = None
+            current_end = None
+            current_scope_path = []
+            current_contained = []
+            prev_node = None
+            pending_prefix_text = ""
+            pending_prefix_start = None
+            pending_prefix_end = None
+            return iter(into.children)
+
+        child_iter: Iterator["Node"] = iter(node.children if children is None else children)
+        last_child: "Node | None" = None
+        while True:
+            child = next(child_iter, None)
+            if child is None:
+                # End of this node's children: flush its buffered text, then
+                # resume the parent (if any) where it left off.
+                if pending_prefix_text:
+                    _flush_pending_prefix_into_current()
+                if current_chunk:
+                    assert current_start is not None
+                    assert current_end is not None
+                    yield Chunk(
+                        text=current_chunk,
+                        start=current_start,
+                        end=current_end,
+                        scope_path=current_scope_path,
+                        contained_scopes=current_contained,
+                    )
+                if not suspended:
+                    return
+                (
+                    child_iter,
+                    scope_stack,
+                    current_chunk,
+                    current_start,
+                    current_end,
+                    current_scope_path,
+                    current_contained,
+                    prev_node,
+                    pending_prefix_text,
+                    pending_prefix_start,
+                    pending_prefix_end,
+                ) = suspended.pop()
+                continue
+
+            if not suspended:
+                if (
+                    on_boundary is not None
+                    and last_child is not None
+                    and prev_node is last_child
+                    and not current_chunk
+                    and not pending_prefix_text
+                    and on_boundary(last_child)
+                ):
+                    return
+                last_child = child
+
             child_bytes = text_bytes[child.start_byte : child.end_byte]
             child_text = child_bytes.decode()
             child_type = getattr(child, "type", None)
@@ -969,21 +1610,11 @@ class TreeSitterChunker:
 
                 # Collect inner FUNCTION scopes for contained_scopes (one-level precision is fine).
                 contained: list[Scope] = []
-
-                def _collect_functions(n: "Node", stack: list[Scope]) -> None:
-                    sc = self._scope_of_node(
-                        n, language=language, text_bytes=text_bytes, scope_stack=stack
-                    )
-                    if sc is not None:
-                        if sc.kind == ScopeKind.FUNCTION and (sc.kind, sc.name) not in {
-                            (x.kind, x.name) for x in contained
-                        }:
-                            contained.append(sc)
-                        stack = [*stack, sc]
-                    for ch in getattr(n, "children", []):
-                        _collect_functions(ch, stack)
-
-                _collect_functions(child, [*scope_stack, child_scope])
+                for _, sc in self._iter_scopes(child, language=language, text_bytes=text_bytes):
+                    if sc.kind == ScopeKind.FUNCTION and (sc.kind, sc.name) not in {
+                        (x.kind, x.name) for x in contained
+                    }:
+                        contained.append(sc)
 
                 full_scope_path = [*scope_stack, child_scope]
                 boundary_prefix = self._boundary_prefix(full_scope_path)
@@ -1082,8 +1713,10 @@ class TreeSitterChunker:
                     current_scope_path = []
                     current_contained = []
 
-                yield from self._chunk_node(child, text_bytes, language=language, scope_stack=scope_stack)
-                prev_node = child
+                child_iter = _descend(child, child_scope, child)
+                if child.child_count == 0 and child.text:
+                    yield from _leaf_chunks(child, scope_stack)
+                    child_iter = iter(())
                 continue
 
             # Recurse into structural container nodes that may contain scoped declarations
@@ -1133,8 +1766,10 @@ class TreeSitterChunker:
                         current_scope_path = []
                         current_contained = []
 
-                    yield from self._chunk_node(child, text_bytes, language=language, scope_stack=scope_stack)
-                    prev_node = child
+                    child_iter = _descend(child, child_scope, child)
+                    if child.child_count == 0 and child.text:
+                        yield from _leaf_chunks(child, scope_stack)
+                        child_iter = iter(())
                     continue
 
             if self.config.chunk_size >= 0 and len(child_text) > self.config.chunk_size:
@@ -1155,7 +1790,10 @@ class TreeSitterChunker:
                     current_contained = []
                     prev_node = None
 
-                yield from self._chunk_node(child, text_bytes, language=language, scope_stack=scope_stack)
+                child_iter = _descend(child, child_scope, prev_node)
+                if child.child_count == 0 and child.text:
+                    yield from _leaf_chunks(child, scope_stack)
+                    child_iter = iter(())
                 continue
 
             if pending_prefix_text and _is_trivia_text(pending_prefix_text):
@@ -1254,20 +1892,6 @@ class TreeSitterChunker:
                     current_contained.append(s)
             prev_node = child
 
-        if pending_prefix_text:
-            _flush_pending_prefix_into_current()
-
-        if current_chunk:
-            assert current_start is not None
-            assert current_end is not None
-            yield Chunk(
-                text=current_chunk,
-                start=current_start,
-                end=current_end,
-                scope_path=current_scope_path,
-                contained_scopes=current_contained,
-            )
-
     def _chunk_node_auto_ast(
         self,
         node: "Node",
@@ -1283,6 +1907,9 @@ class TreeSitterChunker:
         - It does NOT try to make TYPE/FUNCTION the primary unit.
         - It tries to preserve syntactic locality by concatenating adjacent AST children.
         - It still attaches scope_path (FILE container) and contained_scopes (TYPE/FUNCTION encountered).
+
+        Oversized children are descended into with an explicit stack of
+        suspended sibling iterators, not recursion.
         """
 
         # Track the current output chunk (text + span + contained scopes).
@@ -1299,7 +1926,10 @@ class TreeSitterChunker:
         if local_scope is not None:
             scope_stack = [*scope_stack, local_scope]
 
+        # Only FILE scopes are reported, and nested nodes never add one.
         file_scope_path = [s for s in scope_stack if s.kind == ScopeKind.FILE]
+        # One walk of the tree answers every "scopes below this child" query.
+        scope_index = _ScopeIndex(list(self._iter_scopes(node, language=language, text_bytes=text_bytes)))
 
         def _add_contained(scopes: list[Scope]) -> None:
             for sc in scopes:
@@ -1321,23 +1951,11 @@ class TreeSitterChunker:
                 return "\n"
             return " "
 
-        def _collect_scopes_in_subtree(n: "Node", stack: list[Scope]) -> list[Scope]:
+        def _collect_scopes_in_subtree(n: "Node") -> list[Scope]:
             found: list[Scope] = []
-
-            def _dfs(x: "Node", st: list[Scope]) -> None:
-                sc = self._scope_of_node(
-                    x, language=language, text_bytes=text_bytes, scope_stack=st
-                )
-                if sc is not None:
-                    if sc.kind in {ScopeKind.TYPE, ScopeKind.FUNCTION} and (sc.kind, sc.name) not in {
-                        (y.kind, y.name) for y in found
-                    }:
-                        found.append(sc)
-                    st = [*st, sc]
-                for ch in getattr(x, "children", []):
-                    _dfs(ch, st)
-
-            _dfs(n, stack)
+            for sc in scope_index.within(n):
+                if (sc.kind, sc.name) not in {(y.kind, y.name) for y in found}:
+                    found.append(sc)
             return found
 
         def _flush() -> Generator[Chunk, None, None]:
@@ -1358,13 +1976,12 @@ class TreeSitterChunker:
             current_end = None
             current_contained = []
 
-        # Leaf node: fall back to string chunking within this node, but still attach scopes.
-        if len(getattr(node, "children", [])) == 0 and getattr(node, "text", None):
-            sp = node.start_point
+        def _leaf_chunks(leaf: "Node") -> Generator[Chunk, None, None]:
+            # Leaf node: fall back to string chunking within this node, but still attach scopes.
+            sp = leaf.start_point
             start_pos = Point(row=sp.row + 1, column=sp.column)  # type: ignore
-            ep = node.end_point
-            base_contained = _collect_scopes_in_subtree(node, scope_stack)
-            for c in self._fallback.chunk(node.text.decode(), start_pos=start_pos):  # type: ignore[attr-defined]
+            base_contained = _collect_scopes_in_subtree(leaf)
+            for c in self._fallback.chunk(leaf.text.decode(), start_pos=start_pos):  # type: ignore[attr-defined]
                 yield Chunk(
                     text=c.text,
                     start=c.start,
@@ -1372,19 +1989,38 @@ class TreeSitterChunker:
                     scope_path=file_scope_path,
                     contained_scopes=base_contained,
                 )
+
+        if node.child_count == 0:
+            if node.text:
+                yield from _leaf_chunks(node)
             return
 
-        for child in getattr(node, "children", []):
+        # Sibling iterators of the ancestors we descended from, with the
+        # child we descended into (the parent's `prev_node` once we return).
+        suspended: list[tuple[Iterator["Node"], "Node"]] = []
+        children: Iterator["Node"] = iter(node.children)
+        while True:
+            child = next(children, None)
+            if child is None:
+                yield from _flush()
+                if not suspended:
+                    return
+                children, prev_node = suspended.pop()
+                continue
+
             child_bytes = text_bytes[child.start_byte : child.end_byte]
             child_text = child_bytes.decode()
 
-            # If a single child is too large, flush current and recurse into that child.
+            # If a single child is too large, flush current and descend into that child.
             if self.config.chunk_size >= 0 and len(child_text) > self.config.chunk_size:
                 yield from _flush()
-                yield from self._chunk_node_auto_ast(
-                    child, text_bytes, language=language, scope_stack=scope_stack
-                )
-                prev_node = child
+                if child.child_count == 0:
+                    yield from _leaf_chunks(child)
+                    prev_node = child
+                else:
+                    suspended.append((children, child))
+                    children = iter(child.children)
+                    prev_node = None
                 continue
 
             # Include exact inter-node gap (optionally normalized).
@@ -1401,7 +2037,7 @@ class TreeSitterChunker:
                 current_text = child_text
                 current_start = Point(row=sp.row + 1, column=sp.column)  # type: ignore
                 current_end = Point(row=ep.row + 1, column=ep.column)  # type: ignore
-                current_contained = _collect_scopes_in_subtree(child, scope_stack)
+                current_contained = _collect_scopes_in_subtree(child)
                 prev_node = child
                 continue
 
@@ -1409,7 +2045,7 @@ class TreeSitterChunker:
                 current_text = candidate
                 ep = child.end_point
                 current_end = Point(row=ep.row + 1, column=ep.column)  # type: ignore
-                _add_contained(_collect_scopes_in_subtree(child, scope_stack))
+                _add_contained(_collect_scopes_in_subtree(child))
                 prev_node = child
                 continue
 
@@ -1420,10 +2056,185 @@ class TreeSitterChunker:
             current_text = child_text
             current_start = Point(row=sp.row + 1, column=sp.column)  # type: ignore
             current_end = Point(row=ep.row + 1, column=ep.column)  # type: ignore
-            current_contained = _collect_scopes_in_subtree(child, scope_stack)
+            current_contained = _collect_scopes_in_subtree(child)
             prev_node = child
 
-        yield from _flush()
+    def _chunk_with_tree_cache(
+        self,
+        cache: TreeCache,
+        *,
+        path: str,
+        parser,
+        language: str,
+        content_bytes: bytes,
+        scope_stack: list[Scope],
+    ) -> list[Chunk]:
+        """Raw `_chunk_node` output, reusing the cached segments of `path`.
+
+        Returns fresh copies: the comment/trivia merge passes edit chunks in
+        place, and the cached ones must stay pristine.
+        """
+
+        fingerprint = self.config.fingerprint()
+        entry = cache.take(path)
+        edit = None
+        old_segments: list[Segment] = []
+        tree = None
+        if entry is not None and entry.fingerprint == fingerprint and entry.language == language:
+            edit = compute_edit(entry.content, content_bytes)
+            if edit is None:
+                cache.put(path, entry)
+                cache.segments_reused += len(entry.segments)
+                return [clone(c) for seg in entry.segments for c in seg.chunks]
+            # Error recovery in an incremental parse can differ from a fresh
+            # parse of the same bytes, so sources with syntax errors (before
+            # or after the edit) are parsed and chunked from scratch.
+            if entry.tree.root_node.has_error:
+                edit = None
+            else:
+                entry.tree.edit(**edit.as_tree_edit())
+                incremental = parser.parse(content_bytes, entry.tree)
+                if incremental.root_node.has_error:
+                    edit = None
+                else:
+                    tree = incremental
+                    old_segments = entry.segments
+                    cache.incremental_parses += 1
+        if tree is None:
+            tree = parser.parse(content_bytes)
+            cache.full_parses += 1
+
+        # Old segments whose bytes lie entirely outside the edit, keyed by
+        # their start in the new content.
+        reusable: dict[int, tuple[Segment, bool]] = {}
+        if edit is not None:
+            for seg in old_segments:
+                if seg.end_byte <= edit.start_byte:
+                    reusable[seg.start_byte] = (seg, False)
+                elif seg.start_byte >= edit.old_end_byte:
+                    reusable[seg.start_byte + edit.delta] = (seg, True)
+        shifter = PointShifter(edit) if edit is not None else None
+
+        root = tree.root_node
+        children = list(root.children)
+        n = len(children)
+        index_of = {id(ch): i for i, ch in enumerate(children)}
+
+        def _signature(i: int, k: int, start: int) -> tuple[tuple[str, int, int], ...]:
+            return tuple(
+                (ch.type, ch.start_byte - start, ch.end_byte - start) for ch in children[i : i + k]
+            )
+
+        def _match(i: int, start: int) -> Optional[tuple[Segment, bool]]:
+            found = reusable.get(start)
+            if found is None:
+                return None
+            seg = found[0]
+            k = len(seg.nodes)
+            if seg.first != (i == 0) or i + k > n or (not seg.closed and i + k != n):
+                return None
+            if _signature(i, k, start) != seg.nodes:
+                return None
+            return found
+
+        def _reuse_at(i: int, start: int) -> Optional[Segment]:
+            found = _match(i, start)
+            if found is None:
+                return None
+            seg, shifted = found
+            if not shifted:
+                return seg
+            assert shifter is not None
+            return Segment(
+                start_byte=start,
+                end_byte=seg.end_byte + edit.delta,  # type: ignore[union-attr]
+                first=seg.first,
+                closed=seg.closed,
+                nodes=seg.nodes,
+                chunks=[shifter.chunk(c) for c in seg.chunks],
+            )
+
+        segments: list[Segment] = []
+        i = 0
+        while i < n or (n == 0 and not segments):
+            start = children[i - 1].end_byte if i > 0 else 0
+            reused = _reuse_at(i, start) if n else None
+            if reused is not None:
+                segments.append(reused)
+                cache.segments_reused += 1
+                i += len(reused.nodes)
+                continue
+
+            # Walk from child i until the state is clean at a point where an
+            # old segment can take over again (or to the end).
+            collected: list[Chunk] = []
+            seg_first = i
+            seg_chunk_start = 0
+            stopped_after: Optional[int] = None
+
+            def _boundary(child: "Node") -> bool:
+                nonlocal seg_first, seg_chunk_start, stopped_after
+                j = index_of[id(child)]
+                seg_start = children[seg_first - 1].end_byte if seg_first > 0 else 0
+                segments.append(
+                    Segment(
+                        start_byte=seg_start,
+                        end_byte=child.end_byte,
+                        first=seg_first == 0,
+                        closed=True,
+                        nodes=_signature(seg_first, j - seg_first + 1, seg_start),
+                        chunks=collected[seg_chunk_start:],
+                    )
+                )
+                cache.segments_chunked += 1
+                seg_first = j + 1
+                seg_chunk_start = len(collected)
+                if _match(j + 1, child.end_byte) is not None:
+                    stopped_after = j
+                    return True
+                return False
+
+            for c in self._chunk_node(
+                root,
+                content_bytes,
+                language=language,
+                scope_stack=scope_stack,
+                children=children[i:],
+                start_after=children[i - 1] if i > 0 else None,
+                on_boundary=_boundary,
+            ):
+                collected.append(c)
+
+            if stopped_after is not None:
+                i = stopped_after + 1
+                continue
+            # Walked to the end: the rest is one trailing, unclosed segment.
+            if seg_first < n or seg_chunk_start < len(collected) or n == 0:
+                seg_start = children[seg_first - 1].end_byte if seg_first > 0 else 0
+                segments.append(
+                    Segment(
+                        start_byte=seg_start,
+                        end_byte=len(content_bytes),
+                        first=seg_first == 0,
+                        closed=False,
+                        nodes=_signature(seg_first, n - seg_first, seg_start),
+                        chunks=collected[seg_chunk_start:],
+                    )
+                )
+                cache.segments_chunked += 1
+            break
+
+        cache.put(
+            path,
+            TreeEntry(
+                fingerprint=fingerprint,
+                language=language,
+                content=bytes(content_bytes),
+                tree=tree,
+                segments=segments,
+            ),
+        )
+        return [clone(c) for seg in segments for c in seg.chunks]
 
     def chunk_str(
         self,
@@ -1433,6 +2244,8 @@ class TreeSitterChunker:
         language: Optional[str] = None,
         start_pos: Optional["Point"] = None,
         content_bytes: Optional[bytes] = None,
+        sha256: Optional[str] = None,
+        tree_cache: Optional[TreeCache] = None,
     ) -> Generator[Chunk, None, None]:
         """Chunk a raw string.
 
@@ -1442,6 +2255,9 @@ class TreeSitterChunker:
         3) Else fall back to `StringChunker`.
 
         `start_pos` controls the start Point for the fallback StringChunker only.
+        `sha256` is the caller's digest of `content_bytes`, so it isn't hashed twice.
+        With a `tree_cache` (and a `path`), function/type modes re-parse and
+        re-chunk incrementally against the previous content of the path.
         """
 
         if start_pos is None:
@@ -1450,7 +2266,9 @@ class TreeSitterChunker:
         if content_bytes is None:
             content_bytes = content.encode()
 
-        sha256_value = hashlib.sha256(content_bytes).hexdigest() if path is not None else None
+        sha256_value: Optional[str] = None
+        if path is not None:
+            sha256_value = sha256 or hashlib.sha256(content_bytes).hexdigest()
 
         module_value: Optional[str] = None
         module_relpath: Optional[str] = None
@@ -1461,6 +2279,14 @@ class TreeSitterChunker:
             while module_relpath.startswith("../"):
                 module_relpath = module_relpath[3:]
 
+        # Every emitted chunk refers to this file's interned scope tuples.
+        scopes = ScopeTable()
+        file_scope_path = scopes.path(
+            [Scope(kind=ScopeKind.FILE, name=module_value, raw_type="file", rel_path=module_relpath)]
+            if module_value
+            else []
+        )
+
         # Resolve language as early as possible so even the whole-file fast-path
         # can still report `language`.
         parser = None
@@ -1486,60 +2312,28 @@ class TreeSitterChunker:
                     path=path,
                     sha256=sha256_value,
                     language=lang,
-                    scope_path=[
-                        *(
-                            [
-                                Scope(
-                                    kind=ScopeKind.FILE,
-                                    name=module_value,
-                                    raw_type="file",
-                                    rel_path=module_relpath,
-                                )
-                            ]
-                            if module_value
-                            else []
-                        ),
-                    ],
-                    contained_scopes=[],
+                    scope_path=file_scope_path,
+                    contained_scopes=(),
                 )
             )
             return
 
         if parser is None and lang is not None and _HAS_TREESITTER:
             try:
-                parser = get_parser(lang)  # type: ignore[arg-type]
+                parser = self._parser_for(lang)
             except LookupError:
                 parser = None
                 lang = None
 
         # No tree-sitter parser -> fallback to naive string chunking.
         if parser is None:
+            # Fallback chunks are fresh objects: annotate them in place.
             for c in self._fallback.chunk(content, start_pos=start_pos):
-                yield self._attach_scope_range(
-                    Chunk(
-                        text=c.text,
-                        start=c.start,
-                        end=c.end,
-                        path=path,
-                        sha256=sha256_value,
-                        language=lang,
-                        scope_path=[
-                            *(
-                                [
-                                    Scope(
-                                        kind=ScopeKind.FILE,
-                                        name=module_value,
-                                        raw_type="file",
-                                        rel_path=module_relpath,
-                                    )
-                                ]
-                                if module_value
-                                else []
-                            ),
-                        ],
-                        contained_scopes=[],
-                    )
-                )
+                c.path = path
+                c.sha256 = sha256_value
+                c.language = lang
+                c.scope_path = file_scope_path
+                yield self._attach_scope_range(c)
             return
 
         pattern_str = self._build_filter_pattern(lang)
@@ -1587,65 +2381,32 @@ class TreeSitterChunker:
             # to remain aligned with the original file for contained_scopes mapping.
 
             # (2) Collect scope ranges (TYPE/FUNCTION) from the parsed tree.
-            scope_ranges: list[tuple[Scope, "Point", "Point"]] = []
-
-            def _dfs(n: "Node", stack: list[Scope]) -> None:
-                sc = self._scope_of_node(
-                    n, language=lang, text_bytes=content_bytes, scope_stack=stack
-                )
-                if sc is not None:
-                    sp = n.start_point
-                    ep = n.end_point
-                    scope_ranges.append(
-                        (
-                            sc,
-                            Point(row=sp.row + 1, column=sp.column),  # type: ignore
-                            Point(row=ep.row + 1, column=ep.column),  # type: ignore
-                        )
-                    )
-                    stack = [*stack, sc]
-                for ch in getattr(n, "children", []):
-                    _dfs(ch, stack)
-
-            _dfs(tree.root_node, [])
+            scope_ranges: list[tuple[Scope, "Point", "Point"]] = [
+                (sc, sc.start, sc.end)  # type: ignore[misc]
+                for _, sc in self._iter_scopes(tree.root_node, language=lang, text_bytes=content_bytes)
+            ]
 
             def _pt_key(p: "Point") -> tuple[int, int]:
                 return int(p.row), int(p.column)
 
-            def _ranges_overlap(a0: "Point", a1: "Point", b0: "Point", b1: "Point") -> bool:
-                return not (_pt_key(a1) < _pt_key(b0) or _pt_key(b1) < _pt_key(a0))
+            # (3) Each window picks up the scopes overlapping it (inclusive ends)
+            # from an interval index, first occurrence per (kind, name) in tree order.
+            scope_index = IntervalIndex([(_pt_key(s0), _pt_key(s1)) for _, s0, s1 in scope_ranges])
 
             for c in self._fallback.chunk(file_text, start_pos=start_pos):
                 contained: list[Scope] = []
-                for sc, s0, s1 in scope_ranges:
-                    if _ranges_overlap(c.start, c.end, s0, s1):  # type: ignore[arg-type]
-                        if (sc.kind, sc.name) not in {(x.kind, x.name) for x in contained}:
-                            contained.append(sc)
-                yield self._attach_scope_range(
-                    Chunk(
-                        text=c.text,
-                        start=c.start,
-                        end=c.end,
-                        path=path,
-                        sha256=sha256_value,
-                        language=lang,
-                        scope_path=[
-                            *(
-                                [
-                                    Scope(
-                                        kind=ScopeKind.FILE,
-                                        name=module_value,
-                                        raw_type="file",
-                                        rel_path=module_relpath,
-                                    )
-                                ]
-                                if module_value
-                                else []
-                            ),
-                        ],
-                        contained_scopes=contained,
-                    )
-                )
+                seen: set[tuple[ScopeKind, Optional[str]]] = set()
+                for i in scope_index.overlapping(_pt_key(c.start), _pt_key(c.end)):  # type: ignore[arg-type]
+                    sc = scope_ranges[i][0]
+                    if (sc.kind, sc.name) not in seen:
+                        seen.add((sc.kind, sc.name))
+                        contained.append(sc)
+                c.path = path
+                c.sha256 = sha256_value
+                c.language = lang
+                c.scope_path = file_scope_path
+                c.contained_scopes = scopes.path(contained)
+                yield self._attach_scope_range(c)
             return
 
         # mode=auto_ast => legacy AST packing strategy (similar to early prototype).
@@ -1653,16 +2414,7 @@ class TreeSitterChunker:
             pattern_str = self._build_filter_pattern(lang)
             tree = parser.parse(content_bytes)
 
-            base_scopes: list[Scope] = []
-            if module_value:
-                base_scopes.append(
-                    Scope(
-                        kind=ScopeKind.FILE,
-                        name=module_value,
-                        raw_type="file",
-                        rel_path=module_relpath,
-                    )
-                )
+            base_scopes: list[Scope] = list(file_scope_path)
 
             chunks = self._chunk_node_auto_ast(
                 tree.root_node, content_bytes, language=lang, scope_stack=base_scopes
@@ -1679,8 +2431,8 @@ class TreeSitterChunker:
                                 path=path,
                                 sha256=sha256_value,
                                 language=lang,
-                                scope_path=c.scope_path,
-                                contained_scopes=c.contained_scopes,
+                                scope_path=scopes.path(c.scope_path),
+                                contained_scopes=scopes.path(c.contained_scopes),
                             )
                         )
             else:
@@ -1693,26 +2445,28 @@ class TreeSitterChunker:
                             path=path,
                             sha256=sha256_value,
                             language=lang,
-                            scope_path=c.scope_path,
-                            contained_scopes=c.contained_scopes,
+                            scope_path=scopes.path(c.scope_path),
+                            contained_scopes=scopes.path(c.contained_scopes),
                         )
                     )
             return
 
-        tree = parser.parse(content_bytes)
+        base_scopes: list[Scope] = list(file_scope_path)
 
-        base_scopes: list[Scope] = []
-        if module_value:
-            base_scopes.append(
-                Scope(
-                    kind=ScopeKind.FILE,
-                    name=module_value,
-                    raw_type="file",
-                    rel_path=module_relpath,
+        if tree_cache is not None and path is not None and lang is not None:
+            chunks = iter(
+                self._chunk_with_tree_cache(
+                    tree_cache,
+                    path=path,
+                    parser=parser,
+                    language=lang,
+                    content_bytes=content_bytes,
+                    scope_stack=base_scopes,
                 )
             )
-
-        chunks = self._chunk_node(tree.root_node, content_bytes, language=lang, scope_stack=base_scopes)
+        else:
+            tree = parser.parse(content_bytes)
+            chunks = self._chunk_node(tree.root_node, content_bytes, language=lang, scope_stack=base_scopes)
 
         if pattern_str:
             rx = re.compile(pattern_str)
@@ -1726,8 +2480,8 @@ class TreeSitterChunker:
                             path=path,
                             sha256=sha256_value,
                             language=lang,
-                            scope_path=c.scope_path,
-                            contained_scopes=c.contained_scopes,
+                            scope_path=scopes.path(c.scope_path),
+                            contained_scopes=scopes.path(c.contained_scopes),
                         )
                     )
         else:
@@ -1740,21 +2494,55 @@ class TreeSitterChunker:
                         path=path,
                         sha256=sha256_value,
                         language=lang,
-                        scope_path=c.scope_path,
-                        contained_scopes=c.contained_scopes,
+                        scope_path=scopes.path(c.scope_path),
+                        contained_scopes=scopes.path(c.contained_scopes),
                     )
                 )
 
-    def chunk(self, path: str) -> Generator[Chunk, None, None]:
-        if not os.path.isfile(path):
+    def chunk(
+        self,
+        path: str,
+        *,
+        data: Optional[bytes] = None,
+        sha256: Optional[str] = None,
+        tree_cache: Optional[TreeCache] = None,
+    ) -> Generator[Chunk, None, None]:
+        """Chunk a file.
+
+        Callers that already read the file (the indexer sniffs and hashes it
+        first) pass its `data` and `sha256`, so it is not read or hashed again.
+        See `chunk_str` for `tree_cache`.
+        """
+
+        if data is None and not os.path.isfile(path):
             raise FileNotFoundError(path)
 
-        content, raw = self._load_file(path)
+        content, raw = self._load_file(path, data)
         yield from self.chunk_str(
             content,
             path=path,
             start_pos=Point(row=1, column=0),  # type: ignore
             content_bytes=raw,
+            sha256=sha256,
+            tree_cache=tree_cache,
         )
 
 
+_SHARED_CHUNKERS: dict[str, TreeSitterChunker] = {}
+_SHARED_CHUNKERS_LOCK = threading.Lock()
+
+
+def shared_chunker(config: Config) -> TreeSitterChunker:
+    """A process-wide chunker per config (keyed by `Config.fingerprint()`).
+
+    Chunkers hold no per-file state and parsers are per thread, so one
+    instance can serve every file and thread; this keeps per-file setup off
+    the indexing hot path.
+    """
+
+    key = config.fingerprint()
+    chunker = _SHARED_CHUNKERS.get(key)
+    if chunker is None:
+        with _SHARED_CHUNKERS_LOCK:
+            chunker = _SHARED_CHUNKERS.setdefault(key, TreeSitterChunker(config))
+    return chunker
@@ -26,8 +26,30 @@ class VectorStore(Protocol):
 
     async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]: ...
 
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        """Bulk lookup: path -> stored file sha256, for paths that have vectors."""
+        ...
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        """All chunk ids stored for one file."""
+        ...
+
     async def delete_by_path(self, *, path: str) -> None: ...
 
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None: ...
+
+    async def update_metadatas(
+        self,
+        *,
+        ids: Sequence[str],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        """Replace metadata of existing chunks without touching their vectors.
+
+        Keys missing from the new metadata are removed, not kept.
+        """
+        ...
+
     async def upsert(
         self,
         *,
@@ -37,6 +59,17 @@ class VectorStore(Protocol):
         metadatas: Sequence[Mapping[str, Any]],
     ) -> None: ...
 
+    async def get_index_state(self) -> dict[str, Any]:
+        """Small key/value state stored with the collection (e.g. last indexed commit)."""
+        ...
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        """Merge `state` into the collection's index state."""
+        ...
+
+
+# Collection metadata keys holding index state (see `VectorStore.get_index_state`).
+_STATE_PREFIX = "mci:"
 
 
 def _collection_name_for_root(root_dir: str) -> str:
@@ -60,6 +93,8 @@ class ChromaStore(VectorStore):
     base_url: str = "http://127.0.0.1:8010"
     root_dir: Optional[str] = None
     collection_name: Optional[str] = None
+    # Max number of paths per `$in` query in bulk lookups.
+    lookup_page_size: int = 256
 
     _client: Any = None
     _collection: Any = None
@@ -154,6 +189,41 @@ class ChromaStore(VectorStore):
             return None
         return metadatas[0]
 
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        return await asyncio.to_thread(self._get_sha_by_paths_sync, list(paths))
+
+    def _get_sha_by_paths_sync(self, paths: list[str]) -> dict[str, str]:
+        collection = self._ensure_collection()
+        full_paths = sorted({os.path.abspath(os.path.expanduser(p)) for p in paths})
+        page_size = max(1, int(self.lookup_page_size))
+
+        found: dict[str, str] = {}
+        for i in range(0, len(full_paths), page_size):
+            page = full_paths[i : i + page_size]
+            # Every indexed file carries exactly one "relpath" chunk, so filtering
+            # on it returns one row per file instead of every chunk.
+            result = collection.get(
+                where={"$and": [{"path": {"$in": page}}, {"chunk_kind": "relpath"}]},
+                include=["metadatas"],
+            )
+            for meta in (result or {}).get("metadatas") or []:
+                if not isinstance(meta, dict):
+                    continue
+                path = meta.get("path")
+                sha = meta.get("sha256")
+                if isinstance(path, str) and isinstance(sha, str):
+                    found[path] = sha
+        return found
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        return await asyncio.to_thread(self._get_ids_by_path_sync, path)
+
+    def _get_ids_by_path_sync(self, path: str) -> list[str]:
+        collection = self._ensure_collection()
+        full = os.path.abspath(os.path.expanduser(path))
+        result = collection.get(where={"path": full}, include=[])
+        return list((result or {}).get("ids") or [])
+
     async def delete_by_path(self, *, path: str) -> None:
         await asyncio.to_thread(self._delete_by_path_sync, path)
 
@@ -162,6 +232,79 @@ class ChromaStore(VectorStore):
         full = os.path.abspath(os.path.expanduser(path))
         collection.delete(where={"path": full})
 
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        await asyncio.to_thread(self._delete_by_ids_sync, list(ids))
+
+    def _delete_by_ids_sync(self, ids: list[str]) -> None:
+        collection = self._ensure_collection()
+        collection.delete(ids=ids)
+
+    async def update_metadatas(
+        self,
+        *,
+        ids: Sequence[str],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        if not ids:
+            return
+        await asyncio.to_thread(self._update_metadatas_sync, ids, metadatas)
+
+    def _update_metadatas_sync(
+        self,
+        ids: Sequence[str],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        if len(ids) != len(metadatas):
+            raise ValueError("ids/metadatas must have the same length")
+
+        collection = self._ensure_collection()
+        # `update` merges keys into the stored metadata; a key set to None is
+        # removed. Null out keys the new metadata no longer has (e.g. a chunk
+        # that left its group) so the call replaces, as the protocol says.
+        current = collection.get(ids=list(ids), include=["metadatas"])
+        stored = {
+            i: (m or {}) for i, m in zip(current.get("ids") or [], current.get("metadatas") or [])
+        }
+        replaced: list[dict[str, Any]] = []
+        for chunk_id, meta in zip(ids, metadatas):
+            new = dict(meta)
+            for key in stored.get(chunk_id, {}):
+                new.setdefault(key, None)
+            replaced.append(new)
+        collection.update(ids=list(ids), metadatas=replaced)
+
+    async def get_index_state(self) -> dict[str, Any]:
+        return await asyncio.to_thread(self._get_index_state_sync)
+
+    def _get_index_state_sync(self) -> dict[str, Any]:
+        collection = self._ensure_collection()
+        # Re-read instead of trusting the cached collection model: another
+        # indexer process may have moved the state on.
+        fresh = self._ensure_client().get_collection(name=collection.name)
+        meta = dict(getattr(fresh, "metadata", None) or {})
+        return {
+            k[len(_STATE_PREFIX) :]: v for k, v in meta.items() if k.startswith(_STATE_PREFIX)
+        }
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        await asyncio.to_thread(self._set_index_state_sync, dict(state))
+
+    def _set_index_state_sync(self, state: dict[str, Any]) -> None:
+        collection = self._ensure_collection()
+        fresh = self._ensure_client().get_collection(name=collection.name)
+        # `modify` replaces the metadata, so merge; HNSW settings are immutable
+        # and must not be sent back.
+        meta = {
+            k: v
+            for k, v in (getattr(fresh, "metadata", None) or {}).items()
+            if not k.startswith("hnsw:")
+        }
+        for key, value in state.items():
+            meta[_STATE_PREFIX + key] = value
+        collection.modify(metadata=meta)
+
     async def upsert(
         self,
         *,
@@ -189,10 +332,13 @@ class ChromaStore(VectorStore):
             raise ValueError("ids/documents/embeddings/metadatas must have the same length")
 
         collection = self._ensure_collection()
+        import numpy as np  # installed with chromadb
+
         collection.upsert(
             ids=list(ids),
             documents=list(documents),
-            embeddings=[list(map(float, v)) for v in embeddings],
+            # float32 rows from the embedder pass through without a copy.
+            embeddings=[np.asarray(v, dtype=np.float32) for v in embeddings],
             metadatas=[dict(m) for m in metadatas],
         )
 
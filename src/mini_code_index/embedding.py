@@ -1,16 +1,38 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import binascii
 import json
+import math
 import os
 import ssl
+import sys
 import time
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from typing import Any, Iterable, Optional, Protocol, Sequence
 
 import aiohttp
 import logging
 
+from .ratelimit import AdaptiveRateLimiter, parse_retry_after, shared_rate_limiter
+from .tokenizer import (
+    CHARS_PER_TOKEN_ESTIMATE,
+    BPETokenCounter,
+    EstimatingTokenCounter,
+    TokenCounter,
+)
+
+try:  # numpy is optional; responses decode into float32 matrices with it
+    import numpy as np  # type: ignore
+
+    _HAS_NUMPY = True
+except Exception:  # pragma: nocover
+    np = None  # type: ignore
+
+    _HAS_NUMPY = False
+
 
 class EmbeddingError(RuntimeError):
     pass
@@ -20,12 +42,14 @@ logger = logging.getLogger(__name__)
 
 
 class Embedder(Protocol):
-    async def embed(self, texts: Sequence[str]) -> list[list[float]]: ...
+    # One vector per text, in order. A float32 numpy matrix (one row per
+    # text) satisfies this as well as a list of float lists.
+    async def embed(self, texts: Sequence[str]) -> Sequence[Sequence[float]]: ...
 
 
-# Approximate token estimation: ~4 characters per token for English.
-# This is a rough estimate; real tokenization depends on the model.
-CHARS_PER_TOKEN_ESTIMATE = 4
+# What to do with a single input over `token_limit`: fail, keep only its
+# first `token_limit` tokens, or embed it in pieces and pool the vectors.
+OVERSIZE_POLICIES = ("error", "truncate", "split")
 
 
 def _estimate_tokens(text: str) -> int:
@@ -33,21 +57,34 @@ def _estimate_tokens(text: str) -> int:
 
 
 def _create_token_aware_batches(
-    texts: Sequence[str], *, batch_size: int, token_limit: Optional[int]
+    texts: Sequence[str],
+    *,
+    batch_size: int,
+    token_limit: Optional[int],
+    counter: Optional[TokenCounter] = None,
+    oversize: str = "error",
 ) -> list[list[str]]:
+    """Pack texts in order into batches under `batch_size` and `token_limit`.
+
+    Tokens are counted with `counter` (default: the chars/4 estimate). With
+    `oversize="error"` an input over the limit raises; otherwise it is sent
+    in a batch of its own and left to the embedder's oversize policy.
+    """
+
     if batch_size <= 0:
         raise ValueError("batch_size must be > 0")
 
     if not token_limit:
         return [list(texts[i : i + batch_size]) for i in range(0, len(texts), batch_size)]
 
-    token_counts = [_estimate_tokens(t) for t in texts]
-    if token_counts and max(token_counts) > token_limit:
+    count = counter.count if counter is not None else _estimate_tokens
+    token_counts = [count(t) for t in texts]
+    if token_counts and max(token_counts) > token_limit and oversize == "error":
         raise EmbeddingError(
             f"Single input exceeds token limit ({token_limit} tokens)."
         )
 
-    if sum(token_counts) <= token_limit:
+    if sum(token_counts) <= token_limit and len(texts) <= batch_size:
         return [list(texts)]
 
     batches: list[list[str]] = []
@@ -72,29 +109,101 @@ def _create_token_aware_batches(
     return batches
 
 
-def _parse_openai_embeddings_response(payload: dict[str, Any], n_expected: int) -> list[list[float]]:
+def _pool_vectors(vectors: Sequence[Sequence[float]], weights: Sequence[int]) -> Sequence[float]:
+    """Token-weighted mean of piece vectors, rescaled to their mean norm.
+
+    Providers that return unit vectors get a unit vector back, so pooled
+    inputs stay comparable with directly embedded ones.
+    """
+
+    if _HAS_NUMPY:
+        mat = np.asarray(vectors, dtype=np.float32)
+        w = np.asarray(weights, dtype=np.float32)
+        pooled = (mat * w[:, None]).sum(axis=0) / (float(w.sum()) or 1.0)
+        norm = float(np.linalg.norm(pooled))
+        if norm == 0.0:
+            return pooled
+        return pooled * np.float32(float(np.linalg.norm(mat, axis=1).mean()) / norm)
+
+    total = float(sum(weights)) or 1.0
+    dim = len(vectors[0])
+    out = [0.0] * dim
+    for vec, w in zip(vectors, weights):
+        for i, x in enumerate(vec):
+            out[i] += x * w
+    out = [x / total for x in out]
+    norm = math.sqrt(sum(x * x for x in out))
+    target = sum(math.sqrt(sum(x * x for x in v)) for v in vectors) / len(vectors)
+    if norm == 0.0:
+        return out
+    return [x * (target / norm) for x in out]
+
+
+def _decode_embedding(emb: Any) -> Optional[Sequence[float]]:
+    """Decode one `embedding` field: a base64 string of little-endian float32
+    values or a list of numbers. Returns None for anything else."""
+
+    if isinstance(emb, str):
+        try:
+            raw = base64.b64decode(emb, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise EmbeddingError("Invalid embeddings response: bad base64 embedding") from e
+        if len(raw) % 4:
+            raise EmbeddingError("Invalid embeddings response: base64 embedding is not float32")
+        if _HAS_NUMPY:
+            return np.frombuffer(raw, dtype="<f4")
+        vec = array("f")
+        vec.frombytes(raw)
+        if sys.byteorder != "little":
+            vec.byteswap()
+        return vec.tolist()
+
+    if not isinstance(emb, list):
+        return None
+    if _HAS_NUMPY:
+        try:
+            arr = np.array(emb)
+        except ValueError:
+            return None
+        if arr.ndim != 1 or arr.dtype.kind not in "fiu":
+            return None
+        return arr.astype(np.float32)
+    if all(isinstance(x, (int, float)) for x in emb):
+        return [float(x) for x in emb]
+    return None
+
+
+def _parse_openai_embeddings_response(
+    payload: dict[str, Any], n_expected: int
+) -> Sequence[Sequence[float]]:
+    """Vectors in input order: a float32 matrix with numpy, else float lists."""
+
     data = payload.get("data")
     if not isinstance(data, list):
         raise EmbeddingError("Invalid embeddings response: missing 'data' list")
 
-    # OpenAI-compatible schema: each item has {index, embedding, object}
-    by_index: dict[int, list[float]] = {}
+    # OpenAI-compatible schema: each item has {index, embedding, object};
+    # `embedding` is a base64 string when encoding_format="base64".
+    by_index: dict[int, Sequence[float]] = {}
     for item in data:
         if not isinstance(item, dict):
             continue
         idx = item.get("index")
-        emb = item.get("embedding")
-        if isinstance(idx, int) and isinstance(emb, list) and all(
-            isinstance(x, (int, float)) for x in emb
-        ):
-            by_index[idx] = [float(x) for x in emb]
+        if not isinstance(idx, int):
+            continue
+        vec = _decode_embedding(item.get("embedding"))
+        if vec is not None:
+            by_index[idx] = vec
 
     if len(by_index) != n_expected:
         raise EmbeddingError(
             f"Invalid embeddings response: expected {n_expected} vectors, got {len(by_index)}"
         )
 
-    return [by_index[i] for i in range(n_expected)]
+    rows = [by_index[i] for i in range(n_expected)]
+    if _HAS_NUMPY and rows and len({len(r) for r in rows}) == 1:
+        return np.stack(rows)
+    return rows
 
 
 @dataclass
@@ -103,14 +212,25 @@ class OpenAICompatibleEmbedder:
 
     Targets the standard endpoint: POST {base_url}/v1/embeddings
 
+    Batches are packed against `token_limit` with `token_counter` (default:
+    the chars/4 estimate; `BPETokenCounter` counts real tokens). A single
+    input over the limit is handled by `oversize`: "error" raises,
+    "truncate" keeps its first `token_limit` tokens, "split" embeds it in
+    pieces and returns their token-weighted mean.
+
     Env defaults:
     - OPENAI_API_KEY
     - OPENAI_BASE_URL (default: https://api.openai.com)
     - OPENAI_EMBEDDING_MODEL (default: text-embedding-3-small)
 
     Notes:
-    - This module intentionally does NOT manage retries/backoff yet.
+    - Requests are paced by an `AdaptiveRateLimiter` shared by every embedder
+      for the same endpoint and model (`requests_per_min` / `tokens_per_min`
+      set the quotas, otherwise they are learned from `x-ratelimit-*`
+      headers). A 429 pauses all of them for its `Retry-After`.
     - It preserves input order using the returned `index` field.
+    - Up to `max_in_flight` batches of one `embed()` call are in flight at
+      once over the shared session; vectors come back in input order.
     """
 
     api_key: str
@@ -120,10 +240,26 @@ class OpenAICompatibleEmbedder:
     batch_size: int = 128
     dimensions: Optional[int] = None
     token_limit: Optional[int] = None
+    token_counter: TokenCounter = field(default_factory=EstimatingTokenCounter)
+    oversize: str = "split"
+    # "base64" asks for packed float32 vectors, which decode without a
+    # per-float JSON/Python pass; "float" or None (omit) for plain lists.
+    # Falls back to None if the provider rejects the parameter.
+    encoding_format: Optional[str] = "base64"
     max_retries: int = 3
     retry_delay_s: float = 1.0
+    # Batches of one `embed()` call sent concurrently; 1 sends them in turn.
+    max_in_flight: int = 4
+    requests_per_min: Optional[int] = None
+    tokens_per_min: Optional[int] = None
+    # Defaults to the process-wide limiter from `shared_rate_limiter`.
+    rate_limiter: Optional[AdaptiveRateLimiter] = None
     _session: Optional[aiohttp.ClientSession] = None
 
+    def __post_init__(self) -> None:
+        if self.oversize not in OVERSIZE_POLICIES:
+            raise ValueError(f"oversize must be one of {OVERSIZE_POLICIES}")
+
     @classmethod
     def from_env(cls) -> "OpenAICompatibleEmbedder":
         # Preferred env var set (matches your config style):
@@ -158,6 +294,24 @@ class OpenAICompatibleEmbedder:
         rd = os.environ.get("EMBEDDING_RETRY_DELAY_S")
         retry_delay_s = float(rd) if rd and str(rd).replace(".", "", 1).isdigit() else 1.0
 
+        mf = os.environ.get("EMBEDDING_MAX_IN_FLIGHT")
+        max_in_flight = int(mf) if mf and str(mf).isdigit() else 4
+
+        rpm = os.environ.get("EMBEDDING_RPM")
+        requests_per_min = int(rpm) if rpm and str(rpm).isdigit() else None
+
+        tpm = os.environ.get("EMBEDDING_TPM")
+        tokens_per_min = int(tpm) if tpm and str(tpm).isdigit() else None
+
+        # BPE vocabulary in tiktoken format, e.g. cl100k_base.tiktoken.
+        vocab = os.environ.get("EMBEDDING_TOKENIZER_FILE")
+        token_counter: TokenCounter = (
+            BPETokenCounter.from_file(vocab) if vocab else EstimatingTokenCounter()
+        )
+        oversize = os.environ.get("EMBEDDING_OVERSIZE") or "split"
+
+        encoding_format = os.environ.get("EMBEDDING_ENCODING_FORMAT") or "base64"
+
         return cls(
             api_key=api_key,
             base_url=base_url,
@@ -168,6 +322,12 @@ class OpenAICompatibleEmbedder:
             timeout_s=timeout_s,
             max_retries=max_retries,
             retry_delay_s=retry_delay_s,
+            max_in_flight=max_in_flight,
+            requests_per_min=requests_per_min,
+            tokens_per_min=tokens_per_min,
+            token_counter=token_counter,
+            oversize=oversize,
+            encoding_format=encoding_format,
         )
 
     async def _get_session(self) -> aiohttp.ClientSession:
@@ -196,6 +356,16 @@ class OpenAICompatibleEmbedder:
     async def __aexit__(self, exc_type, exc, tb) -> None:
         await self.close()
 
+    def _get_rate_limiter(self) -> AdaptiveRateLimiter:
+        if self.rate_limiter is None:
+            self.rate_limiter = shared_rate_limiter(
+                self._embeddings_url(),
+                self.model,
+                requests_per_min=self.requests_per_min,
+                tokens_per_min=self.tokens_per_min,
+            )
+        return self.rate_limiter
+
     def _embeddings_url(self) -> str:
         """Build embeddings endpoint for OpenAI-compatible APIs.
 
@@ -221,50 +391,86 @@ class OpenAICompatibleEmbedder:
         body: dict[str, Any] = {"model": self.model, "input": _input}
         if self.dimensions is not None:
             body["dimensions"] = int(self.dimensions)
+        if self.encoding_format:
+            body["encoding_format"] = self.encoding_format
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
 
+        limiter = self._get_rate_limiter()
+        tokens = sum(self.token_counter.count(t) for t in inputs)
+
         last_error: Exception | None = None
-        for attempt in range(self.max_retries):
+        backoff = 0.0
+        attempt = 0
+        while attempt < self.max_retries:
+            if backoff:
+                # Back off only after leaving the limiter slot and releasing
+                # the response, so a retrying request holds up no one else.
+                await asyncio.sleep(backoff)
+                backoff = 0.0
             try:
                 session = await self._get_session()
-                async with session.post(url, json=body, headers=headers) as resp:
+                async with limiter.slot(tokens), session.post(
+                    url, json=body, headers=headers
+                ) as resp:
                     raw = await resp.text()
+                    limiter.observe_headers(resp.headers)
 
                     if resp.status == 429:
-                        retry_after = None
-                        try:
-                            ra = resp.headers.get("Retry-After") if resp.headers else None
-                            retry_after = float(ra) if ra else None
-                        except Exception:
-                            retry_after = None
-                        delay = (
+                        retry_after = parse_retry_after(
+                            resp.headers.get("Retry-After") if resp.headers else None
+                        )
+                        # The limiter pauses every caller until the delay has
+                        # passed; the next attempt waits for it in `slot()`.
+                        delay = limiter.on_throttle(
                             retry_after
                             if retry_after is not None
                             else self.retry_delay_s * (2**attempt)
                         )
+                        last_error = EmbeddingError(f"Embeddings HTTP error: 429 {resp.reason}")
                         logger.warning(
                             "Embeddings HTTP 429. Retry %d/%d in %.2fs",
                             attempt + 1,
                             self.max_retries,
                             delay,
                         )
-                        await asyncio.sleep(delay)
+                        attempt += 1
                         continue
 
                     if 500 <= resp.status < 600:
-                        delay = self.retry_delay_s * (2**attempt)
+                        backoff = self.retry_delay_s * (2**attempt)
+                        last_error = EmbeddingError(
+                            f"Embeddings HTTP error: {resp.status} {resp.reason}"
+                        )
                         logger.warning(
                             "Embeddings HTTP %d. Retry %d/%d in %.2fs",
                             resp.status,
                             attempt + 1,
                             self.max_retries,
-                            delay,
+                            backoff,
+                        )
+                        attempt += 1
+                        continue
+
+                    if (
+                        resp.status in (400, 422)
+                        and "encoding_format" in body
+                        and "encoding_format" in raw
+                    ):
+                        # Provider does not support the parameter: drop it
+                        # for this embedder and retry right away, without
+                        # spending an attempt (this can happen only once).
+                        last_error = EmbeddingError(
+                            f"Embeddings HTTP error: {resp.status} {resp.reason} {raw}"
+                        )
+                        logger.warning(
+                            "Embeddings endpoint rejected encoding_format=%s; using floats",
+                            body.pop("encoding_format"),
                         )
-                        await asyncio.sleep(delay)
+                        self.encoding_format = None
                         continue
 
                     if resp.status >= 400:
@@ -283,6 +489,7 @@ class OpenAICompatibleEmbedder:
                         message = err.get("message", "unknown error")
                         raise EmbeddingError(f"Embeddings API error: {code} {message}")
 
+                    limiter.on_success()
                     return payload
             except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
                 last_error = e
@@ -295,15 +502,119 @@ class OpenAICompatibleEmbedder:
                     delay,
                 )
                 await asyncio.sleep(delay)
+                attempt += 1
                 continue
-        else:
-            raise EmbeddingError(f"Embeddings request failed after {self.max_retries} retries: {last_error}")
+        raise EmbeddingError(f"Embeddings request failed after {self.max_retries} retries: {last_error}")
+
+    async def _embed_batch(self, batch_num: int, batch: list[str]) -> Sequence[Sequence[float]]:
+        approx_tokens = sum(self.token_counter.count(t) for t in batch)
+        batch_chars = sum(len(t) for t in batch)
+        logger.info(
+            "    [BATCH %d] input_texts=%d chars=%d tokens=%d",
+            batch_num,
+            len(batch),
+            batch_chars,
+            approx_tokens,
+        )
+        logger.debug(
+            "    [BATCH %d] size=%d tokens=%d model=%s",
+            batch_num,
+            len(batch),
+            approx_tokens,
+            self.model,
+        )
+        req_start = time.time()
+        payload = await self._request(batch)
+        req_elapsed = time.time() - req_start
+        logger.debug("    [BATCH %d] API request completed (%.2fs)", batch_num, req_elapsed)
+        batch_vectors = _parse_openai_embeddings_response(payload, n_expected=len(batch))
+        logger.info(
+            "    [BATCH %d] output_vectors=%d dim=%s",
+            batch_num,
+            len(batch_vectors),
+            len(batch_vectors[0]) if len(batch_vectors) else 0,
+        )
+        return batch_vectors
+
+    async def _embed_concurrently(
+        self, batches: list[list[str]]
+    ) -> list[Sequence[Sequence[float]]]:
+        """Send up to `max_in_flight` batches at once; results keep batch order.
+
+        All requests share one session (`_get_session` creates it without
+        awaiting, so concurrent batches cannot race to open a second one) and
+        its connector limit. The first failure cancels the batches still
+        waiting or in flight and is re-raised.
+        """
 
-    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        failed = False
+
+        async def _bounded(batch_num: int, batch: list[str]) -> Sequence[Sequence[float]]:
+            nonlocal failed
+            async with semaphore:
+                # A slot freed by a failing batch must not start another
+                # request; gather() is about to raise that failure anyway.
+                if failed:
+                    return []
+                try:
+                    return await self._embed_batch(batch_num, batch)
+                except BaseException:
+                    failed = True
+                    raise
+
+        tasks = [
+            asyncio.ensure_future(_bounded(batch_num, batch))
+            for batch_num, batch in enumerate(batches, start=1)
+        ]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def _fit_token_limit(
+        self, texts: Sequence[str]
+    ) -> tuple[list[str], Optional[list[tuple[int, int]]]]:
+        """Apply the oversize policy to inputs over `token_limit`.
+
+        Returns the texts to send and, if any input was split, the
+        `[start, stop)` range of sent texts that belongs to each input.
+        """
+
+        limit = self.token_limit
+        if not limit:
+            return list(texts), None
+        counts = [self.token_counter.count(t) for t in texts]
+        oversized = sum(1 for n in counts if n > limit)
+        if not oversized:
+            return list(texts), None
+        if self.oversize == "error":
+            raise EmbeddingError(f"Single input exceeds token limit ({limit} tokens).")
+
+        logger.info(
+            "[EMBED_OVERSIZE] %d input(s) over %d tokens -> %s", oversized, limit, self.oversize
+        )
+        if self.oversize == "truncate":
+            return [
+                self.token_counter.split(t, limit)[0] if n > limit else t
+                for t, n in zip(texts, counts)
+            ], None
+
+        inputs: list[str] = []
+        spans: list[tuple[int, int]] = []
+        for t, n in zip(texts, counts):
+            pieces = self.token_counter.split(t, limit) if n > limit else [t]
+            spans.append((len(inputs), len(inputs) + len(pieces)))
+            inputs.extend(pieces)
+        return inputs, spans
+
+    async def embed(self, texts: Sequence[str]) -> Sequence[Sequence[float]]:
         if not texts:
             return []
 
-        vectors: list[list[float]] = []
         embed_start_time = time.time()
         text_lengths = [len(t) for t in texts]
         total_chars = sum(text_lengths)
@@ -317,8 +628,12 @@ class OpenAICompatibleEmbedder:
             avg_chars,
             max_chars,
         )
+        inputs, spans = self._fit_token_limit(texts)
         batches = _create_token_aware_batches(
-            list(texts), batch_size=self.batch_size, token_limit=self.token_limit
+            inputs,
+            batch_size=self.batch_size,
+            token_limit=self.token_limit,
+            counter=self.token_counter,
         )
         logger.debug(
             "[EMBED_BATCHING] %d texts -> %d batch(es) (max_batch=%d, token_limit=%s)",
@@ -328,43 +643,33 @@ class OpenAICompatibleEmbedder:
             str(self.token_limit),
         )
         
-        batch_num = 0
-        total_tokens = 0
-        dims_seen: set[int] = set()
-        for batch in batches:
-            batch_num += 1
-            approx_tokens = sum(_estimate_tokens(t) for t in batch)
-            total_tokens += approx_tokens
-            batch_chars = sum(len(t) for t in batch)
-            logger.info(
-                "    [BATCH %d] input_texts=%d chars=%d tokens=%d",
-                batch_num,
-                len(batch),
-                batch_chars,
-                approx_tokens,
-            )
-            logger.debug(
-                "    [BATCH %d] size=%d tokens=%d model=%s",
-                batch_num,
-                len(batch),
-                approx_tokens,
-                self.model,
-            )
-            req_start = time.time()
-            payload = await self._request(batch)
-            req_elapsed = time.time() - req_start
-            logger.debug("    [BATCH %d] API request completed (%.2fs)", batch_num, req_elapsed)
-            batch_vectors = _parse_openai_embeddings_response(payload, n_expected=len(batch))
-            if batch_vectors:
-                dims_seen.add(len(batch_vectors[0]))
-            logger.info(
-                "    [BATCH %d] output_vectors=%d dim=%s",
-                batch_num,
-                len(batch_vectors),
-                len(batch_vectors[0]) if batch_vectors else 0,
-            )
-            vectors.extend(batch_vectors)
-        
+        total_tokens = sum(self.token_counter.count(t) for batch in batches for t in batch)
+        if self.max_in_flight <= 1 or len(batches) == 1:
+            results = [
+                await self._embed_batch(batch_num, batch)
+                for batch_num, batch in enumerate(batches, start=1)
+            ]
+        else:
+            results = await self._embed_concurrently(batches)
+
+        dims_seen = {len(r[0]) for r in results if len(r)}
+        vectors: Sequence[Sequence[float]]
+        if _HAS_NUMPY and len(dims_seen) == 1 and all(isinstance(r, np.ndarray) for r in results):
+            # Keep the decoded float32 matrices as one matrix, no per-float work.
+            vectors = results[0] if len(results) == 1 else np.concatenate(results)
+        else:
+            vectors = [v for r in results for v in r]
+        if spans is not None:
+            pooled = [
+                vectors[a]
+                if b - a == 1
+                else _pool_vectors(
+                    vectors[a:b], [self.token_counter.count(t) for t in inputs[a:b]]
+                )
+                for a, b in spans
+            ]
+            vectors = np.stack(pooled) if _HAS_NUMPY and isinstance(vectors, np.ndarray) else pooled
+
         embed_elapsed = time.time() - embed_start_time
         dim_summary = ",".join(str(d) for d in sorted(dims_seen)) if dims_seen else "0"
         logger.info(
@@ -380,3 +685,178 @@ class OpenAICompatibleEmbedder:
             embed_elapsed,
         )
         return vectors
+
+
+def embedder_from_env() -> Embedder:
+    """Embedder selected by EMBEDDING_BACKEND: "openai" (default) or "local".
+
+    "local" runs an ONNX model in-process (`local_embedding.OnnxEmbedder`),
+    configured by the LOCAL_EMBEDDING_* variables.
+    """
+
+    backend = (os.environ.get("EMBEDDING_BACKEND") or "openai").strip().lower()
+    if backend == "local":
+        from .local_embedding import OnnxEmbedder
+
+        return OnnxEmbedder.from_env()
+    if backend != "openai":
+        raise EmbeddingError(f"Unknown EMBEDDING_BACKEND: {backend!r}")
+    return OpenAICompatibleEmbedder.from_env()
+
+
+class EmbeddingCoalescer:
+    """Merge `embed()` calls from many callers into full embedding requests.
+
+    Indexing embeds each file's chunks separately, so a repo of small files
+    turns into thousands of tiny requests. The coalescer queues texts from all
+    concurrent callers and sends them to the wrapped embedder in batches built
+    by `_create_token_aware_batches`. A batch is sent once it reaches
+    `batch_size` texts or `token_limit` tokens, or `max_wait_s`
+    after its first text was queued. Each caller gets back exactly its own
+    vectors, in order.
+
+    `batch_size` / `token_limit` / `token_counter` default to the wrapped
+    embedder's attributes of the same name, so every coalesced batch maps to
+    a single request. Inputs over `token_limit` are rejected only if the
+    embedder's `oversize` policy is "error"; otherwise they travel in a batch
+    of their own and the embedder truncates or splits them.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        *,
+        batch_size: Optional[int] = None,
+        token_limit: Optional[int] = None,
+        max_wait_s: float = 0.05,
+        max_in_flight: int = 4,
+        token_counter: Optional[TokenCounter] = None,
+    ) -> None:
+        if batch_size is None:
+            batch_size = int(getattr(embedder, "batch_size", None) or 128)
+        if token_limit is None:
+            token_limit = getattr(embedder, "token_limit", None)
+        if token_counter is None:
+            token_counter = getattr(embedder, "token_counter", None) or EstimatingTokenCounter()
+        if batch_size <= 0:
+            raise ValueError("batch_size must be > 0")
+        if max_in_flight <= 0:
+            raise ValueError("max_in_flight must be > 0")
+
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.token_limit = token_limit
+        self.token_counter = token_counter
+        self.oversize = str(getattr(embedder, "oversize", "error"))
+        self.max_wait_s = max_wait_s
+        self.max_in_flight = max_in_flight
+
+        # Counters, for logs and tests.
+        self.requests = 0
+        self.texts = 0
+
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight: set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def embed(self, texts: Sequence[str]) -> list[Sequence[float]]:
+        if not texts:
+            return []
+
+        token_counts = [self.token_counter.count(t) for t in texts]
+        if (
+            self.token_limit
+            and self.oversize == "error"
+            and max(token_counts) > self.token_limit
+        ):
+            # Fail only this caller instead of the whole shared batch.
+            raise EmbeddingError(
+                f"Single input exceeds token limit ({self.token_limit} tokens)."
+            )
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in texts]
+        self._pending.extend(zip(texts, futures))
+        self._pending_tokens += sum(token_counts)
+
+        if len(self._pending) >= self.batch_size or (
+            self.token_limit and self._pending_tokens >= self.token_limit
+        ):
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_s, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        self._pending_tokens = 0
+        # Drop texts whose caller already went away (cancelled or failed).
+        pending = [(t, f) for t, f in pending if not f.done()]
+        if not pending:
+            return
+
+        texts = [t for t, _ in pending]
+        batches = _create_token_aware_batches(
+            texts,
+            batch_size=self.batch_size,
+            token_limit=self.token_limit,
+            counter=self.token_counter,
+            oversize=self.oversize,
+        )
+        offset = 0
+        for batch in batches:
+            futures = [f for _, f in pending[offset : offset + len(batch)]]
+            offset += len(batch)
+            task = asyncio.ensure_future(self._send(batch, futures))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, batch: list[str], futures: list[asyncio.Future]) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        try:
+            async with self._semaphore:
+                self.requests += 1
+                self.texts += len(batch)
+                logger.debug("[EMBED_COALESCE] sending %d texts", len(batch))
+                vectors = await self.embedder.embed(batch)
+            if len(vectors) != len(batch):
+                raise EmbeddingError(
+                    f"Embedder returned {len(vectors)} vectors for {len(batch)} texts"
+                )
+        except BaseException as e:
+            for fut in futures:
+                if not fut.done():
+                    fut.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        for fut, vec in zip(futures, vectors):
+            if not fut.done():
+                fut.set_result(vec)
+
+    async def flush(self) -> None:
+        """Send everything queued so far and wait for in-flight requests."""
+
+        self._flush()
+        while self._in_flight:
+            await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.flush()
+        logger.info(
+            "[EMBED_COALESCE] %d texts sent in %d request(s)", self.texts, self.requests
+        )
+        close_fn = getattr(self.embedder, "close", None)
+        if close_fn is None:
+            return
+        if asyncio.iscoroutinefunction(close_fn):
+            await close_fn()
+        else:
+            close_fn()
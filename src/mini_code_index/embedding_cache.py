@@ -0,0 +1,256 @@
+"""Content-addressed, persistent embedding cache.
+
+Re-indexing a changed file re-embeds every chunk of it, although most chunks
+(and the synthetic `relpath` / `scope_path` chunks) are byte-identical to the
+previous version. `CachedEmbedder` sits in front of any `Embedder` and only
+sends cache misses to it.
+
+Vectors live in a single SQLite file keyed by sha256(model, dimensions, text),
+so the cache is shared safely between collections and repos. It is bounded by
+`max_entries` with least-recently-used eviction.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from typing import Iterable, Optional, Sequence
+
+from .embedding import _HAS_NUMPY, Embedder, np
+from .manifest import default_manifest_dir
+
+logger = logging.getLogger(__name__)
+
+# Fraction of `max_entries` kept after an eviction pass, so evictions are
+# amortized instead of running on every insert once the cache is full.
+_EVICT_TO = 0.9
+
+
+def default_embedding_cache_path() -> str:
+    return os.path.join(default_manifest_dir(), "embeddings.sqlite")
+
+
+def cache_key(text: str, *, model: str, dimensions: Optional[int]) -> bytes:
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(str(dimensions or "").encode("ascii"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8", "surrogatepass"))
+    return h.digest()
+
+
+def _encode(vector: Sequence[float]) -> bytes:
+    # Blobs are little-endian float32; float32 numpy rows from the embedder
+    # are already in that layout and are not copied.
+    if _HAS_NUMPY:
+        return np.asarray(vector, dtype="<f4").tobytes()
+    packed = array("f", vector)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _decode(blob: bytes) -> Sequence[float]:
+    if _HAS_NUMPY:
+        return np.frombuffer(blob, dtype="<f4")
+    vec = array("f")
+    vec.frombytes(blob)
+    if sys.byteorder != "little":
+        vec.byteswap()
+    return vec.tolist()
+
+
+class EmbeddingCache:
+    """SQLite-backed key -> vector map with LRU eviction.
+
+    Vectors are stored as little-endian float32 and read back as float32
+    numpy arrays when numpy is available. Methods are synchronous and thread-safe;
+    async callers should run them via `asyncio.to_thread`.
+    """
+
+    def __init__(self, path: str, *, max_entries: int = 200_000) -> None:
+        if max_entries <= 0:
+            raise ValueError("max_entries must be > 0")
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        # Row count kept in memory so inserts don't scan the table. Other
+        # processes sharing the file can make it drift low; it is re-counted
+        # exactly before every eviction.
+        self._count = self._count_rows()
+
+    def _count_rows(self) -> int:
+        return int(self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count_rows()
+
+    def get_many(self, keys: Sequence[bytes]) -> dict[bytes, Sequence[float]]:
+        found: dict[bytes, Sequence[float]] = {}
+        if not keys:
+            return found
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for i in range(0, len(unique), 500):
+                page = unique[i : i + 500]
+                marks = ",".join("?" * len(page))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", page
+                ).fetchall()
+                for key, blob in rows:
+                    found[bytes(key)] = _decode(blob)
+            if found:
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items: Iterable[tuple[bytes, Sequence[float]]]) -> None:
+        now = time.time_ns()
+        rows = [(k, _encode(v), now) for k, v in items]
+        if not rows:
+            return
+        with self._lock:
+            # INSERT OR IGNORE so `rowcount` is the number of new keys; keys
+            # that were already present are overwritten separately.
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            ).rowcount
+            if inserted < len(rows):
+                self._conn.executemany(
+                    "UPDATE embeddings SET vector = ?, last_used = ? WHERE key = ?",
+                    [(blob, used, k) for k, blob, used in rows],
+                )
+            self._count += max(0, inserted)
+            if self._count > self.max_entries:
+                self._count = self._count_rows()
+            if self._count > self.max_entries:
+                excess = self._count - int(self.max_entries * _EVICT_TO)
+                evicted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (excess,),
+                ).rowcount
+                self._count -= max(0, evicted)
+                logger.debug("[EMBED_CACHE] evicted %d entries", evicted)
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbedder:
+    """Embedder wrapper that answers repeated texts from an `EmbeddingCache`.
+
+    `model` / `dimensions` default to the wrapped embedder's attributes and
+    are part of the cache key, so switching models never returns stale
+    vectors. Duplicate texts within one call are embedded once.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        cache: EmbeddingCache,
+        *,
+        model: Optional[str] = None,
+        dimensions: Optional[int] = None,
+    ) -> None:
+        self.embedder = embedder
+        self.cache = cache
+        self.model = model if model is not None else str(getattr(embedder, "model", "") or "")
+        self.dimensions = dimensions if dimensions is not None else getattr(embedder, "dimensions", None)
+
+    @property
+    def batch_size(self) -> Optional[int]:
+        return getattr(self.embedder, "batch_size", None)
+
+    @property
+    def token_limit(self) -> Optional[int]:
+        return getattr(self.embedder, "token_limit", None)
+
+    async def embed(self, texts: Sequence[str]) -> Sequence[Sequence[float]]:
+        if not texts:
+            return []
+
+        keys = [cache_key(t, model=self.model, dimensions=self.dimensions) for t in texts]
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+
+        missing: dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = await self.embedder.embed(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self.cache.put_many, fresh.items())
+            cached.update(fresh)
+
+        logger.debug(
+            "[EMBED_CACHE] texts=%d hits=%d misses=%d",
+            len(texts),
+            len(texts) - len(missing),
+            len(missing),
+        )
+        rows = [cached[k] for k in keys]
+        if not _HAS_NUMPY:
+            return rows
+        # One float32 matrix whether a row came from the cache or the
+        # embedder, so the store always receives the same type.
+        out = np.empty((len(rows), len(rows[0])), dtype=np.float32)
+        for i, row in enumerate(rows):
+            out[i] = row
+        return out
+
+    async def close(self) -> None:
+        logger.info(
+            "[EMBED_CACHE] hits=%d misses=%d path=%s",
+            self.cache.hits,
+            self.cache.misses,
+            self.cache.path,
+        )
+        try:
+            close_fn = getattr(self.embedder, "close", None)
+            if close_fn is not None:
+                if asyncio.iscoroutinefunction(close_fn):
+                    await close_fn()
+                else:
+                    close_fn()
+        finally:
+            self.cache.close()
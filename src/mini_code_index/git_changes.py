@@ -0,0 +1,171 @@
+"""Git-aware change detection.
+
+For a root inside a git working tree, the set of files that may differ from
+what was indexed at commit `C` is:
+
+- `git diff --name-status C..HEAD` (committed changes since the last run),
+- `git status` (staged, unstaged and untracked files right now),
+- the files that were dirty at the last run (they may since have been
+  reverted, which neither of the above reports).
+
+`index_directory(..., cfg.change_detection="git")` indexes only that set, so a
+re-index after a pull costs time proportional to the diff. Whenever history
+is unavailable (not a repo, unknown or garbage-collected commit, shallow
+clone, git missing) callers fall back to the full scan.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+from dataclasses import dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Don't carry more than this many dirty paths between runs; beyond it a full
+# scan is cheaper than shipping the list around in collection metadata.
+MAX_DIRTY_PATHS = 1000
+
+
+class GitError(RuntimeError):
+    pass
+
+
+def _git(cwd: str, *args: str) -> str:
+    try:
+        proc = subprocess.run(
+            ["git", "-C", cwd, *args],
+            capture_output=True,
+            check=False,
+        )
+    except OSError as e:
+        raise GitError(f"git is not available: {e}") from e
+    if proc.returncode != 0:
+        raise GitError(proc.stderr.decode("utf-8", "replace").strip() or f"git {args[0]} failed")
+    return proc.stdout.decode("utf-8", "surrogateescape")
+
+
+def git_toplevel(root: str) -> Optional[str]:
+    try:
+        return _git(root, "rev-parse", "--show-toplevel").strip() or None
+    except GitError:
+        return None
+
+
+def head_commit(root: str) -> Optional[str]:
+    try:
+        return _git(root, "rev-parse", "--verify", "-q", "HEAD^{commit}").strip() or None
+    except GitError:
+        return None
+
+
+def _under(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def _paths_under(toplevel: str, rel_paths: list[str], root: str) -> list[str]:
+    """Repo paths (relative to `toplevel`) that lie under `root`, as absolute
+    paths under `os.path.abspath(root)`.
+
+    `git rev-parse --show-toplevel` resolves symlinks while the scanner keeps
+    the root as given, so the comparison is done on real paths and matches
+    are re-anchored under the root the caller passed in.
+    """
+
+    root = os.path.abspath(root)
+    real_root = os.path.realpath(root)
+    real_top = os.path.realpath(toplevel)
+    out: list[str] = []
+    for rel in rel_paths:
+        path = os.path.join(real_top, rel)
+        if _under(path, real_root):
+            out.append(os.path.normpath(os.path.join(root, os.path.relpath(path, real_root))))
+    return out
+
+
+def _diff_paths(toplevel: str, since: str, head: str) -> list[str]:
+    out = _git(toplevel, "diff", "--name-status", "--no-renames", "-z", f"{since}..{head}")
+    tokens = out.split("\0")
+    paths: list[str] = []
+    # Pairs of (status, path).
+    for i in range(0, len(tokens) - 1, 2):
+        paths.append(tokens[i + 1])
+    return paths
+
+
+def _dirty_paths(toplevel: str) -> list[str]:
+    out = _git(
+        toplevel,
+        "status",
+        "--porcelain=v1",
+        "-z",
+        "--untracked-files=all",
+        "--no-renames",
+    )
+    # Entries are "XY path", NUL-terminated.
+    return [entry[3:] for entry in out.split("\0") if len(entry) > 3]
+
+
+@dataclass
+class GitChangeSet:
+    # Commit the working tree was at when the change set was computed.
+    head: str
+    # Absolute paths (under the root) to re-check: changed, added or deleted.
+    paths: list[str] = field(default_factory=list)
+    # Absolute paths dirty right now; recorded so the next run re-checks them.
+    dirty: list[str] = field(default_factory=list)
+
+
+def current_state(root: str) -> Optional[GitChangeSet]:
+    """HEAD plus the current dirty set, or None outside a usable repo."""
+
+    root = os.path.abspath(root)
+    toplevel = git_toplevel(root)
+    if toplevel is None:
+        return None
+    head = head_commit(toplevel)
+    if head is None:
+        return None
+    try:
+        dirty = _paths_under(toplevel, _dirty_paths(toplevel), root)
+    except GitError as e:
+        logger.info("git status failed: %s", e)
+        return None
+    return GitChangeSet(head=head, paths=list(dirty), dirty=dirty)
+
+
+def changes_since(
+    root: str,
+    since_commit: Optional[str],
+    *,
+    previously_dirty: Optional[list[str]] = None,
+) -> Optional[GitChangeSet]:
+    """Paths under `root` that may have changed since `since_commit`.
+
+    Returns None when the answer can't be trusted; use a full scan then.
+    """
+
+    if not since_commit:
+        return None
+    state = current_state(root)
+    if state is None:
+        return None
+    root = os.path.abspath(root)
+    toplevel = git_toplevel(root)
+    assert toplevel is not None
+    try:
+        _git(toplevel, "cat-file", "-e", f"{since_commit}^{{commit}}")
+        committed = _paths_under(toplevel, _diff_paths(toplevel, since_commit, state.head), root)
+    except GitError as e:
+        logger.info("git history unavailable since %s: %s", since_commit[:12], e)
+        return None
+
+    paths: dict[str, None] = dict.fromkeys(committed + state.dirty)
+    for p in previously_dirty or []:
+        # Recorded by an earlier run, already under the caller's root.
+        if _under(p, root):
+            paths[p] = None
+    state.paths = list(paths)
+    return state
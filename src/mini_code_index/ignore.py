@@ -0,0 +1,280 @@
+"""`.gitignore`-style ignore files for directory scans.
+
+Scans honor the ignore files found in the tree, using gitignore syntax:
+
+- `.gitignore` and `.ignore` (the files git, ripgrep and friends read), plus
+  `.git/info/exclude` at the root,
+- `.mciignore`, for paths that should stay in git but out of the index
+  (generated code, vendored trees, fixtures).
+
+Each file applies to its own directory and everything below it; deeper files
+and later lines take precedence, `!pattern` re-includes. As in git, a file
+inside an ignored directory can't be re-included: scans prune ignored
+directories before descending into them.
+
+Rules are compiled once per directory and cached by the (mtime, size) of the
+ignore files, so repeated scans (watch mode, incremental runs) only re-parse
+files that changed.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from typing import Iterable, Iterator, Optional, Pattern, Sequence
+
+from .pathfilter import glob_to_regex
+
+IGNORE_FILE_NAMES: tuple[str, ...] = (".gitignore", ".ignore", ".mciignore")
+
+# Upper bound on cached directories; the cache is simply reset when exceeded.
+_MAX_CACHED_DIRS = 16_384
+
+
+class IgnoreRules:
+    """The compiled rules of one directory, in file order."""
+
+    __slots__ = ("_rules", "_any")
+
+    def __init__(self, rules: Sequence[tuple[Pattern[str], bool, bool]]) -> None:
+        # (regex, negate, dir_only)
+        self._rules = tuple(rules)
+        # One combined regex rejects most paths without looking at every rule.
+        self._any = re.compile("|".join(f"(?:{r.pattern})" for r, _, _ in self._rules), re.DOTALL)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def match(self, rel_posix: str, is_dir: bool) -> Optional[bool]:
+        """True (ignored), False (re-included by `!`) or None (no rule matches).
+
+        `rel_posix` is relative to the directory holding the rules.
+        """
+
+        if self._any.fullmatch(rel_posix) is None:
+            return None
+        for regex, negate, dir_only in reversed(self._rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(rel_posix):
+                return not negate
+        return None
+
+
+def _parse_line(line: str) -> Optional[tuple[Pattern[str], bool, bool]]:
+    # Trailing spaces are dropped unless escaped with a backslash.
+    while line.endswith(" ") and not line.endswith("\\ "):
+        line = line[:-1]
+    if not line or line.startswith("#"):
+        return None
+    negate = False
+    if line.startswith("!"):
+        negate = True
+        line = line[1:]
+    elif line.startswith(("\\!", "\\#")):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # A slash anywhere but at the end anchors the pattern to the directory of
+    # the ignore file; otherwise it matches a name at any depth.
+    anchored = "/" in line
+    try:
+        regex = re.compile(glob_to_regex(line, anchored=anchored), re.DOTALL)
+    except re.error:
+        return None
+    return regex, negate, dir_only
+
+
+def parse_ignore_lines(lines: Iterable[str]) -> Optional[IgnoreRules]:
+    rules = [r for r in (_parse_line(line.rstrip("\r\n")) for line in lines) if r is not None]
+    return IgnoreRules(rules) if rules else None
+
+
+def _read_rules(paths: Sequence[str]) -> Optional[IgnoreRules]:
+    lines: list[str] = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lines.extend(f.read().splitlines())
+        except OSError:
+            continue
+    return parse_ignore_lines(lines)
+
+
+# dir -> (signature of its ignore files, compiled rules)
+_DIR_CACHE: dict[tuple[str, tuple[str, ...]], tuple[tuple, Optional[IgnoreRules]]] = {}
+_DIR_CACHE_LOCK = threading.Lock()
+
+
+def _cached_rules(key: tuple[str, tuple[str, ...]], paths: Sequence[str]) -> Optional[IgnoreRules]:
+    signature: list[tuple[str, int, int]] = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, int(st.st_mtime_ns), int(st.st_size)))
+    if not signature:
+        return None
+    sig = tuple(signature)
+    with _DIR_CACHE_LOCK:
+        hit = _DIR_CACHE.get(key)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    rules = _read_rules([p for p, _, _ in signature])
+    with _DIR_CACHE_LOCK:
+        if len(_DIR_CACHE) >= _MAX_CACHED_DIRS:
+            _DIR_CACHE.clear()
+        _DIR_CACHE[key] = (sig, rules)
+    return rules
+
+
+def load_dir_rules(
+    dir_path: str,
+    names: Sequence[str] = IGNORE_FILE_NAMES,
+    *,
+    present: Optional[Iterable[str]] = None,
+) -> Optional[IgnoreRules]:
+    """Compiled rules of the ignore files directly in `dir_path`, or None.
+
+    `present` (names seen while listing the directory) saves the stat calls
+    for ignore files that don't exist.
+    """
+
+    if present is not None:
+        present = set(present)
+        names = tuple(n for n in names if n in present)
+        if not names:
+            return None
+    return _cached_rules(
+        (dir_path, tuple(names)), [os.path.join(dir_path, n) for n in names]
+    )
+
+
+class IgnoreStack:
+    """Ignore rules in effect inside one directory: its own plus its ancestors'.
+
+    Scans push one node per directory that has rules; directories without
+    ignore files share their parent's node.
+    """
+
+    __slots__ = ("parent", "prefix", "rules", "names")
+
+    def __init__(
+        self,
+        parent: Optional["IgnoreStack"],
+        prefix: str,
+        rules: Optional[IgnoreRules],
+        names: Sequence[str],
+    ) -> None:
+        self.parent = parent
+        # Posix path of the rules' directory relative to the root, with a
+        # trailing "/" (or "" for the root).
+        self.prefix = prefix
+        self.rules = rules
+        self.names = tuple(names)
+
+    @classmethod
+    def for_root(cls, root: str, names: Sequence[str] = IGNORE_FILE_NAMES) -> "IgnoreStack":
+        stack = cls(None, "", None, names)
+        if ".gitignore" in names:
+            exclude = _cached_rules(
+                (os.path.join(root, ".git"), ("info/exclude",)),
+                [os.path.join(root, ".git", "info", "exclude")],
+            )
+            if exclude is not None:
+                stack = cls(stack, "", exclude, names)
+        return stack.child(root, "")
+
+    def child(
+        self, dir_path: str, rel_dir: str, *, present: Optional[Iterable[str]] = None
+    ) -> "IgnoreStack":
+        """The stack for directory `dir_path` (posix `rel_dir` from the root)."""
+
+        rules = load_dir_rules(dir_path, self.names, present=present)
+        if rules is None:
+            return self
+        return IgnoreStack(self, f"{rel_dir}/" if rel_dir else "", rules, self.names)
+
+    def ignored(self, rel_posix: str, is_dir: bool = False) -> bool:
+        """Whether `rel_posix` (relative to the root) is ignored.
+
+        Only the path itself is checked; callers walking the tree prune
+        ignored directories, `is_ignored` also checks the ancestors.
+        """
+
+        node: Optional[IgnoreStack] = self
+        while node is not None:
+            if node.rules is not None and rel_posix.startswith(node.prefix):
+                verdict = node.rules.match(rel_posix[len(node.prefix) :], is_dir)
+                if verdict is not None:
+                    return verdict
+            node = node.parent
+        return False
+
+
+def is_ignored(
+    root: str, rel_posix: str, *, is_dir: bool = False, names: Sequence[str] = IGNORE_FILE_NAMES
+) -> bool:
+    """Whether a single path below `root` is ignored, itself or via an ancestor.
+
+    Works for paths that no longer exist (their ancestors' rules still apply).
+    """
+
+    parts = [p for p in rel_posix.split("/") if p]
+    if not parts:
+        return False
+    stack = IgnoreStack.for_root(root, names)
+    dir_path = root
+    rel = ""
+    for part in parts[:-1]:
+        rel = f"{rel}/{part}" if rel else part
+        if stack.ignored(rel, True):
+            return True
+        dir_path = os.path.join(dir_path, part)
+        stack = stack.child(dir_path, rel)
+    return stack.ignored("/".join(parts), is_dir)
+
+
+def iter_unignored_files(
+    root: str, *, names: Sequence[str] = IGNORE_FILE_NAMES
+) -> Iterator[tuple[str, str]]:
+    """Yield (absolute path, posix rel path) of every non-ignored file.
+
+    Ignored directories and `.git` are pruned before descending into them;
+    symlinked directories are not followed.
+    """
+
+    root = os.path.abspath(root)
+    stack: list[tuple[str, str, IgnoreStack]] = [(root, "", IgnoreStack.for_root(root, names))]
+    while stack:
+        dir_path, rel_dir, rules = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        if rel_dir:
+            rules = rules.child(dir_path, rel_dir, present=[e.name for e in entries])
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        subdirs: list[tuple[str, str, IgnoreStack]] = []
+        for entry in entries:
+            rel = prefix + entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if rules.ignored(rel, is_dir):
+                continue
+            if is_dir:
+                if entry.name != ".git":
+                    subdirs.append((entry.path, rel, rules))
+                continue
+            yield entry.path, rel
+        stack.extend(reversed(subdirs))
+
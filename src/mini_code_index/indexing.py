@@ -1,38 +1,47 @@
 from __future__ import annotations
 
 import asyncio
-import fnmatch
+import itertools
 import json
 import hashlib
 import logging
+import mmap
 import os
 import time
 import uuid
-from dataclasses import dataclass, field
-from typing import Any, Iterable, Iterator, List, Optional, Sequence
-
-from .chunking import Chunk, Config as ChunkConfig, TreeSitterChunker, format_scope, ScopeKind
-from .db import VectorStore
-from .embedding import Embedder
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Union
+
+from .chunk_pool import ProcessChunkPool
+from .chunking import Chunk, Config as ChunkConfig, format_scope, ScopeKind, shared_chunker
+from .db import VectorStore, _collection_name_for_root
+from .embedding import Embedder, EmbeddingCoalescer
+from .embedding_cache import CachedEmbedder, EmbeddingCache, default_embedding_cache_path
 from .logging_utils import setup_logging
+from .git_changes import MAX_DIRTY_PATHS, GitChangeSet, changes_since, current_state
+from .ignore import IGNORE_FILE_NAMES, IgnoreStack, is_ignored
+from .pathfilter import PathMatcher, compile_path_matcher
+from .manifest import MANIFEST_TOKEN_KEY, FileManifest, ManifestEntry, default_manifest_path
+from .pipeline import Emit, PipelineConfig, Stage, run_pipeline
+from .tree_cache import TreeCache
 
 logger = logging.getLogger(__name__)
 
+# Chunks a streamed file holds back while it is unknown whether their scope
+# was split across several chunks (see `_GroupLinker`).
+_GROUP_LOOKBEHIND = 64
 
-def _hash_file_sha256_sync(path: str) -> str:
-    hasher = hashlib.sha256()
-    with open(path, "rb") as f:
-        for block in iter(lambda: f.read(8192), b""):
-            hasher.update(block)
-    return hasher.hexdigest()
-
-
-async def _hash_file_sha256(path: str) -> str:
-    return await asyncio.to_thread(_hash_file_sha256_sync, path)
 
+def _chunk_id(*, rel_path: str, chunk_kind: str, scope_path_str: str, text: str) -> str:
+    """Deterministic chunk id: the same chunk of the same file keeps its id
+    across re-indexes, so only chunks that actually changed are rewritten."""
 
-def _new_id() -> str:
-    return uuid.uuid4().hex
+    h = hashlib.sha256()
+    for part in (rel_path, chunk_kind, scope_path_str, text):
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+    return h.hexdigest()[:32]
 
 
 _BINARY_EXTENSIONS = {
@@ -79,28 +88,15 @@ _BINARY_EXTENSIONS = {
 }
 
 
-def _is_probably_text_file_sync(
-    path: str, *, chunk_cfg: ChunkConfig, sample_size: int = 8192
-) -> bool:
-    """Heuristic filter to skip binary files.
+def _looks_like_text(sample: bytes, *, chunk_cfg: ChunkConfig) -> bool:
+    """Heuristic filter to skip binary files, run on the first bytes of a file.
 
-    We keep this simple and fast:
-    - common binary extensions
+    We keep this simple and fast (binary extensions are checked by callers):
     - NUL byte check
     - best-effort decode using configured encoding (or charset-normalizer in _auto)
     - control-character ratio heuristic
     """
 
-    ext = os.path.splitext(path)[1].lower()
-    if ext in _BINARY_EXTENSIONS:
-        return False
-
-    try:
-        with open(path, "rb") as f:
-            sample = f.read(sample_size)
-    except OSError:
-        return False
-
     if not sample:
         return True
     if b"\x00" in sample:
@@ -137,12 +133,47 @@ def _is_probably_text_file_sync(
     return True
 
 
-async def _is_probably_text_file(
-    path: str, *, chunk_cfg: ChunkConfig, sample_size: int = 8192
-) -> bool:
-    return await asyncio.to_thread(
-        _is_probably_text_file_sync, path, chunk_cfg=chunk_cfg, sample_size=sample_size
-    )
+# Files at least this large are memory-mapped instead of read: sniffing and
+# hashing then run straight on the page cache, without a heap copy.
+_MMAP_THRESHOLD = 1 << 20
+_SNIFF_SIZE = 8192
+
+FileData = Union[bytes, mmap.mmap]
+
+
+def _read_file_sync(path: str, size: int) -> FileData:
+    with open(path, "rb") as f:
+        if size >= _MMAP_THRESHOLD:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                pass
+        return f.read()
+
+
+def _close_file_data(data: Optional[FileData]) -> None:
+    """Unmap a buffer from `_read_file_sync` now rather than whenever it is collected."""
+
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+
+def _ingest_file_sync(
+    path: str, *, size: int, chunk_cfg: ChunkConfig
+) -> Optional[tuple[FileData, str]]:
+    """Read a file once; sniff and hash it from that buffer.
+
+    Returns (content, sha256), or None for binary files. The content is kept
+    for chunking, so a changed file is opened exactly once per run.
+    """
+
+    if os.path.splitext(path)[1].lower() in _BINARY_EXTENSIONS:
+        return None
+    data = _read_file_sync(path, size)
+    if not _looks_like_text(data[:_SNIFF_SIZE], chunk_cfg=chunk_cfg):
+        _close_file_data(data)
+        return None
+    return data, hashlib.sha256(data).hexdigest()
 
 
 @dataclass
@@ -169,67 +200,343 @@ class IndexConfig:
         ]
     )
 
+    # Ignore files (gitignore syntax) honored during scans, nested ones
+    # included; see `ignore.py`. An empty list disables them.
+    ignore_files: List[str] = field(default_factory=lambda: list(IGNORE_FILE_NAMES))
+
     # When True, we still do chunk+embed, but we don't write to the backend.
     dry_run: bool = True
 
+    # Local file manifest used to skip unchanged files from stat() alone.
+    # None -> stored next to the collection (see `manifest.default_manifest_path`);
+    # stores without a named collection get no manifest.
+    use_manifest: bool = True
+    manifest_path: Optional[str] = None
+
+    # Persistent content-addressed embedding cache shared by all collections.
+    # None -> `embedding_cache.default_embedding_cache_path()`. Only used when
+    # the embedder exposes a `model` attribute (part of the cache key).
+    use_embedding_cache: bool = True
+    embedding_cache_path: Optional[str] = None
+    embedding_cache_max_entries: int = 200_000
+
+    # How a full run finds work:
+    # - "scan": walk the tree and stat/hash every candidate file
+    # - "git": ask git what changed since the last indexed commit (stored with
+    #   the collection); falls back to "scan" when history is unavailable.
+    #   Changes to git-ignored files are not seen in this mode.
+    change_detection: str = "scan"
+
+    def __post_init__(self) -> None:
+        if self.change_detection not in {"scan", "git"}:
+            raise ValueError('change_detection must be "scan" or "git"')
+
 
 @dataclass
 class IndexStats:
     files_seen: int = 0
     files_indexed: int = 0
     chunks_emitted: int = 0
+    files_unchanged: int = 0
+    # Paths removed from the store (only for runs with explicit `paths`).
+    files_deleted: int = 0
+    # Chunks that were (re)embedded / removed; chunks_emitted - chunks_embedded
+    # were kept as-is and only had their metadata refreshed.
+    chunks_embedded: int = 0
+    chunks_deleted: int = 0
+    embedding_cache_hits: int = 0
+    embedding_cache_misses: int = 0
 
 
-def iter_candidate_files(cfg: IndexConfig) -> Iterator[str]:
+@dataclass
+class _FileJob:
+    """One file flowing through the indexing pipeline.
+
+    Fields are filled in stage by stage: scan (stat/content/sha256), lookup
+    (existing_sha), chunk (payloads) and embed (embeddings).
+    """
+
+    file_path: str
+    rel_path: str
+    stat: os.stat_result
+    read_started_ns: int
+    config_changed: bool = False
+    sha256: str = ""
+    # File content read by the scan stage; released once chunked.
+    data: Optional[FileData] = None
+    existing_sha: Optional[str] = None
+    texts: list[str] = field(default_factory=list)
+    ids: list[str] = field(default_factory=list)
+    metadatas: list[dict[str, Any]] = field(default_factory=list)
+    # Chunk diff against the store: indices into texts/ids/metadatas that
+    # must be embedded + upserted, and stored ids that no longer exist.
+    new_idx: list[int] = field(default_factory=list)
+    stale_ids: list[str] = field(default_factory=list)
+    # Vectors for `new_idx`, in the same order.
+    embeddings: list[Sequence[float]] = field(default_factory=list)
+    started_at: float = 0.0
+    embed_elapsed: float = 0.0
+
+
+async def _resolve_manifest(
+    cfg: IndexConfig, store: Optional[VectorStore]
+) -> Optional[FileManifest]:
+    """Load the manifest for this run, or return None when it doesn't apply.
+
+    The manifest mirrors what was written to the store, so it is only used for
+    real (non dry-run) runs against a store with a stable collection identity
+    and index state to bind the manifest to (see `FileManifest.bind`).
+    """
+
+    if cfg.dry_run or not cfg.use_manifest or store is None:
+        return None
+    if not hasattr(store, "get_index_state"):
+        return None
+    path = cfg.manifest_path
+    if path is None:
+        if not hasattr(store, "collection_name"):
+            return None
+        name = getattr(store, "collection_name", None) or _collection_name_for_root(cfg.root_dir)
+        path = default_manifest_path(name)
+
+    state = await store.get_index_state()
+    token = str(state.get(MANIFEST_TOKEN_KEY) or "")
+    if not token:
+        # First run against this collection (or it was reset): mint a new
+        # identity so manifests written for any earlier store stop matching.
+        token = uuid.uuid4().hex
+        await store.set_index_state(state={MANIFEST_TOKEN_KEY: token})
+    manifest = FileManifest.load(path)
+    manifest.bind(token)
+    return manifest
+
+
+async def _plan_git_run(
+    cfg: IndexConfig, store: VectorStore, chunk_fingerprint: str
+) -> tuple[Optional[GitChangeSet], Optional[list[str]]]:
+    """Return (git state to record after the run, paths to index or None for a full scan)."""
+
+    state = await store.get_index_state()
+    try:
+        previously_dirty = list(json.loads(state.get("git_dirty") or "[]"))
+    except (TypeError, ValueError):
+        previously_dirty = []
+
+    changes: Optional[GitChangeSet] = None
+    if state.get("chunk_fingerprint") == chunk_fingerprint:
+        changes = await asyncio.to_thread(
+            changes_since,
+            cfg.root_dir,
+            state.get("git_commit") or None,
+            previously_dirty=previously_dirty,
+        )
+    if changes is not None:
+        logger.info(
+            "[GIT] %d path(s) changed since %s",
+            len(changes.paths),
+            str(state.get("git_commit"))[:12],
+        )
+        return changes, changes.paths
+
+    logger.info("[GIT] No usable index history; falling back to a full scan")
+    return await asyncio.to_thread(current_state, cfg.root_dir), None
+
+
+async def _record_git_run(
+    store: VectorStore, git_state: GitChangeSet, chunk_fingerprint: str
+) -> None:
+    commit = git_state.head
+    dirty = git_state.dirty
+    if len(dirty) > MAX_DIRTY_PATHS:
+        # Too many to carry over: make the next run a full scan instead.
+        commit, dirty = "", []
+    await store.set_index_state(
+        state={
+            "git_commit": commit,
+            "git_dirty": json.dumps(dirty, ensure_ascii=False),
+            "chunk_fingerprint": chunk_fingerprint,
+        }
+    )
+
+
+def _resolve_embedding_cache(
+    cfg: IndexConfig, embedder: Optional[Embedder]
+) -> Optional[EmbeddingCache]:
+    """Open the embedding cache, or return None when it doesn't apply.
+
+    Cache keys include the embedder's model name; embedders that don't expose
+    one can't be told apart, so they are never cached.
+    """
+
+    if cfg.dry_run or not cfg.use_embedding_cache or embedder is None:
+        return None
+    if not getattr(embedder, "model", None):
+        return None
+    return EmbeddingCache(
+        cfg.embedding_cache_path or default_embedding_cache_path(),
+        max_entries=cfg.embedding_cache_max_entries,
+    )
+
+
+def _path_matcher(cfg: IndexConfig) -> PathMatcher:
+    return compile_path_matcher(tuple(cfg.include_globs), tuple(cfg.exclude_globs))
+
+
+def is_candidate_path(cfg: IndexConfig, path: str) -> bool:
+    """Whether `path` falls under the root and passes the include/exclude rules.
+
+    Only the path itself is checked (not whether it exists), so this also works
+    for files that were just deleted.
+    """
+
     root = os.path.abspath(cfg.root_dir)
+    rel = os.path.relpath(os.path.abspath(path), root)
+    if rel == "." or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return False
+    parts = rel.split(os.sep)
+    if not cfg.recursive and len(parts) > 1:
+        return False
+    if not cfg.include_hidden and any(part.startswith(".") for part in parts):
+        return False
+    rel_posix = "/".join(parts)
+    if not _path_matcher(cfg).matches(rel_posix):
+        return False
+    return not (cfg.ignore_files and is_ignored(root, rel_posix, names=tuple(cfg.ignore_files)))
 
-    def matches_any(rel_posix: str, patterns: list[str]) -> bool:
-        """Match a posix-style relative path against glob-like patterns.
 
-        Notes:
-        - We use `fnmatch` for simplicity.
-        - Treat a leading '**/' as optional so patterns like '**/*' also match
-          root-level files (e.g. 'a.py').
-        """
+def is_candidate_dir(cfg: IndexConfig, path: str) -> bool:
+    """Whether a scan of the root would descend into directory `path`."""
 
-        for pat in patterns:
-            if fnmatch.fnmatch(rel_posix, pat):
-                return True
-            if pat.startswith("**/") and fnmatch.fnmatch(rel_posix, pat[3:]):
-                return True
+    root = os.path.abspath(cfg.root_dir)
+    rel = os.path.relpath(os.path.abspath(path), root)
+    if rel == "." or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return False
+    if not cfg.recursive:
         return False
+    parts = rel.split(os.sep)
+    if not cfg.include_hidden and any(part.startswith(".") for part in parts):
+        return False
+    rel_posix = "/".join(parts)
+    matcher = _path_matcher(cfg)
+    if any(matcher.excludes_dir("/".join(parts[: i + 1])) for i in range(len(parts))):
+        return False
+    return not (cfg.ignore_files and is_ignored(root, rel_posix, is_dir=True, names=tuple(cfg.ignore_files)))
 
-    def is_hidden_path(p: str) -> bool:
-        parts = os.path.relpath(p, root).split(os.sep)
-        return any(part.startswith(".") for part in parts if part not in (".", ".."))
-
-    if cfg.recursive:
-        for dirpath, dirnames, filenames in os.walk(root):
-            if not cfg.include_hidden:
-                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
-            for name in filenames:
-                path = os.path.join(dirpath, name)
-                if not cfg.include_hidden and is_hidden_path(path):
-                    continue
 
-                rel = os.path.relpath(path, root).replace(os.sep, "/")
-                if matches_any(rel, cfg.exclude_globs):
-                    continue
-                if not matches_any(rel, cfg.include_globs):
-                    continue
+def _ignore_stack_for_dir(cfg: IndexConfig, root: str, rel_dir: str) -> IgnoreStack:
+    """Rules in effect in the parent of `rel_dir`, for a scan starting there."""
+
+    stack = IgnoreStack.for_root(root, tuple(cfg.ignore_files))
+    parts = rel_dir.split("/") if rel_dir else []
+    dir_path = root
+    for i, part in enumerate(parts[:-1]):
+        dir_path = os.path.join(dir_path, part)
+        stack = stack.child(dir_path, "/".join(parts[: i + 1]))
+    return stack
+
+
+def iter_candidate_files(cfg: IndexConfig) -> Iterator[str]:
+    """Yield indexable files under `cfg.root_dir`.
+
+    Traversal uses `os.scandir` (file/dir type comes from the directory entry,
+    no extra stat) and builds relative paths incrementally. Hidden, excluded
+    (exclude globs ending in `/**`) and ignored (`cfg.ignore_files`)
+    directories are pruned before descending into them. Symlinked directories
+    are not followed.
+    """
 
-                if os.path.isfile(path):
-                    yield path
-    else:
-        for name in os.listdir(root):
-            path = os.path.join(root, name)
-            if os.path.isfile(path):
-                rel = os.path.relpath(path, root).replace(os.sep, "/")
-                if matches_any(rel, cfg.exclude_globs):
+    root = os.path.abspath(cfg.root_dir)
+    yield from _iter_candidates_below(cfg, root, "", IgnoreStack.for_root(root, tuple(cfg.ignore_files)))
+
+
+def _iter_candidates_below(
+    cfg: IndexConfig, start: str, start_rel: str, ignores: IgnoreStack
+) -> Iterator[str]:
+    matcher = _path_matcher(cfg)
+    include_hidden = cfg.include_hidden
+    use_ignores = bool(cfg.ignore_files)
+
+    # Stack of (absolute dir, posix rel prefix with trailing "/" or "", ignore
+    # rules in effect for the dir's parent).
+    stack: list[tuple[str, str, IgnoreStack]] = [
+        (start, f"{start_rel}/" if start_rel else "", ignores)
+    ]
+    while stack:
+        dir_path, rel_prefix, rules = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        if use_ignores and rel_prefix:
+            rules = rules.child(dir_path, rel_prefix[:-1], present=[e.name for e in entries])
+
+        subdirs: list[tuple[str, str, IgnoreStack]] = []
+        for entry in entries:
+            name = entry.name
+            if not include_hidden and name.startswith("."):
+                continue
+            rel = rel_prefix + name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if (
+                        cfg.recursive
+                        and not matcher.excludes_dir(rel)
+                        and not (use_ignores and rules.ignored(rel, True))
+                    ):
+                        subdirs.append((entry.path, rel + "/", rules))
                     continue
-                if not matches_any(rel, cfg.include_globs):
+                if not entry.is_file():
                     continue
-                yield path
+            except OSError:
+                continue
+            if matcher.matches(rel) and not (use_ignores and rules.ignored(rel)):
+                yield entry.path
+        # Depth-first, in listing order (like os.walk).
+        stack.extend(reversed(subdirs))
+
+
+def _resolve_explicit_paths(
+    cfg: IndexConfig, paths: Iterable[str], known: Iterable[str]
+) -> tuple[list[str], list[str]]:
+    """Split explicitly requested paths into (files to index, paths to remove).
+
+    Directories are expanded with the usual candidate rules. A path that no
+    longer exists (or stopped being a candidate) is removed, together with any
+    `known` file below it, so deleting or renaming a directory drops its files.
+    """
+
+    root = os.path.abspath(cfg.root_dir)
+    to_index: dict[str, None] = {}
+    to_remove: dict[str, None] = {}
+    known = list(known)
+    for raw in paths:
+        path = os.path.abspath(raw)
+        if os.path.isdir(path):
+            if path == root or is_candidate_dir(cfg, path):
+                rel_dir = os.path.relpath(path, root).replace(os.sep, "/")
+                rel_dir = "" if rel_dir == "." else rel_dir
+                ignores = _ignore_stack_for_dir(cfg, root, rel_dir)
+                for file_path in _iter_candidates_below(cfg, path, rel_dir, ignores):
+                    to_index[file_path] = None
+            else:
+                # E.g. newly ignored: drop what was indexed below it.
+                prefix = path.rstrip(os.sep) + os.sep
+                for k in known:
+                    if k.startswith(prefix):
+                        to_remove[k] = None
+            continue
+        if os.path.isfile(path) and is_candidate_path(cfg, path):
+            to_index[path] = None
+            continue
+        to_remove[path] = None
+        prefix = path.rstrip(os.sep) + os.sep
+        for k in known:
+            if k.startswith(prefix):
+                to_remove[k] = None
+    for p in to_index:
+        to_remove.pop(p, None)
+    return list(to_index), list(to_remove)
 
 
 def _build_chunk_metadata(
@@ -318,53 +625,66 @@ def _build_chunk_metadata(
     return meta
 
 
-def _expand_chunks(*, chunks: list[Chunk], file_path: str, rel_path: str) -> list[tuple[Chunk, str]]:
-    expanded: list[tuple[Chunk, str]] = [(c, "code") for c in chunks]
+def _attach_source(meta_chunk: Chunk, *, file_path: str, source: Optional[Chunk]) -> Chunk:
+    meta_chunk.path = file_path
+    if source is not None:
+        meta_chunk.sha256 = source.sha256
+        meta_chunk.language = source.language
+        # Scope tuples are immutable; share them instead of copying.
+        meta_chunk.scope_path = source.scope_path
+        meta_chunk.contained_scopes = source.contained_scopes
+        meta_chunk.start = source.start
+        meta_chunk.end = source.end
+    return meta_chunk
 
-    def _attach_source(meta_chunk: Chunk, *, source: Chunk | None) -> Chunk:
-        meta_chunk.path = file_path
-        if source is not None:
-            meta_chunk.sha256 = source.sha256
-            meta_chunk.language = source.language
-            meta_chunk.scope_path = list(source.scope_path)
-            meta_chunk.contained_scopes = list(source.contained_scopes)
-            meta_chunk.start = source.start
-            meta_chunk.end = source.end
-        return meta_chunk
-
-    def _scope_to_compact(scope: Any) -> str:
-        kind = getattr(scope.kind, "value", str(scope.kind))
-        name = scope.name
-        raw_type = getattr(scope, "raw_type", None)
-        rel_path = getattr(scope, "rel_path", None)
-        extras: list[str] = []
-        if raw_type:
-            extras.append(f"raw={raw_type}")
-        if rel_path:
-            extras.append(f"path={rel_path}")
-        suffix = f"{{{','.join(extras)}}}" if extras else ""
-        return f"{kind}@{name}{suffix}"
 
-    rel_chunk = _attach_source(Chunk(text=f"relpath: {rel_path}"), source=chunks[0] if chunks else None)
-    expanded.append((rel_chunk, "relpath"))
+def _scope_to_compact(scope: Any) -> str:
+    kind = getattr(scope.kind, "value", str(scope.kind))
+    name = scope.name
+    raw_type = getattr(scope, "raw_type", None)
+    rel_path = getattr(scope, "rel_path", None)
+    extras: list[str] = []
+    if raw_type:
+        extras.append(f"raw={raw_type}")
+    if rel_path:
+        extras.append(f"path={rel_path}")
+    suffix = f"{{{','.join(extras)}}}" if extras else ""
+    return f"{kind}@{name}{suffix}"
+
+
+def _relpath_chunk(*, file_path: str, rel_path: str, source: Optional[Chunk]) -> Chunk:
+    return _attach_source(Chunk(text=f"relpath: {rel_path}"), file_path=file_path, source=source)
+
+
+def _scope_path_chunks(chunks: Iterable[Chunk], *, file_path: str, seen: set[str]) -> Iterator[Chunk]:
+    """One chunk per nested scope path of `chunks` not already in `seen`."""
 
-    seen_scope_paths: set[str] = set()
     for source in chunks:
         if len(source.scope_path) <= 1:
             continue
         scope_path_str = "::".join(_scope_to_compact(s) for s in source.scope_path)
         if not scope_path_str:
             continue
-        if scope_path_str in seen_scope_paths:
+        if scope_path_str in seen:
             continue
-        seen_scope_paths.add(scope_path_str)
+        seen.add(scope_path_str)
         containers_str = "::".join(_scope_to_compact(s) for s in source.contained_scopes)
         suffix = f"|containers: {containers_str}" if containers_str else ""
-        scope_chunk = _attach_source(
+        yield _attach_source(
             Chunk(text=f"{scope_path_str}{suffix}"),
+            file_path=file_path,
             source=source,
         )
-        expanded.append((scope_chunk, "scope_path"))
+
+
+def _expand_chunks(*, chunks: list[Chunk], file_path: str, rel_path: str) -> list[tuple[Chunk, str]]:
+    expanded: list[tuple[Chunk, str]] = [(c, "code") for c in chunks]
+    rel_chunk = _relpath_chunk(file_path=file_path, rel_path=rel_path, source=chunks[0] if chunks else None)
+    expanded.append((rel_chunk, "relpath"))
+    expanded.extend(
+        (scope_chunk, "scope_path")
+        for scope_chunk in _scope_path_chunks(chunks, file_path=file_path, seen=set())
+    )
 
     kind_counts: dict[str, int] = {}
     for _, kind in expanded:
@@ -388,9 +708,142 @@ def _prepare_chunks_for_file_sync(
     rel_path: str,
     file_sha256: str,
     chunk_cfg: ChunkConfig,
+    data: Optional[FileData] = None,
+    tree_cache: Optional[TreeCache] = None,
 ) -> list[tuple[Chunk, str]]:
-    chunker = TreeSitterChunker(chunk_cfg)
-    chunks: List[Chunk] = list(chunker.chunk(file_path))
+    chunker = shared_chunker(chunk_cfg)
+    if isinstance(data, mmap.mmap):
+        # Parsing needs the whole file as bytes; one copy from the mapping.
+        with data:
+            data = data[:]
+    chunks: List[Chunk] = list(
+        chunker.chunk(file_path, data=data, sha256=file_sha256, tree_cache=tree_cache)
+    )
+    return _finalize_chunks(
+        chunks,
+        file_path=file_path,
+        rel_path=rel_path,
+        file_sha256=file_sha256,
+        chunk_cfg=chunk_cfg,
+    )
+
+
+def _scope_group_key(c: Chunk) -> Optional[tuple]:
+    """Identity of the function/type scope a chunk belongs to, if any."""
+
+    if not c.scope_path:
+        return None
+    last = c.scope_path[-1]
+    if getattr(last, "kind", None) not in {ScopeKind.TYPE, ScopeKind.FUNCTION}:
+        return None
+    start = getattr(last, "start", None)
+    end = getattr(last, "end", None)
+    return (
+        getattr(last.kind, "value", str(last.kind)),
+        getattr(last, "name", None),
+        getattr(last, "raw_type", None),
+        getattr(start, "row", None),
+        getattr(start, "column", None),
+        getattr(end, "row", None),
+        getattr(end, "column", None),
+    )
+
+
+def _point_key(p: Any) -> tuple[int, int]:
+    if p is None:
+        return (0, 0)
+    return (int(getattr(p, "row", 0)), int(getattr(p, "column", 0)))
+
+
+class _GroupLinker:
+    """Streaming counterpart of the scope grouping in `_finalize_chunks`.
+
+    Chunks arrive in source order. The first chunk of a function/type scope
+    is held back until another chunk of the same scope arrives (the scope
+    was split, so both are linked) or a chunk starts past the scope's end
+    (it was not). At most `lookbehind` chunks are held: a first chunk that
+    has to leave undecided is linked when its scope continues past it, so
+    such a group can end up with a single member.
+    """
+
+    def __init__(self, lookbehind: int) -> None:
+        self._lookbehind = max(1, int(lookbehind))
+        self._pending: deque[Chunk] = deque()
+        # key -> first chunk of a scope not yet known to be split.
+        self._undecided: dict[tuple, Chunk] = {}
+        # key -> [group_id, next group_index, scope end] for split scopes.
+        self._linked: dict[tuple, list[Any]] = {}
+
+    def push(self, chunk: Chunk) -> list[Chunk]:
+        """Take the next chunk; return the chunks that are ready, in order."""
+
+        key = _scope_group_key(chunk)
+        if key is not None:
+            first = self._undecided.pop(key, None)
+            if first is not None:
+                self._link(key, first)
+            if key in self._linked:
+                self._assign(key, chunk)
+            else:
+                self._undecided[key] = chunk
+
+        # Scopes the stream has moved past can get no more members.
+        start = _point_key(chunk.start)
+        for k in [k for k, c in self._undecided.items() if start > _point_key(c.scope_path[-1].end)]:
+            del self._undecided[k]
+        for k in [k for k, g in self._linked.items() if start > g[2]]:
+            del self._linked[k]
+
+        self._pending.append(chunk)
+        return self._release(self._lookbehind)
+
+    def flush(self) -> list[Chunk]:
+        """End of stream: every scope still undecided had a single chunk."""
+
+        self._undecided.clear()
+        self._linked.clear()
+        return self._release(0)
+
+    def _link(self, key: tuple, first: Chunk) -> None:
+        self._linked[key] = [uuid.uuid4().hex, 0, _point_key(first.scope_path[-1].end)]
+        self._assign(key, first)
+
+    def _assign(self, key: tuple, chunk: Chunk) -> None:
+        group = self._linked[key]
+        if chunk.group_id is None:
+            chunk.group_id = group[0]
+        if chunk.group_index is None:
+            chunk.group_index = group[1]
+        group[1] += 1
+
+    def _release(self, keep: int) -> list[Chunk]:
+        ready: list[Chunk] = []
+        while self._pending:
+            head = self._pending[0]
+            key = _scope_group_key(head)
+            held = key is not None and self._undecided.get(key) is head
+            if held and len(self._pending) <= keep:
+                break
+            self._pending.popleft()
+            if held:
+                assert key is not None
+                del self._undecided[key]
+                if _point_key(head.end) < _point_key(head.scope_path[-1].end):
+                    self._link(key, head)
+            ready.append(head)
+        return ready
+
+
+def _finalize_chunks(
+    chunks: List[Chunk],
+    *,
+    file_path: str,
+    rel_path: str,
+    file_sha256: str,
+    chunk_cfg: ChunkConfig,
+) -> list[tuple[Chunk, str]]:
+    """Attach file identity, link split scopes into groups and expand."""
+
     if not chunks:
         return []
 
@@ -399,24 +852,6 @@ def _prepare_chunks_for_file_sync(
         c.sha256 = file_sha256
 
     if chunk_cfg.mode in {"type", "function"}:
-        def _scope_group_key(c: Chunk) -> Optional[tuple]:
-            if not c.scope_path:
-                return None
-            last = c.scope_path[-1]
-            if getattr(last, "kind", None) not in {ScopeKind.TYPE, ScopeKind.FUNCTION}:
-                return None
-            start = getattr(last, "start", None)
-            end = getattr(last, "end", None)
-            return (
-                getattr(last.kind, "value", str(last.kind)),
-                getattr(last, "name", None),
-                getattr(last, "raw_type", None),
-                getattr(start, "row", None),
-                getattr(start, "column", None),
-                getattr(end, "row", None),
-                getattr(end, "column", None),
-            )
-
         groups: dict[tuple, list[Chunk]] = {}
         for c in chunks:
             key = _scope_group_key(c)
@@ -446,19 +881,88 @@ def _prepare_chunks_for_file_sync(
     return _expand_chunks(chunks=chunks, file_path=file_path, rel_path=rel_path)
 
 
+def _iter_chunk_windows_sync(
+    *,
+    file_path: str,
+    rel_path: str,
+    file_sha256: str,
+    chunk_cfg: ChunkConfig,
+    window: int,
+    data: Optional[FileData] = None,
+    tree_cache: Optional[TreeCache] = None,
+) -> Iterator[tuple[list[tuple[Chunk, str]], bool]]:
+    """Streaming form of `_prepare_chunks_for_file_sync`.
+
+    Yields `(expanded, last)` windows of about `window` code chunks plus the
+    scope-path chunks they introduce; only the last window carries the
+    relpath chunk. Chunks are linked into groups as they stream past (see
+    `_GroupLinker`), so at most one window is held at a time.
+    """
+
+    chunker = shared_chunker(chunk_cfg)
+    if isinstance(data, mmap.mmap):
+        with data:
+            data = data[:]
+    linker = _GroupLinker(_GROUP_LOOKBEHIND) if chunk_cfg.mode in {"type", "function"} else None
+    seen_scope_paths: set[str] = set()
+    first: Optional[Chunk] = None
+
+    def _expand(code: list[Chunk]) -> list[tuple[Chunk, str]]:
+        expanded: list[tuple[Chunk, str]] = [(c, "code") for c in code]
+        expanded.extend(
+            (scope_chunk, "scope_path")
+            for scope_chunk in _scope_path_chunks(code, file_path=file_path, seen=seen_scope_paths)
+        )
+        return expanded
+
+    code: list[Chunk] = []
+    for c in chunker.chunk(file_path, data=data, sha256=file_sha256, tree_cache=tree_cache):
+        c.path = file_path
+        c.sha256 = file_sha256
+        if first is None:
+            first = c
+        code.extend(linker.push(c) if linker is not None else (c,))
+        if len(code) >= window:
+            yield _expand(code), False
+            code = []
+    if linker is not None:
+        code.extend(linker.flush())
+    tail = _expand(code)
+    if first is not None:
+        tail.append((_relpath_chunk(file_path=file_path, rel_path=rel_path, source=first), "relpath"))
+    yield tail, True
+
+
 async def _prepare_chunks_for_file(
     *,
     file_path: str,
     rel_path: str,
     file_sha256: str,
     chunk_cfg: ChunkConfig,
+    chunk_pool: Optional[ProcessChunkPool] = None,
+    data: Optional[FileData] = None,
+    tree_cache: Optional[TreeCache] = None,
 ) -> list[tuple[Chunk, str]]:
+    if chunk_pool is not None:
+        # Workers read the file themselves: shipping the content through the
+        # pool's pipe would cost more than a read from the page cache.
+        _close_file_data(data)
+        chunks = await chunk_pool.chunk(file_path, chunk_cfg, sha256=file_sha256)
+        return _finalize_chunks(
+            chunks,
+            file_path=file_path,
+            rel_path=rel_path,
+            file_sha256=file_sha256,
+            chunk_cfg=chunk_cfg,
+        )
     return await asyncio.to_thread(
         _prepare_chunks_for_file_sync,
         file_path=file_path,
         rel_path=rel_path,
         file_sha256=file_sha256,
         chunk_cfg=chunk_cfg,
+        data=data,
+        tree_cache=tree_cache,
     )
 
 
@@ -468,23 +972,95 @@ def _build_upsert_payloads(
     file_path: str,
     file_sha256: str,
     rel_path: str,
+    seen: Optional[dict[str, int]] = None,
 ) -> tuple[list[str], list[str], list[dict[str, Any]]]:
+    """Texts, ids and metadata for `expanded_chunks`.
+
+    `seen` counts ids already handed out for this file; pass the same dict
+    for every window of a streamed file.
+    """
+
     texts = [c.text for c, _ in expanded_chunks]
-    ids = [_new_id() for _ in expanded_chunks]
+    ids: list[str] = []
     metadatas: list[dict[str, Any]] = []
+    if seen is None:
+        seen = {}
     for c, kind in expanded_chunks:
-        metadatas.append(
-            _build_chunk_metadata(
-                chunk=c,
-                file_path=file_path,
-                file_sha256=file_sha256,
-                rel_path=rel_path,
-                chunk_kind=kind,
-            )
+        meta = _build_chunk_metadata(
+            chunk=c,
+            file_path=file_path,
+            file_sha256=file_sha256,
+            rel_path=rel_path,
+            chunk_kind=kind,
+        )
+        chunk_id = _chunk_id(
+            rel_path=rel_path,
+            chunk_kind=kind,
+            scope_path_str=meta["scope_path_str"],
+            text=c.text,
         )
+        # Identical chunks in one file (e.g. repeated boilerplate) are told
+        # apart by occurrence order.
+        n = seen.get(chunk_id, 0)
+        seen[chunk_id] = n + 1
+        ids.append(chunk_id if n == 0 else f"{chunk_id}-{n}")
+        metadatas.append(meta)
     return texts, ids, metadatas
 
 
+def _log_chunk_stats(expanded_chunks: list[tuple[Chunk, str]]) -> None:
+    base_chunks = sum(1 for _, kind in expanded_chunks if kind == "code")
+    expanded_total = len(expanded_chunks)
+    expansion_ratio = (expanded_total / base_chunks) if base_chunks else 0.0
+    chunk_lengths = [len(c.text) for c, _ in expanded_chunks]
+    total_chars = sum(chunk_lengths)
+    min_chars = min(chunk_lengths) if chunk_lengths else 0
+    max_chars = max(chunk_lengths) if chunk_lengths else 0
+    avg_chars = int(total_chars / expanded_total) if expanded_total else 0
+    logger.info(
+        "[CHUNKING] base=%d expanded=%d ratio=%.2f chars(min/avg/max)=%d/%d/%d",
+        base_chunks,
+        expanded_total,
+        expansion_ratio,
+        min_chars,
+        avg_chars,
+        max_chars,
+    )
+
+    chunk_types_count = {}
+    chunk_kind_lengths: dict[str, list[int]] = {}
+    for chunk, chunk_kind in expanded_chunks:
+        chunk_types_count[chunk_kind] = chunk_types_count.get(chunk_kind, 0) + 1
+        chunk_kind_lengths.setdefault(chunk_kind, []).append(len(chunk.text))
+
+    chunk_type_str = ", ".join(
+        [f"{k}={v}" for k, v in sorted(chunk_types_count.items())]
+    )
+    logger.info(
+        "[CHUNKING] Chunks emitted: %d total | Types: %s",
+        len(expanded_chunks),
+        chunk_type_str,
+    )
+    for kind, lengths in sorted(chunk_kind_lengths.items()):
+        if not lengths:
+            continue
+        kind_min = min(lengths)
+        kind_max = max(lengths)
+        kind_avg = int(sum(lengths) / len(lengths))
+        logger.info(
+            "[CHUNKING] kind=%s count=%d chars(min/avg/max)=%d/%d/%d",
+            kind,
+            len(lengths),
+            kind_min,
+            kind_avg,
+            kind_max,
+        )
+
+
+def _take(it: Iterator[str], n: int) -> list[str]:
+    return list(itertools.islice(it, n))
+
+
 async def index_directory(
     *,
     cfg: IndexConfig,
@@ -494,17 +1070,54 @@ async def index_directory(
     force_upsert: bool = False,
     batch_size: int = 16,
     max_concurrency: int = 4,
+    pipeline_cfg: Optional[PipelineConfig] = None,
+    paths: Optional[Iterable[str]] = None,
+    tree_cache: Optional[TreeCache] = None,
 ) -> IndexStats:
     """Index a directory end-to-end (scan -> chunk -> embed -> write).
 
     Current status: framework only.
     - We implement scan + chunk + embed batching.
     - We only write if cfg.dry_run is False AND store is provided.
+    - Real runs keep a local manifest (see `IndexConfig.use_manifest`) so files
+      whose stat data is unchanged are skipped without hashing or store lookups.
+
+    Files flow through a staged pipeline (discover -> scan -> lookup -> chunk
+    -> embed -> write) with bounded queues between stages, so chunking, the
+    embeddings endpoint and store writes all make progress at the same time.
+    `paths` restricts the run to the given files/directories (as the watcher
+    does): vanished or no-longer-matching paths are deleted from the store and
+    the manifest, and entries for other files are left alone. A full scan
+    likewise deletes the vectors of manifest files it no longer finds.
+
+    Chunking runs in threads by default; set `PipelineConfig.chunk_backend`
+    to "process" to chunk in a pool of worker processes instead.
+    Per-stage concurrency comes from `pipeline_cfg`; when omitted,
+    `max_concurrency` sizes the scan/chunk stages and the number of concurrent
+    embedding requests.
+
+    By default chunks from many files are merged into full, token-aware
+    embedding requests (`EmbeddingCoalescer`); `batch_size` then only sizes
+    store upserts and, with coalescing disabled, per-file embed slices.
+
+    A `TreeCache` shared across runs lets thread-backed chunking reparse
+    edited files incrementally and reuse the chunks of untouched code (see
+    `mini_code_index.tree_cache`); the process backend ignores it.
+
+    Files of at least `PipelineConfig.stream_min_bytes` are streamed: their
+    chunks are grouped, expanded, embedded and written in bounded windows
+    instead of being buffered whole.
     """
 
     setup_logging()
     stats = IndexStats()
     chunk_cfg = chunk_cfg or ChunkConfig()
+    if pipeline_cfg is None:
+        pipeline_cfg = PipelineConfig(
+            scan_workers=max_concurrency,
+            chunk_workers=max_concurrency,
+            embed_requests=max_concurrency,
+        )
 
     index_start_time = time.time()
     logger.info("=" * 80)
@@ -519,194 +1132,486 @@ async def index_directory(
 
     if not cfg.dry_run and store is None:
         raise ValueError("store is required when dry_run=False")
+    if not cfg.dry_run and embedder is None:
+        raise ValueError("embedder is required when dry_run=False")
+
+    # Embed path, outermost first: cache -> coalescer -> embedder. Each
+    # wrapper closes the one it wraps.
+    embed_client: Optional[Embedder] = embedder
+    coalescer: Optional[EmbeddingCoalescer] = None
+    embed_workers = pipeline_cfg.embed_requests
+    if embedder is not None and not cfg.dry_run and pipeline_cfg.coalesce_embeddings:
+        coalescer = EmbeddingCoalescer(
+            embedder,
+            max_wait_s=pipeline_cfg.coalesce_max_wait_s,
+            max_in_flight=pipeline_cfg.embed_requests,
+        )
+        embed_client = coalescer
+        embed_workers = pipeline_cfg.embed_workers
+    cache = _resolve_embedding_cache(cfg, embedder)
+    cached_embedder: Optional[CachedEmbedder] = None
+    if cache is not None and embed_client is not None:
+        cached_embedder = CachedEmbedder(
+            embed_client,
+            cache,
+            model=str(getattr(embedder, "model")),
+            dimensions=getattr(embedder, "dimensions", None),
+        )
+        embed_client = cached_embedder
+        logger.info("Using embedding cache: %s", cache.path)
+
+    manifest = await _resolve_manifest(cfg, store)
+    chunk_fingerprint = chunk_cfg.fingerprint()
+    if manifest is not None:
+        logger.info("Using manifest: %s (%d entries)", manifest.path, len(manifest))
+
+    seen_paths: set[str] = set()
+
+    def _remember(job: _FileJob, file_sha256: str, chunk_ids: Optional[list[str]]) -> None:
+        if manifest is None:
+            return
+        manifest.set(
+            job.file_path,
+            ManifestEntry.from_stat(
+                job.stat,
+                sha256=file_sha256,
+                chunk_ids=chunk_ids,
+                chunk_fingerprint=chunk_fingerprint,
+                indexed_at_ns=job.read_started_ns,
+            ),
+        )
 
-    file_paths = list(iter_candidate_files(cfg))
-    stats.files_seen = len(file_paths)
-
-    semaphore = asyncio.Semaphore(max_concurrency)
-    store_lock = asyncio.Lock()
-
-    async def _process_file(file_path: str) -> tuple[int, int]:
-        async with semaphore:
-            logger.debug("Scanning file: %s", file_path)
-
-            if not await _is_probably_text_file(file_path, chunk_cfg=chunk_cfg):
-                logger.debug("Skipping non-text file: %s", file_path)
-                return 0, 0
-
-            try:
-                file_sha256 = await _hash_file_sha256(file_path)
-            except OSError:
-                return 0, 0
+    git_state: Optional[GitChangeSet] = None
+    if cfg.change_detection == "git" and paths is None and not cfg.dry_run:
+        assert store is not None
+        # HEAD is captured before anything is read, so edits made while this
+        # run is in progress are picked up again next time.
+        git_state, paths = await _plan_git_run(cfg, store, chunk_fingerprint)
+
+    explicit_files: Optional[list[str]] = None
+    removed_paths: list[str] = []
+    if paths is not None:
+        explicit_files, removed_paths = await asyncio.to_thread(
+            _resolve_explicit_paths,
+            cfg,
+            list(paths),
+            manifest.paths() if manifest is not None else (),
+        )
+        if tree_cache is not None:
+            for path in removed_paths:
+                tree_cache.discard(path)
+
+    async def _discover(emit: Emit) -> None:
+        it = iter(explicit_files) if explicit_files is not None else iter_candidate_files(cfg)
+        while True:
+            paths = await asyncio.to_thread(_take, it, pipeline_cfg.discover_batch)
+            if not paths:
+                return
+            for file_path in paths:
+                seen_paths.add(file_path)
+                stats.files_seen += 1
+                await emit(file_path)
+
+    async def _scan(file_path: str, emit: Emit) -> None:
+        """Stat, sniff and hash one file; drop it when it needs no further work."""
+
+        logger.debug("Scanning file: %s", file_path)
 
-            rel_path = os.path.relpath(file_path, cfg.root_dir).replace(os.sep, "/")
-            file_start_time = time.time()
-            logger.info("---\n[FILE] Processing: %s", file_path)
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return
+
+        entry = manifest.get(file_path) if manifest is not None else None
+        config_changed = entry is not None and entry.chunk_fingerprint != chunk_fingerprint
+        if (
+            entry is not None
+            and not force_upsert
+            and not config_changed
+            and entry.matches_stat(file_stat)
+        ):
+            logger.debug("[SKIP] Unchanged (manifest stat match): %s", file_path)
+            stats.files_unchanged += 1
+            return
+
+        job = _FileJob(
+            file_path=file_path,
+            rel_path=os.path.relpath(file_path, cfg.root_dir).replace(os.sep, "/"),
+            stat=file_stat,
+            read_started_ns=time.time_ns(),
+            config_changed=config_changed,
+        )
 
-            if not cfg.dry_run:
-                if embedder is None:
-                    raise ValueError("embedder is required when dry_run=False")
-                assert store is not None
-
-                async with store_lock:
-                    existing = await store.get_one_by_path(path=file_path)
-                existing_sha = existing.get("sha256") if isinstance(existing, dict) else None
-
-                if not force_upsert and existing_sha == file_sha256 and existing is not None:
-                    file_elapsed = time.time() - file_start_time
-                    logger.info(
-                        "[SKIP] Unchanged (sha256 match). elapsed=%.2fs\n",
-                        file_elapsed,
-                    )
-                    return 0, 0
-
-                if existing is not None:
-                    async with store_lock:
-                        await store.delete_by_path(path=file_path)
-                    if force_upsert and existing_sha == file_sha256:
-                        logger.info(
-                            "[UPDATE] Force reindex: deleted existing vectors for: %s",
-                            file_path,
-                        )
-                    else:
-                        logger.info("[UPDATE] Deleted existing vectors for: %s", file_path)
-                else:
-                    logger.info("[UPDATE] No existing vectors found for: %s", file_path)
-
-            expanded_chunks = await _prepare_chunks_for_file(
-                file_path=file_path,
-                rel_path=rel_path,
-                file_sha256=file_sha256,
-                chunk_cfg=chunk_cfg,
+        try:
+            ingested = await asyncio.to_thread(
+                _ingest_file_sync, file_path, size=int(file_stat.st_size), chunk_cfg=chunk_cfg
             )
-            if not expanded_chunks:
-                logger.debug("No chunks emitted for: %s", file_path)
-                return 0, 0
-
-            base_chunks = sum(1 for _, kind in expanded_chunks if kind == "code")
-            expanded_total = len(expanded_chunks)
-            expansion_ratio = (expanded_total / base_chunks) if base_chunks else 0.0
-            chunk_lengths = [len(c.text) for c, _ in expanded_chunks]
-            total_chars = sum(chunk_lengths)
-            min_chars = min(chunk_lengths) if chunk_lengths else 0
-            max_chars = max(chunk_lengths) if chunk_lengths else 0
-            avg_chars = int(total_chars / expanded_total) if expanded_total else 0
+        except OSError:
+            return
+        if ingested is None:
+            logger.debug("Skipping non-text file: %s", file_path)
+            _remember(job, "", [])
+            return
+        job.data, job.sha256 = ingested
+
+        if (
+            entry is not None
+            and not force_upsert
+            and not config_changed
+            and entry.sha256 == job.sha256
+        ):
+            # Touched but not modified (checkout, `touch`, copy): refresh stat data only.
+            logger.debug("[SKIP] Unchanged (manifest sha256 match): %s", file_path)
+            _close_file_data(job.data)
+            job.data = None
+            _remember(job, job.sha256, entry.chunk_ids)
+            stats.files_unchanged += 1
+            return
+
+        await emit(job)
+
+    async def _lookup(jobs: list[_FileJob], emit: Emit) -> None:
+        """Resolve stored sha256 for a batch of files in one bulk store call."""
+
+        if not cfg.dry_run:
+            assert store is not None
+            lookup_start = time.time()
+            existing_shas = await store.get_sha_by_paths(paths=[j.file_path for j in jobs])
             logger.info(
-                "[CHUNKING] base=%d expanded=%d ratio=%.2f chars(min/avg/max)=%d/%d/%d",
-                base_chunks,
-                expanded_total,
-                expansion_ratio,
-                min_chars,
-                avg_chars,
-                max_chars,
+                "[LOOKUP] %d candidate files, %d already in store (%.2fs)",
+                len(jobs),
+                len(existing_shas),
+                time.time() - lookup_start,
             )
+            for job in jobs:
+                job.existing_sha = existing_shas.get(job.file_path)
+
+        for job in jobs:
+            if (
+                not cfg.dry_run
+                and not force_upsert
+                and not job.config_changed
+                and job.existing_sha == job.sha256
+            ):
+                logger.info("[SKIP] Unchanged (sha256 match): %s", job.file_path)
+                _close_file_data(job.data)
+                job.data = None
+                _remember(job, job.sha256, None)
+                stats.files_unchanged += 1
+                continue
+            await emit(job)
+
+    async def _chunk(job: _FileJob, emit: Emit) -> None:
+        job.started_at = time.time()
+        logger.info("---\n[FILE] Processing: %s", job.file_path)
+
+        data, job.data = job.data, None
+        if pipeline_cfg.stream_min_bytes is not None and job.stat.st_size >= pipeline_cfg.stream_min_bytes:
+            await _chunk_streaming(job, data, emit)
+            return
+        expanded_chunks = await _prepare_chunks_for_file(
+            file_path=job.file_path,
+            rel_path=job.rel_path,
+            file_sha256=job.sha256,
+            chunk_cfg=chunk_cfg,
+            chunk_pool=chunk_pool,
+            data=data,
+            tree_cache=tree_cache,
+        )
+        if not expanded_chunks:
+            logger.debug("No chunks emitted for: %s", job.file_path)
+            if not cfg.dry_run:
+                # Nothing to embed, but stale vectors from an older version must go.
+                job.texts, job.ids, job.metadatas = [], [], []
+                await emit(job)
+            return
 
-            chunk_types_count = {}
-            chunk_kind_lengths: dict[str, list[int]] = {}
-            for chunk, chunk_kind in expanded_chunks:
-                chunk_types_count[chunk_kind] = chunk_types_count.get(chunk_kind, 0) + 1
-                chunk_kind_lengths.setdefault(chunk_kind, []).append(len(chunk.text))
+        _log_chunk_stats(expanded_chunks)
 
-            chunk_type_str = ", ".join(
-                [f"{k}={v}" for k, v in sorted(chunk_types_count.items())]
-            )
+        if cfg.dry_run:
+            file_elapsed = time.time() - job.started_at
             logger.info(
-                "[CHUNKING] Chunks emitted: %d total | Types: %s",
-                len(expanded_chunks),
-                chunk_type_str,
+                "[DRY_RUN] Skipping embedding and upserting (elapsed: %.2fs)\n",
+                file_elapsed,
             )
-            for kind, lengths in sorted(chunk_kind_lengths.items()):
-                if not lengths:
-                    continue
-                kind_min = min(lengths)
-                kind_max = max(lengths)
-                kind_avg = int(sum(lengths) / len(lengths))
-                logger.info(
-                    "[CHUNKING] kind=%s count=%d chars(min/avg/max)=%d/%d/%d",
-                    kind,
-                    len(lengths),
-                    kind_min,
-                    kind_avg,
-                    kind_max,
-                )
-
-            if cfg.dry_run:
-                file_elapsed = time.time() - file_start_time
-                logger.info(
-                    "[DRY_RUN] Skipping embedding and upserting (elapsed: %.2fs)\n",
-                    file_elapsed,
-                )
-                return 1, len(expanded_chunks)
+            stats.files_indexed += 1
+            stats.chunks_emitted += len(expanded_chunks)
+            return
+
+        job.texts, job.ids, job.metadatas = _build_upsert_payloads(
+            expanded_chunks=expanded_chunks,
+            file_path=job.file_path,
+            file_sha256=job.sha256,
+            rel_path=job.rel_path,
+        )
+        existing_ids = await _existing_chunk_ids(job)
+        job.stale_ids = sorted(existing_ids.difference(job.ids))
+        if force_upsert:
+            job.new_idx = list(range(len(job.ids)))
+        else:
+            job.new_idx = [i for i, chunk_id in enumerate(job.ids) if chunk_id not in existing_ids]
+        await emit(job)
+
+    async def _chunk_streaming(job: _FileJob, data: Optional[FileData], emit: Emit) -> None:
+        """Chunk, embed and write a large file one window at a time.
+
+        Only the ids of the file are kept across windows. Chunks that are new
+        to the store are embedded and upserted with their window; stale ids are
+        deleted with the last window, which also carries the relpath chunk;
+        `_write_chunks` writes that chunk after everything else.
+        """
 
-            embed_start_time = time.time()
-            upsert_total_time = 0.0
+        existing_ids: set[str] = set() if cfg.dry_run else await _existing_chunk_ids(job)
+        windows = _iter_chunk_windows_sync(
+            file_path=job.file_path,
+            rel_path=job.rel_path,
+            file_sha256=job.sha256,
+            chunk_cfg=chunk_cfg,
+            window=pipeline_cfg.stream_window,
+            data=data,
+            tree_cache=tree_cache,
+        )
+        all_ids: list[str] = []
+        seen_ids: dict[str, int] = {}
+        n_windows = n_new = n_stale = 0
+        last = False
+        while not last:
+            expanded_chunks, last = await asyncio.to_thread(next, windows)
+            if not expanded_chunks:
+                continue
+            n_windows += 1
             texts, ids, metadatas = _build_upsert_payloads(
                 expanded_chunks=expanded_chunks,
-                file_path=file_path,
-                file_sha256=file_sha256,
-                rel_path=rel_path,
+                file_path=job.file_path,
+                file_sha256=job.sha256,
+                rel_path=job.rel_path,
+                seen=seen_ids,
             )
-            logger.info("[EMBEDDING] Processing %d chunks...", len(texts))
-
-            batch_count = 0
-            for i in range(0, len(texts), batch_size):
-                batch_count += 1
-                batch_docs = texts[i : i + batch_size]
-                batch_ids = ids[i : i + batch_size]
-                batch_meta = metadatas[i : i + batch_size]
-                batch_start = time.time()
-
-                logger.info(
-                    "  [BATCH %d/%d] Embedding and upserting: items [%d-%d] (%d chunks)",
-                    batch_count,
-                    (len(texts) + batch_size - 1) // batch_size,
-                    i,
-                    min(i + batch_size, len(texts)) - 1,
-                    len(batch_docs),
-                )
-                embed_batch_start = time.time()
-                batch_vecs = await embedder.embed(batch_docs)
-                embed_batch_elapsed = time.time() - embed_batch_start
-                upsert_batch_start = time.time()
-                async with store_lock:
-                    await store.upsert(
-                        ids=batch_ids,
-                        documents=batch_docs,
-                        embeddings=batch_vecs,
-                        metadatas=batch_meta,
-                    )
-                upsert_batch_elapsed = time.time() - upsert_batch_start
-                upsert_total_time += upsert_batch_elapsed
-                batch_elapsed = time.time() - batch_start
-                logger.info(
-                    "  [BATCH %d] Done (total=%.2fs | embed=%.2fs | upsert=%.2fs)",
-                    batch_count,
-                    batch_elapsed,
-                    embed_batch_elapsed,
-                    upsert_batch_elapsed,
-                )
-
-            embed_elapsed = time.time() - embed_start_time
-            file_elapsed = time.time() - file_start_time
+            del expanded_chunks
+            all_ids.extend(ids)
+            if cfg.dry_run:
+                continue
+            part = replace(job, texts=texts, ids=ids, metadatas=metadatas, embeddings=[])
+            if force_upsert:
+                part.new_idx = list(range(len(ids)))
+            else:
+                part.new_idx = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing_ids]
+            if last:
+                part.stale_ids = sorted(existing_ids.difference(all_ids))
+            await _embed_chunks(part)
+            await _write_chunks(part)
+            n_new += len(part.new_idx)
+            n_stale += len(part.stale_ids)
+
+        if not all_ids:
+            logger.debug("No chunks emitted for: %s", job.file_path)
+            if not cfg.dry_run:
+                job.texts, job.ids, job.metadatas = [], [], []
+                await emit(job)
+            return
+
+        logger.info(
+            "[STREAM] %s: windows=%d chunks=%d added=%d deleted=%d (%.2fs)\n",
+            job.file_path,
+            n_windows,
+            len(all_ids),
+            n_new,
+            n_stale,
+            time.time() - job.started_at,
+        )
+        stats.files_indexed += 1
+        stats.chunks_emitted += len(all_ids)
+        if not cfg.dry_run:
+            _remember(job, job.sha256, all_ids)
+            stats.chunks_embedded += n_new
+            stats.chunks_deleted += n_stale
+
+    async def _existing_chunk_ids(job: _FileJob) -> set[str]:
+        """Ids currently stored for this file (empty for files not in the store)."""
+
+        if job.existing_sha is None:
+            return set()
+        entry = manifest.get(job.file_path) if manifest is not None else None
+        if entry is not None and entry.chunk_ids is not None and entry.sha256 == job.existing_sha:
+            # The manifest recorded exactly what was written for this version.
+            return set(entry.chunk_ids)
+        assert store is not None
+        return set(await store.get_ids_by_path(path=job.file_path))
+
+    async def _embed(job: _FileJob, emit: Emit) -> None:
+        await _embed_chunks(job)
+        await emit(job)
+
+    async def _embed_chunks(job: _FileJob) -> None:
+        assert embedder is not None
+        if job.new_idx:
+            texts = [job.texts[i] for i in job.new_idx]
             logger.info(
-                "[FILE_SUMMARY] %d chunks processed in %.2fs (embedding: %.2fs | upsert: %.2fs)\n",
+                "[EMBEDDING] Processing %d/%d chunks: %s",
                 len(texts),
-                file_elapsed,
-                embed_elapsed,
-                upsert_total_time,
+                len(job.texts),
+                job.file_path,
+            )
+            embed_start = time.time()
+            assert embed_client is not None
+            if coalescer is not None:
+                job.embeddings = await embed_client.embed(texts)
+            else:
+                vectors: list[Sequence[float]] = []
+                for i in range(0, len(texts), batch_size):
+                    vectors.extend(await embed_client.embed(texts[i : i + batch_size]))
+                job.embeddings = vectors
+            job.embed_elapsed = time.time() - embed_start
+
+    async def _write(job: _FileJob, _emit: Emit) -> None:
+        assert store is not None
+        file_path = job.file_path
+        upsert_start = time.time()
+
+        if not job.texts:
+            if job.existing_sha is not None:
+                await store.delete_by_path(path=file_path)
+                logger.info("[UPDATE] Deleted existing vectors for: %s", file_path)
+            _remember(job, job.sha256, [])
+            return
+
+        kept = await _write_chunks(job)
+        upsert_elapsed = time.time() - upsert_start
+
+        if job.existing_sha is None:
+            logger.info("[UPDATE] No existing vectors found for: %s", file_path)
+        else:
+            logger.info(
+                "[UPDATE] %s: added=%d deleted=%d kept=%d",
+                file_path,
+                len(job.new_idx),
+                len(job.stale_ids),
+                kept,
             )
-            return 1, len(expanded_chunks)
 
-    try:
-        results = await asyncio.gather(
-            *[asyncio.create_task(_process_file(p)) for p in file_paths]
+        _remember(job, job.sha256, list(job.ids))
+        stats.files_indexed += 1
+        stats.chunks_emitted += len(job.texts)
+        stats.chunks_embedded += len(job.new_idx)
+        stats.chunks_deleted += len(job.stale_ids)
+
+        file_elapsed = time.time() - job.started_at
+        logger.info(
+            "[FILE_SUMMARY] %d chunks processed in %.2fs (embedding: %.2fs | upsert: %.2fs)\n",
+            len(job.texts),
+            file_elapsed,
+            job.embed_elapsed,
+            upsert_elapsed,
+        )
+
+    async def _write_chunks(job: _FileJob) -> int:
+        """Apply one file's chunk diff to the store; returns the kept count."""
+
+        assert store is not None
+        # Added chunks first, then removals, then the metadata refresh of kept
+        # chunks. The relpath chunk is held back and written last whether it
+        # is new or kept: it carries the stored file sha256 that
+        # `get_sha_by_paths` reads, so until every other write has landed the
+        # store still reports the old version and an interrupted write is
+        # retried next run.
+        rel = next(
+            (j for j, meta in enumerate(job.metadatas) if meta.get("chunk_kind") == "relpath"),
+            None,
         )
-        for files_indexed_inc, chunks_emitted_inc in results:
-            stats.files_indexed += files_indexed_inc
-            stats.chunks_emitted += chunks_emitted_inc
+        new_set = set(job.new_idx)
+        added = [(j, vec) for j, vec in zip(job.new_idx, job.embeddings) if j != rel]
+        for i in range(0, len(added), batch_size):
+            part = added[i : i + batch_size]
+            await store.upsert(
+                ids=[job.ids[j] for j, _ in part],
+                documents=[job.texts[j] for j, _ in part],
+                embeddings=[vec for _, vec in part],
+                metadatas=[job.metadatas[j] for j, _ in part],
+            )
+        for i in range(0, len(job.stale_ids), batch_size):
+            await store.delete_by_ids(ids=job.stale_ids[i : i + batch_size])
+        kept_idx = [j for j in range(len(job.ids)) if j not in new_set]
+        refresh = [j for j in kept_idx if j != rel]
+        for i in range(0, len(refresh), batch_size):
+            idx = refresh[i : i + batch_size]
+            await store.update_metadatas(
+                ids=[job.ids[j] for j in idx],
+                metadatas=[job.metadatas[j] for j in idx],
+            )
+        if rel is not None:
+            if rel in new_set:
+                await store.upsert(
+                    ids=[job.ids[rel]],
+                    documents=[job.texts[rel]],
+                    embeddings=[job.embeddings[job.new_idx.index(rel)]],
+                    metadatas=[job.metadatas[rel]],
+                )
+            else:
+                await store.update_metadatas(ids=[job.ids[rel]], metadatas=[job.metadatas[rel]])
+        return len(kept_idx)
+
+    chunk_pool: Optional[ProcessChunkPool] = None
+    chunk_workers = pipeline_cfg.chunk_workers
+    if pipeline_cfg.chunk_backend == "process":
+        chunk_pool = ProcessChunkPool(pipeline_cfg.chunk_processes)
+        # Enough in-flight files to keep every worker process busy.
+        chunk_workers = max(chunk_workers, chunk_pool.max_workers)
+        logger.info("Chunking in %d worker processes", chunk_pool.max_workers)
+
+    stages = [
+        Stage("scan", _scan, workers=pipeline_cfg.scan_workers),
+        Stage(
+            "lookup",
+            _lookup,
+            batch_size=pipeline_cfg.lookup_batch,
+            linger_s=pipeline_cfg.lookup_linger_s,
+        ),
+        Stage("chunk", _chunk, workers=chunk_workers),
+    ]
+    if not cfg.dry_run:
+        stages.append(Stage("embed", _embed, workers=embed_workers))
+        stages.append(Stage("write", _write, workers=pipeline_cfg.write_workers))
+
+    try:
+        if removed_paths and not cfg.dry_run:
+            assert store is not None
+            for removed in removed_paths:
+                await store.delete_by_path(path=removed)
+                if manifest is not None:
+                    manifest.remove(removed)
+                logger.info("[DELETE] Removed vectors for: %s", removed)
+            stats.files_deleted += len(removed_paths)
+        await run_pipeline(_discover, stages, queue_size=pipeline_cfg.queue_size)
+        if manifest is not None and paths is None:
+            # Files indexed before that disappeared or are no longer
+            # candidates (deleted, newly ignored or excluded): drop their
+            # vectors along with the manifest entry.
+            for stale in manifest.paths():
+                if stale in seen_paths:
+                    continue
+                if not cfg.dry_run and store is not None:
+                    await store.delete_by_path(path=stale)
+                    stats.files_deleted += 1
+                    logger.info("[DELETE] Removed vectors for: %s", stale)
+                manifest.remove(stale)
+        if git_state is not None:
+            assert store is not None
+            await _record_git_run(store, git_state, chunk_fingerprint)
     finally:
-        if embedder is not None and hasattr(embedder, "close"):
-            close_fn = getattr(embedder, "close")
+        if manifest is not None:
+            # Save even after a failure: entries are only recorded for files
+            # whose vectors were fully written, so partial progress is kept.
+            manifest.save()
+        if chunk_pool is not None:
+            await asyncio.to_thread(chunk_pool.close)
+        if cache is not None:
+            stats.embedding_cache_hits = cache.hits
+            stats.embedding_cache_misses = cache.misses
+        # Closing the outermost wrapper flushes queued work and closes the
+        # wrapped embedder.
+        closer = embed_client
+        if closer is not None and hasattr(closer, "close"):
+            close_fn = getattr(closer, "close")
             if asyncio.iscoroutinefunction(close_fn):
                 await close_fn()
             else:
@@ -715,9 +1620,10 @@ async def index_directory(
     index_elapsed = time.time() - index_start_time
     logger.info("=" * 80)
     logger.info(
-        "INDEXING COMPLETE | files_seen=%d | files_indexed=%d | chunks=%d | elapsed=%.2fs",
+        "INDEXING COMPLETE | files_seen=%d | files_indexed=%d | files_unchanged=%d | chunks=%d | elapsed=%.2fs",
         stats.files_seen,
         stats.files_indexed,
+        stats.files_unchanged,
         stats.chunks_emitted,
         index_elapsed,
     )
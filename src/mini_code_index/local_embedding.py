@@ -0,0 +1,396 @@
+"""In-process embedding backend: a local ONNX model on CPU.
+
+`OnnxEmbedder` implements the `Embedder` protocol without any network, so
+air-gapped installs and CI can index without an embeddings API. It loads a
+Hugging Face style export: `model.onnx` (or `onnx/model.onnx`) next to a
+`tokenizer.json`, e.g. a small code or sentence embedding model.
+
+Per `embed()` call, texts are tokenized in one Rust batch, sorted by length
+and packed into inference batches whose padded size stays under
+`max_batch_tokens`, so short chunks are not padded to the longest one.
+Inference runs in ONNX Runtime with `threads` intra-op threads; with
+`processes > 0` the batches are spread over a pool of worker processes,
+each with its own session and `threads // processes` threads.
+
+Requires the optional `local` extra: `pip install mini-code-index[local]`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+from .embedding import EmbeddingError
+
+try:  # onnxruntime + tokenizers are optional (the `local` extra)
+    import numpy as np  # type: ignore
+    import onnxruntime as ort  # type: ignore
+    from tokenizers import Tokenizer  # type: ignore
+
+    _HAS_ONNX = True
+except Exception:  # pragma: nocover
+    np = None  # type: ignore
+    ort = None  # type: ignore
+    Tokenizer = None  # type: ignore
+
+    _HAS_ONNX = False
+
+
+POOLING_MODES = ("mean", "cls")
+
+
+def _resolve_paths(model_path: str, tokenizer_path: Optional[str]) -> tuple[str, str]:
+    model_file = model_path
+    if os.path.isdir(model_path):
+        for candidate in ("model.onnx", os.path.join("onnx", "model.onnx")):
+            if os.path.isfile(os.path.join(model_path, candidate)):
+                model_file = os.path.join(model_path, candidate)
+                break
+        else:
+            raise EmbeddingError(f"No model.onnx found in {model_path}")
+    if tokenizer_path is None:
+        base = os.path.dirname(os.path.abspath(model_file))
+        for directory in (base, os.path.dirname(base)):
+            if os.path.isfile(os.path.join(directory, "tokenizer.json")):
+                tokenizer_path = os.path.join(directory, "tokenizer.json")
+                break
+        else:
+            raise EmbeddingError(f"No tokenizer.json found next to {model_file}")
+    return model_file, tokenizer_path
+
+
+def _file_fingerprint(*paths: str) -> str:
+    """Short digest of the files' identity (path, size, mtime), not their bytes.
+
+    Model files run to hundreds of MB, so they are not hashed; replacing or
+    re-exporting a model changes its size or mtime all the same.
+    """
+
+    h = hashlib.sha256()
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}\0".encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def _length_batches(lengths: Sequence[int], *, batch_size: int, max_batch_tokens: int) -> list[list[int]]:
+    """Group indices by length so each batch pads to at most `max_batch_tokens`.
+
+    Indices are visited shortest first, so the newest member of a batch is its
+    longest and the padded size is `len(batch) * lengths[newest]`.
+    """
+
+    batches: list[list[int]] = []
+    current: list[int] = []
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        longest = max(1, lengths[i])
+        if current and (
+            len(current) >= batch_size or (len(current) + 1) * longest > max_batch_tokens
+        ):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _load_session(model_file: str, threads: int) -> Any:
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = threads
+    opts.inter_op_num_threads = 1
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(model_file, sess_options=opts, providers=["CPUExecutionProvider"])
+
+
+def _run_session(
+    session: Any,
+    feeds: dict[str, Any],
+    *,
+    pooling: str,
+    normalize: bool,
+    output_name: Optional[str],
+) -> Any:
+    """Run one padded batch and pool it to a float32 (batch, dim) matrix."""
+
+    names = {i.name for i in session.get_inputs()}
+    outputs = session.run(
+        [output_name] if output_name else None,
+        {k: v for k, v in feeds.items() if k in names},
+    )
+    hidden = np.asarray(outputs[0], dtype=np.float32)
+    if hidden.ndim == 3:
+        if pooling == "cls":
+            hidden = hidden[:, 0, :]
+        else:
+            mask = feeds["attention_mask"].astype(np.float32)[:, :, None]
+            hidden = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+    elif hidden.ndim != 2:
+        raise EmbeddingError(f"Unexpected model output shape {hidden.shape}")
+    if normalize:
+        norms = np.linalg.norm(hidden, axis=1, keepdims=True)
+        hidden = hidden / np.maximum(norms, 1e-12)
+    return np.ascontiguousarray(hidden, dtype=np.float32)
+
+
+# Worker-process state for the pooled backend: one session per process.
+_WORKER_SESSION: Any = None
+
+
+def _init_worker(model_file: str, threads: int) -> None:
+    global _WORKER_SESSION
+    _WORKER_SESSION = _load_session(model_file, threads)
+
+
+def _run_in_worker(
+    feeds: dict[str, Any], pooling: str, normalize: bool, output_name: Optional[str]
+) -> Any:
+    return _run_session(
+        _WORKER_SESSION, feeds, pooling=pooling, normalize=normalize, output_name=output_name
+    )
+
+
+@dataclass
+class OnnxEmbedder:
+    """Local CPU embedder over an ONNX model and a `tokenizers` tokenizer.
+
+    `model_path` is a `.onnx` file or a directory holding `model.onnx` (or
+    `onnx/model.onnx`); `tokenizer_path` defaults to the `tokenizer.json`
+    beside it. Token embeddings are mean-pooled over the attention mask
+    (`pooling="cls"` takes the first token; 2-D outputs are used as is) and
+    L2-normalized unless `normalize=False`. When `dimensions` is set, the
+    model's output width must match it.
+
+    `batch_size` is what callers such as `EmbeddingCoalescer` send per
+    `embed()` call; inside a call, inference batches hold at most
+    `inference_batch_size` texts and `max_batch_tokens` padded tokens.
+
+    Env defaults (`from_env`):
+    - LOCAL_EMBEDDING_MODEL (required)
+    - LOCAL_EMBEDDING_THREADS, LOCAL_EMBEDDING_PROCESSES, LOCAL_EMBEDDING_MAX_LENGTH
+    """
+
+    model_path: str
+    tokenizer_path: Optional[str] = None
+    # Part of the embedding cache key. The default names the model directory,
+    # the settings that change the vectors and a fingerprint of the model and
+    # tokenizer files: "local:<dir>:<pooling>:<norm|raw>:<max_length>:<digest>".
+    model: Optional[str] = None
+    dimensions: Optional[int] = None
+    max_length: int = 512
+    batch_size: int = 64
+    inference_batch_size: int = 32
+    max_batch_tokens: int = 16384
+    # Intra-op threads in total (default: os.cpu_count()).
+    threads: Optional[int] = None
+    # Worker processes; 0 runs inference in a thread of this process.
+    processes: int = 0
+    pooling: str = "mean"
+    normalize: bool = True
+    output_name: Optional[str] = None
+    token_limit: Optional[int] = None
+
+    _model_file: Optional[str] = field(default=None, init=False, repr=False)
+    _tokenizer_file: Optional[str] = field(default=None, init=False, repr=False)
+    _tokenizer: Any = field(default=None, init=False, repr=False)
+    _pad_id: int = field(default=0, init=False, repr=False)
+    _session: Any = field(default=None, init=False, repr=False)
+    _pool: Optional[ProcessPoolExecutor] = field(default=None, init=False, repr=False)
+    _lock: Any = field(default=None, init=False, repr=False)
+    _init_lock: Any = field(default=None, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if not _HAS_ONNX:
+            raise EmbeddingError(
+                "Local embeddings need onnxruntime and tokenizers. "
+                "Install them with `pip install mini-code-index[local]`."
+            )
+        if self.pooling not in POOLING_MODES:
+            raise ValueError(f"pooling must be one of {POOLING_MODES}")
+        for name in ("max_length", "batch_size", "inference_batch_size", "max_batch_tokens"):
+            if int(getattr(self, name)) <= 0:
+                raise ValueError(f"{name} must be > 0")
+        if self.processes < 0:
+            raise ValueError("processes must be >= 0")
+        if self.threads is not None and self.threads <= 0:
+            raise ValueError("threads must be > 0")
+        self._model_file, self._tokenizer_file = _resolve_paths(self.model_path, self.tokenizer_path)
+        if self.model is None:
+            model_dir = os.path.dirname(os.path.abspath(self._model_file))
+            if os.path.basename(model_dir) == "onnx":
+                model_dir = os.path.dirname(model_dir)
+            self.model = ":".join(
+                [
+                    "local",
+                    os.path.basename(model_dir),
+                    self.pooling,
+                    "norm" if self.normalize else "raw",
+                    str(self.max_length),
+                    _file_fingerprint(self._model_file, self._tokenizer_file),
+                ]
+            )
+            if self.output_name:
+                self.model += ":" + self.output_name
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "OnnxEmbedder":
+        model_path = os.environ.get("LOCAL_EMBEDDING_MODEL")
+        if not model_path:
+            raise EmbeddingError("Missing LOCAL_EMBEDDING_MODEL (path to an ONNX model directory)")
+
+        th = os.environ.get("LOCAL_EMBEDDING_THREADS")
+        threads = int(th) if th and str(th).isdigit() else None
+
+        pr = os.environ.get("LOCAL_EMBEDDING_PROCESSES")
+        processes = int(pr) if pr and str(pr).isdigit() else 0
+
+        ml = os.environ.get("LOCAL_EMBEDDING_MAX_LENGTH")
+        max_length = int(ml) if ml and str(ml).isdigit() else 512
+
+        return cls(
+            model_path=model_path, threads=threads, processes=processes, max_length=max_length
+        )
+
+    def _total_threads(self) -> int:
+        return self.threads or os.cpu_count() or 1
+
+    def _get_tokenizer(self) -> Any:
+        if self._tokenizer is not None:
+            return self._tokenizer
+        # `embed` tokenizes in worker threads; build the tokenizer once.
+        with self._init_lock:
+            if self._tokenizer is None:
+                tok = Tokenizer.from_file(self._tokenizer_file)
+                # Batches are padded by hand in `_prepare`; keep the pad id the
+                # tokenizer was exported with before switching its padding off.
+                padding = tok.padding
+                if padding:
+                    self._pad_id = int(padding.get("pad_id", 0))
+                else:
+                    pad_id = tok.token_to_id("[PAD]")
+                    if pad_id is None:
+                        pad_id = tok.token_to_id("<pad>")
+                    self._pad_id = pad_id or 0
+                tok.no_padding()
+                tok.enable_truncation(self.max_length)
+                self._tokenizer = tok
+        return self._tokenizer
+
+    def _get_session(self) -> Any:
+        if self._session is None:
+            self._session = _load_session(self._model_file, self._total_threads())
+        return self._session
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            per_worker = max(1, self._total_threads() // self.processes)
+            # "spawn", as in ProcessChunkPool: the indexer runs threads and an
+            # event loop that do not survive fork().
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self._model_file, per_worker),
+            )
+        return self._pool
+
+    def _prepare(self, texts: Sequence[str]) -> list[tuple[list[int], dict[str, Any]]]:
+        """Tokenize and pack texts into padded, length-sorted feed batches."""
+
+        tokenizer = self._get_tokenizer()
+        encodings = tokenizer.encode_batch(list(texts))
+        lengths = [len(e.ids) for e in encodings]
+        pad_id = self._pad_id
+
+        out: list[tuple[list[int], dict[str, Any]]] = []
+        for idx in _length_batches(
+            lengths, batch_size=self.inference_batch_size, max_batch_tokens=self.max_batch_tokens
+        ):
+            width = max(1, max(lengths[i] for i in idx))
+            input_ids = np.full((len(idx), width), pad_id, dtype=np.int64)
+            attention_mask = np.zeros((len(idx), width), dtype=np.int64)
+            token_type_ids = np.zeros((len(idx), width), dtype=np.int64)
+            for row, i in enumerate(idx):
+                enc = encodings[i]
+                n = lengths[i]
+                input_ids[row, :n] = enc.ids
+                attention_mask[row, :n] = enc.attention_mask
+                token_type_ids[row, :n] = enc.type_ids
+            out.append(
+                (
+                    idx,
+                    {
+                        "input_ids": input_ids,
+                        "attention_mask": attention_mask,
+                        "token_type_ids": token_type_ids,
+                    },
+                )
+            )
+        return out
+
+    def _run_local(self, feeds: dict[str, Any]) -> Any:
+        # One batch at a time: a single run already uses every intra-op thread.
+        with self._lock:
+            return _run_session(
+                self._get_session(),
+                feeds,
+                pooling=self.pooling,
+                normalize=self.normalize,
+                output_name=self.output_name,
+            )
+
+    def _embed_sync(self, texts: Sequence[str]) -> Any:
+        batches = self._prepare(texts)
+        return self._assemble(len(texts), [(idx, self._run_local(feeds)) for idx, feeds in batches])
+
+    def _assemble(self, n: int, results: Sequence[tuple[list[int], Any]]) -> Any:
+        dim = results[0][1].shape[1]
+        if self.dimensions is not None and dim != self.dimensions:
+            raise EmbeddingError(
+                f"Model {self.model} returns {dim}-dimensional vectors, "
+                f"but dimensions={self.dimensions} was configured"
+            )
+        out = np.empty((n, dim), dtype=np.float32)
+        for idx, vectors in results:
+            out[idx] = vectors
+        return out
+
+    async def embed(self, texts: Sequence[str]) -> Sequence[Sequence[float]]:
+        if not texts:
+            return []
+        if self.processes == 0:
+            return await asyncio.to_thread(self._embed_sync, texts)
+
+        batches = await asyncio.to_thread(self._prepare, texts)
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        matrices = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    pool, _run_in_worker, feeds, self.pooling, self.normalize, self.output_name
+                )
+                for _, feeds in batches
+            )
+        )
+        return self._assemble(len(texts), [(idx, m) for (idx, _), m in zip(batches, matrices)])
+
+    async def close(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+        self._session = None
+
+    async def __aenter__(self) -> "OnnxEmbedder":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
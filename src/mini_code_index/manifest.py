@@ -0,0 +1,197 @@
+"""Local on-disk file manifest for incremental indexing.
+
+The manifest remembers, per indexed file, the stat signature seen on the last
+run (size, mtime_ns, inode) together with the content hash, the chunk ids that
+were written and a fingerprint of the chunk config. A later run can then skip
+an unchanged file from a single `stat()`, without reading or hashing it and
+without a round-trip to the vector store.
+
+The manifest is a cache, never the source of truth: a missing or unreadable
+manifest simply means every file is checked the slow way again. It is bound to
+one store through `store_token`, a random value also kept in the collection's
+index state; a manifest whose token does not match the store (the collection
+was reset, or the same name lives on another server) is discarded.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+from dataclasses import asdict, dataclass
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+# Index-state key (see `VectorStore.get_index_state`) holding the store token.
+MANIFEST_TOKEN_KEY = "manifest_token"
+
+# Files modified this close to the moment they were hashed are treated as
+# "racy": coarse filesystem timestamps could hide a second write within the
+# same tick, so we re-hash them next time instead of trusting the stat data.
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def default_manifest_dir() -> str:
+    """Directory holding per-collection manifests (override with MCI_CACHE_DIR)."""
+
+    base = os.environ.get("MCI_CACHE_DIR")
+    if not base:
+        xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        base = os.path.join(xdg, "mini-code-index")
+    return base
+
+
+def default_manifest_path(collection_name: str) -> str:
+    return os.path.join(default_manifest_dir(), collection_name, "manifest.json")
+
+
+@dataclass
+class ManifestEntry:
+    size: int
+    mtime_ns: int
+    inode: int
+    sha256: str
+    # None means "unknown" (e.g. the file was found unchanged in the store and
+    # we never saw which ids it was written under).
+    chunk_ids: Optional[list[str]] = None
+    chunk_fingerprint: str = ""
+    # Wall clock (ns) captured before the file was read for hashing.
+    indexed_at_ns: int = 0
+
+    @classmethod
+    def from_stat(
+        cls,
+        st: os.stat_result,
+        *,
+        sha256: str,
+        chunk_ids: Optional[list[str]],
+        chunk_fingerprint: str,
+        indexed_at_ns: int,
+    ) -> "ManifestEntry":
+        return cls(
+            size=int(st.st_size),
+            mtime_ns=int(st.st_mtime_ns),
+            inode=int(st.st_ino),
+            sha256=sha256,
+            chunk_ids=chunk_ids,
+            chunk_fingerprint=chunk_fingerprint,
+            indexed_at_ns=indexed_at_ns,
+        )
+
+    def matches_stat(self, st: os.stat_result) -> bool:
+        if int(st.st_size) != self.size:
+            return False
+        if int(st.st_mtime_ns) != self.mtime_ns:
+            return False
+        if int(st.st_ino) != self.inode:
+            return False
+        if self.mtime_ns + _RACY_WINDOW_NS >= self.indexed_at_ns:
+            return False
+        return True
+
+
+class FileManifest:
+    """Path -> `ManifestEntry` map persisted as a single JSON file.
+
+    Paths are absolute (the same value stored in chunk metadata `path`).
+    Writes are atomic (temp file + `os.replace`), so an interrupted run leaves
+    either the previous manifest or the new one on disk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        entries: Optional[dict[str, ManifestEntry]] = None,
+        *,
+        store_token: str = "",
+    ) -> None:
+        self.path = path
+        self.store_token = store_token
+        self._entries: dict[str, ManifestEntry] = dict(entries or {})
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> "FileManifest":
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable manifest %s: %s", path, e)
+            return cls(path)
+
+        if not isinstance(payload, dict) or payload.get("version") != MANIFEST_VERSION:
+            logger.warning("Ignoring manifest with unknown version: %s", path)
+            return cls(path)
+
+        entries: dict[str, ManifestEntry] = {}
+        for file_path, raw in (payload.get("files") or {}).items():
+            try:
+                entries[file_path] = ManifestEntry(**raw)
+            except TypeError:
+                continue
+        return cls(path, entries, store_token=str(payload.get("store_token") or ""))
+
+    def bind(self, store_token: str) -> bool:
+        """Tie the manifest to `store_token`; drop all entries on a mismatch.
+
+        Returns True when the existing entries were kept.
+        """
+
+        if self.store_token == store_token:
+            return True
+        if self._entries:
+            logger.info("Discarding manifest %s: it belongs to a different store", self.path)
+        self._entries.clear()
+        self.store_token = store_token
+        self._dirty = True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, file_path: str) -> bool:
+        return file_path in self._entries
+
+    def paths(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def get(self, file_path: str) -> Optional[ManifestEntry]:
+        return self._entries.get(file_path)
+
+    def set(self, file_path: str, entry: ManifestEntry) -> None:
+        self._entries[file_path] = entry
+        self._dirty = True
+
+    def remove(self, file_path: str) -> None:
+        if self._entries.pop(file_path, None) is not None:
+            self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        payload: dict[str, Any] = {
+            "version": MANIFEST_VERSION,
+            "store_token": self.store_token,
+            "files": {p: asdict(e) for p, e in self._entries.items()},
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=directory or None, prefix=".manifest-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._dirty = False
@@ -0,0 +1,140 @@
+"""Compiled include/exclude path matching for directory scans.
+
+All glob patterns of a config are translated once into a single regular
+expression per side (include / exclude), instead of calling `fnmatch` per
+pattern per file. Glob semantics:
+
+- `*`, `?` and `[...]` match within one path segment (never across `/`)
+- `**` matches any number of whole segments, including none
+  (`**/x` matches `x` and `a/b/x`; `a/**` matches everything below `a`)
+- a pattern without any `/` matches the file name at any depth
+  (`*.py` matches `a.py` and `pkg/a.py`)
+
+Exclude patterns ending in `/**` also describe whole directories, so scans can
+prune those directories before descending into them.
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Optional, Pattern, Sequence
+
+
+def _segment_to_regex(segment: str) -> str:
+    out: list[str] = []
+    i, n = 0, len(segment)
+    while i < n:
+        c = segment[i]
+        i += 1
+        if c == "\\" and i < n:
+            # Backslash escapes the next character ("\*", "\ ", "\#").
+            out.append(re.escape(segment[i]))
+            i += 1
+        elif c == "*":
+            while i < n and segment[i] == "*":
+                i += 1
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and segment[j] in "!^":
+                j += 1
+            if j < n and segment[j] == "]":
+                j += 1
+            while j < n and segment[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+                continue
+            body = segment[i:j].replace("\\", "\\\\")
+            i = j + 1
+            if body[:1] in ("!", "^"):
+                body = "^" + body[1:]
+            out.append(f"(?!/)[{body}]")
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
+def glob_to_regex(pattern: str, *, anchored: bool = False) -> str:
+    """Translate one glob into a regex over posix relative paths.
+
+    With `anchored=True` a pattern without `/` only matches at the root
+    instead of matching the file name at any depth.
+    """
+
+    pattern = pattern.strip("/") if pattern not in ("", "/") else pattern
+    if not anchored and "/" not in pattern and pattern != "**":
+        return "(?:.*/)?" + _segment_to_regex(pattern)
+
+    segments = pattern.split("/")
+    parts: list[str] = []
+    last = len(segments) - 1
+    for idx, seg in enumerate(segments):
+        if seg == "**":
+            if idx == last:
+                # Trailing `**`: everything below (at least one more segment),
+                # or anything at all for a bare `**`.
+                parts.append(".+" if idx == 0 else "/.+")
+            elif idx == 0:
+                parts.append("(?:.*/)?")
+            else:
+                parts.append("/(?:.*/)?")
+            continue
+        if idx > 0 and segments[idx - 1] != "**":
+            parts.append("/")
+        parts.append(_segment_to_regex(seg))
+    return "".join(parts)
+
+
+def _compile(patterns: Sequence[str], *, anchored: bool = False) -> Optional[Pattern[str]]:
+    if not patterns:
+        return None
+    return re.compile(
+        "|".join(f"(?:{glob_to_regex(p, anchored=anchored)})" for p in patterns),
+        re.DOTALL,
+    )
+
+
+def _dir_prefix(pattern: str) -> Optional[str]:
+    """`prefix/**` -> `prefix`: the pattern excludes every path under a directory."""
+
+    pattern = pattern.rstrip("/")
+    if pattern.endswith("/**") and len(pattern) > 3:
+        return pattern[:-3]
+    return None
+
+
+class PathMatcher:
+    """Include/exclude matcher over posix-style paths relative to the root."""
+
+    def __init__(self, include: Sequence[str], exclude: Sequence[str]) -> None:
+        self._include = _compile(include)
+        self._exclude = _compile(exclude)
+        dir_patterns = [p for p in (_dir_prefix(x) for x in exclude) if p]
+        # `build/**` prunes only the top-level `build`, so keep prefixes anchored.
+        self._exclude_dirs = _compile(dir_patterns, anchored=True)
+
+    def matches(self, rel_posix: str) -> bool:
+        """True when a file path is included and not excluded."""
+
+        if self._exclude is not None and self._exclude.fullmatch(rel_posix):
+            return False
+        if self._include is None:
+            return False
+        return self._include.fullmatch(rel_posix) is not None
+
+    def excludes(self, rel_posix: str) -> bool:
+        return self._exclude is not None and self._exclude.fullmatch(rel_posix) is not None
+
+    def excludes_dir(self, rel_posix: str) -> bool:
+        """True when everything below directory `rel_posix` is excluded."""
+
+        return self._exclude_dirs is not None and self._exclude_dirs.fullmatch(rel_posix) is not None
+
+
+@lru_cache(maxsize=64)
+def compile_path_matcher(include: tuple[str, ...], exclude: tuple[str, ...]) -> PathMatcher:
+    return PathMatcher(include, exclude)
@@ -0,0 +1,175 @@
+"""Tiny staged-pipeline runner used by `index_directory`.
+
+A pipeline is a source coroutine followed by a list of stages. Stages are
+connected by bounded `asyncio.Queue`s, and each stage runs its own pool of
+worker coroutines, so a slow stage (e.g. waiting on the embeddings endpoint)
+applies backpressure upstream without blocking the other stages.
+
+Stage functions receive an item and an `emit` callable that pushes results to
+the next stage (zero, one or many per input). Batching stages receive a list
+of up to `batch_size` items, waiting at most `linger_s` for a batch to fill.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+Emit = Callable[[Any], Awaitable[None]]
+
+_DONE = object()
+
+
+@dataclass
+class PipelineConfig:
+    """Per-stage concurrency and queue sizes for `index_directory`."""
+
+    # Paths pulled from the directory walker per thread hop.
+    discover_batch: int = 256
+    # Stat + text sniff + sha256.
+    scan_workers: int = 4
+    # Max paths per bulk store lookup.
+    lookup_batch: int = 256
+    # How long a lookup batch waits for more paths before it is sent.
+    lookup_linger_s: float = 0.05
+    # Tree-sitter chunking + metadata building.
+    chunk_workers: int = 4
+    # "thread" chunks via asyncio.to_thread (GIL-bound); "process" uses a
+    # ProcessChunkPool so chunking scales with cores.
+    chunk_backend: str = "thread"
+    # Worker processes for the "process" backend (default: os.cpu_count()).
+    chunk_processes: Optional[int] = None
+    # Files waiting on the embedder concurrently. With coalescing these only
+    # wait for vectors, so many of them are cheap and keep batches full.
+    embed_workers: int = 64
+    # Max concurrent requests to the embeddings endpoint.
+    embed_requests: int = 4
+    # Merge chunks from many files into full embedding requests.
+    coalesce_embeddings: bool = True
+    # How long a partial embedding batch waits for more chunks.
+    coalesce_max_wait_s: float = 0.05
+    # Concurrent store writes (delete + upsert).
+    write_workers: int = 2
+    # Capacity of each inter-stage queue.
+    queue_size: int = 64
+    # Files at least this large are chunked, embedded and written in windows
+    # of `stream_window` chunks, so memory per file stays bounded. They are
+    # chunked in a thread even with the "process" backend. None disables it.
+    stream_min_bytes: Optional[int] = 8 * 1024 * 1024
+    stream_window: int = 256
+
+    def __post_init__(self) -> None:
+        for name in (
+            "discover_batch",
+            "scan_workers",
+            "lookup_batch",
+            "chunk_workers",
+            "embed_workers",
+            "embed_requests",
+            "write_workers",
+            "queue_size",
+            "stream_window",
+        ):
+            if int(getattr(self, name)) <= 0:
+                raise ValueError(f"{name} must be > 0")
+        if self.chunk_backend not in {"thread", "process"}:
+            raise ValueError('chunk_backend must be "thread" or "process"')
+        if self.chunk_processes is not None and self.chunk_processes <= 0:
+            raise ValueError("chunk_processes must be > 0")
+        if self.stream_min_bytes is not None and self.stream_min_bytes < 0:
+            raise ValueError("stream_min_bytes must be >= 0")
+        if self.lookup_linger_s < 0:
+            raise ValueError("lookup_linger_s must be >= 0")
+        if self.coalesce_max_wait_s < 0:
+            raise ValueError("coalesce_max_wait_s must be >= 0")
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any, Emit], Awaitable[None]]
+    workers: int = 1
+    batch_size: int = 1
+    linger_s: float = 0.0
+
+
+async def _discard(_item: Any) -> None:
+    return None
+
+
+async def run_pipeline(
+    source: Callable[[Emit], Awaitable[None]],
+    stages: Sequence[Stage],
+    *,
+    queue_size: int = 64,
+) -> None:
+    """Run `source` and `stages` concurrently until all input is drained.
+
+    The first failure cancels every other stage and is re-raised.
+    """
+
+    if not stages:
+        await source(_discard)
+        return
+
+    queues: list[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+
+    async def _run_source() -> None:
+        await source(queues[0].put)
+        await queues[0].put(_DONE)
+
+    async def _worker(stage: Stage, in_q: asyncio.Queue, emit: Emit) -> None:
+        while True:
+            item = await in_q.get()
+            if item is _DONE:
+                # Leave the marker for sibling workers. The queue has room:
+                # nothing is ever enqueued after the marker.
+                in_q.put_nowait(_DONE)
+                return
+            if stage.batch_size <= 1:
+                await stage.fn(item, emit)
+                continue
+            batch = [item]
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + stage.linger_s
+            while len(batch) < stage.batch_size:
+                try:
+                    nxt = in_q.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        nxt = await asyncio.wait_for(in_q.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if nxt is _DONE:
+                    in_q.put_nowait(_DONE)
+                    break
+                batch.append(nxt)
+            await stage.fn(batch, emit)
+
+    async def _run_stage(idx: int) -> None:
+        stage = stages[idx]
+        out_q = queues[idx + 1] if idx + 1 < len(stages) else None
+        emit = out_q.put if out_q is not None else _discard
+        await asyncio.gather(
+            *(_worker(stage, queues[idx], emit) for _ in range(max(1, stage.workers)))
+        )
+        if out_q is not None:
+            await out_q.put(_DONE)
+
+    tasks = [asyncio.ensure_future(_run_source())]
+    tasks.extend(asyncio.ensure_future(_run_stage(i)) for i in range(len(stages)))
+    try:
+        done, _pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            exc = task.exception()
+            if exc is not None:
+                raise exc
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,363 @@
+"""Process-wide adaptive rate limiting for the embeddings endpoint.
+
+Embedding providers enforce per-key quotas on requests/min and tokens/min.
+Without coordination every concurrent request discovers the quota on its own
+by getting a 429, sleeps its own backoff and retries together with all the
+others. `AdaptiveRateLimiter` is shared by every embedder talking to the same
+endpoint and model (see `shared_rate_limiter`) and paces them as one client:
+
+- two token buckets meter requests/min and (estimated) tokens/min at
+  `headroom` of the quota, so we sit just under it instead of bouncing off it;
+- quotas are learned from `x-ratelimit-limit-*` headers when not configured,
+  and `x-ratelimit-remaining-*` / `x-ratelimit-reset-*` drain the buckets or
+  pause everyone until the provider's window resets;
+- a 429 pauses all callers for its `Retry-After` and halves the concurrency
+  limit; successes grow it back by about one slot per round of requests
+  (AIMD).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SCALE = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse `x-ratelimit-reset-*` values such as "1s", "6m0s" or "250ms"."""
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    return sum(float(n) * _DURATION_SCALE[u] for n, u in parts)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a `Retry-After` header given in seconds (HTTP dates are ignored)."""
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _header(headers: Optional[Mapping[str, str]], name: str) -> Optional[str]:
+    if not headers:
+        return None
+    try:
+        return headers.get(name)
+    except Exception:
+        return None
+
+
+class _TokenBucket:
+    """Continuously refilled bucket; callers may overdraw it into debt.
+
+    A request bigger than the bucket waits for a full bucket and then takes
+    its whole cost, so large requests still count fully against the rate.
+    """
+
+    def __init__(self, per_min: float, *, burst_s: float, now: float) -> None:
+        self.per_min = per_min
+        self.burst_s = burst_s
+        self.level = self.capacity
+        self.updated = now
+
+    @property
+    def rate(self) -> float:
+        return self.per_min / 60.0
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate * self.burst_s)
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        self.refill(now)
+        need = min(cost, self.capacity)
+        if self.level >= need:
+            return 0.0
+        return (need - self.level) / self.rate
+
+    def take(self, cost: float) -> None:
+        self.level -= cost
+
+    def set_rate(self, per_min: float, now: float) -> None:
+        self.refill(now)
+        self.per_min = per_min
+        self.level = min(self.level, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """Token buckets plus an AIMD concurrency limit, shared across callers.
+
+    Usage per HTTP attempt::
+
+        async with limiter.slot(tokens):
+            resp = ...
+            limiter.observe_headers(resp.headers)
+            if resp.status == 429:
+                limiter.on_throttle(retry_after)
+            else:
+                limiter.on_success()
+
+    `requests_per_min` / `tokens_per_min` are the provider quotas; None means
+    unknown until a response carries `x-ratelimit-limit-*` headers. The
+    buckets run at `headroom` times the quota.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_min: Optional[float] = None,
+        tokens_per_min: Optional[float] = None,
+        headroom: float = 0.9,
+        burst_s: float = 1.0,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        initial_concurrency: Optional[int] = None,
+        decrease_factor: float = 0.5,
+        decrease_cooldown_s: float = 1.0,
+        default_retry_after_s: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not 0.0 < headroom <= 1.0:
+            raise ValueError("headroom must be in (0, 1]")
+        if burst_s <= 0:
+            raise ValueError("burst_s must be > 0")
+        if min_concurrency <= 0 or max_concurrency < min_concurrency:
+            raise ValueError("need 0 < min_concurrency <= max_concurrency")
+        if not 0.0 < decrease_factor < 1.0:
+            raise ValueError("decrease_factor must be in (0, 1)")
+        for name, value in (("requests_per_min", requests_per_min), ("tokens_per_min", tokens_per_min)):
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be > 0")
+
+        self.headroom = headroom
+        self.burst_s = burst_s
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown_s = decrease_cooldown_s
+        self.default_retry_after_s = default_retry_after_s
+        self._clock = clock
+
+        self._limit = float(
+            max_concurrency if initial_concurrency is None else initial_concurrency
+        )
+        self._limit = min(float(max_concurrency), max(float(min_concurrency), self._limit))
+        self._active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._blocked_until = 0.0
+        self._last_decrease = float("-inf")
+
+        # Configured quotas cap whatever the headers advertise.
+        self._configured = {"requests": requests_per_min, "tokens": tokens_per_min}
+        now = clock()
+        self._buckets: dict[str, Optional[_TokenBucket]] = {
+            kind: None if quota is None else _TokenBucket(quota * headroom, burst_s=burst_s, now=now)
+            for kind, quota in self._configured.items()
+        }
+
+        # Counters, for logs and tests.
+        self.requests = 0
+        self.throttled = 0
+
+    @property
+    def concurrency(self) -> int:
+        return int(self._limit)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def configure(
+        self, *, requests_per_min: Optional[float] = None, tokens_per_min: Optional[float] = None
+    ) -> None:
+        """Tighten the configured quotas (later embedders may know their limits)."""
+
+        now = self._clock()
+        for kind, quota in (("requests", requests_per_min), ("tokens", tokens_per_min)):
+            if quota is None:
+                continue
+            current = self._configured[kind]
+            self._configured[kind] = quota if current is None else min(current, quota)
+            self._set_quota(kind, self._configured[kind], now)
+
+    def _set_quota(self, kind: str, quota: float, now: float) -> None:
+        configured = self._configured[kind]
+        if configured is not None:
+            quota = min(quota, configured)
+        bucket = self._buckets[kind]
+        if bucket is None:
+            self._buckets[kind] = _TokenBucket(quota * self.headroom, burst_s=self.burst_s, now=now)
+        else:
+            bucket.set_rate(quota * self.headroom, now)
+
+    async def acquire(self, tokens: int = 1) -> None:
+        """Wait for a concurrency slot, quota in both buckets and any pause."""
+
+        costs = {"requests": 1.0, "tokens": float(max(1, tokens))}
+        while True:
+            now = self._clock()
+            wait = self._blocked_until - now
+            if wait <= 0 and self._active < self.concurrency:
+                wait = max(
+                    (b.wait_time(costs[k], now) for k, b in self._buckets.items() if b is not None),
+                    default=0.0,
+                )
+                if wait <= 0:
+                    for kind, bucket in self._buckets.items():
+                        if bucket is not None:
+                            bucket.take(costs[kind])
+                    self._active += 1
+                    self.requests += 1
+                    return
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except BaseException:
+                # Pass a wakeup we may have consumed on to the next waiter.
+                if fut.done() and not fut.cancelled():
+                    self._wake(1)
+                raise
+            finally:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+
+    def release(self) -> None:
+        self._active = max(0, self._active - 1)
+        self._wake(self.concurrency - self._active)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 1) -> AsyncIterator[None]:
+        await self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _wake(self, n: int) -> None:
+        while n > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                n -= 1
+
+    def on_success(self) -> None:
+        """Additive increase: about +1 slot per `concurrency` successes."""
+
+        if self._limit < self.max_concurrency:
+            before = self.concurrency
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+            if self.concurrency > before:
+                self._wake(self.concurrency - self._active)
+
+    def on_throttle(self, retry_after_s: Optional[float] = None) -> float:
+        """Record a 429: pause every caller and shrink the concurrency limit.
+
+        Returns the pause in seconds. Several 429s from one burst only shrink
+        the limit once per `decrease_cooldown_s`.
+        """
+
+        self.throttled += 1
+        delay = self.default_retry_after_s if retry_after_s is None else retry_after_s
+        now = self._clock()
+        self._blocked_until = max(self._blocked_until, now + delay)
+        for bucket in self._buckets.values():
+            if bucket is not None:
+                bucket.refill(now)
+                bucket.level = min(bucket.level, 0.0)
+        if now - self._last_decrease >= self.decrease_cooldown_s:
+            self._last_decrease = now
+            self._limit = max(float(self.min_concurrency), self._limit * self.decrease_factor)
+            logger.info(
+                "[RATE_LIMIT] throttled; concurrency -> %d, pausing %.2fs", self.concurrency, delay
+            )
+        return delay
+
+    def observe_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Learn quotas and remaining budget from `x-ratelimit-*` headers."""
+
+        now = self._clock()
+        for kind in ("requests", "tokens"):
+            limit = _header(headers, f"x-ratelimit-limit-{kind}")
+            try:
+                quota = float(limit) if limit else None
+            except ValueError:
+                quota = None
+            if quota is not None and quota > 0:
+                bucket = self._buckets[kind]
+                expected = min(quota, self._configured[kind] or quota) * self.headroom
+                if bucket is None or bucket.per_min != expected:
+                    self._set_quota(kind, quota, now)
+
+            bucket = self._buckets[kind]
+            remaining = _header(headers, f"x-ratelimit-remaining-{kind}")
+            try:
+                left = float(remaining) if remaining else None
+            except ValueError:
+                left = None
+            if left is None:
+                continue
+            if bucket is not None:
+                bucket.refill(now)
+                bucket.level = min(bucket.level, left)
+            if left <= 0:
+                reset = parse_reset_duration(_header(headers, f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self._blocked_until = max(self._blocked_until, now + reset)
+
+
+_SHARED: dict[tuple[str, str], AdaptiveRateLimiter] = {}
+
+
+def shared_rate_limiter(
+    endpoint: str,
+    model: str,
+    *,
+    requests_per_min: Optional[float] = None,
+    tokens_per_min: Optional[float] = None,
+) -> AdaptiveRateLimiter:
+    """Return the process-wide limiter for one endpoint and model.
+
+    Quotas passed here tighten the shared limiter's configured quotas.
+    """
+
+    key = (endpoint, model)
+    limiter = _SHARED.get(key)
+    if limiter is None:
+        limiter = AdaptiveRateLimiter(
+            requests_per_min=requests_per_min, tokens_per_min=tokens_per_min
+        )
+        _SHARED[key] = limiter
+    else:
+        limiter.configure(requests_per_min=requests_per_min, tokens_per_min=tokens_per_min)
+    return limiter
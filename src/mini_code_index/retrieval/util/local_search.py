@@ -10,6 +10,8 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple, TypedDict
 
+from mini_code_index.ignore import iter_unignored_files
+
 
 class TextSearchResult(TypedDict):
     path: str
@@ -55,11 +57,11 @@ def _iter_files(
     include_glob: Optional[str] = None,
     exclude_glob: Optional[str] = None,
 ) -> Iterable[Tuple[Path, str]]:
+    # Ignored subtrees (.gitignore/.ignore/.mciignore) and `.git` are pruned
+    # before descending, so searches skip node_modules, build output, etc.
     root = Path(root_dir).resolve()
-    for path in root.rglob("*"):
-        if not path.is_file():
-            continue
-        rel = path.relative_to(root).as_posix()
+    for abs_path, rel in iter_unignored_files(str(root)):
+        path = Path(abs_path)
         if include_glob and not fnmatch.fnmatch(rel, include_glob):
             continue
         if exclude_glob and fnmatch.fnmatch(rel, exclude_glob):
@@ -7,7 +7,7 @@ from typing import Any, Dict, List, Mapping, Optional
 from urllib.parse import urlparse
 
 from mini_code_index.db import _collection_name_for_root
-from mini_code_index.embedding import OpenAICompatibleEmbedder
+from mini_code_index.embedding import embedder_from_env
 
 
 def _to_json_str(payload: object) -> str:
@@ -110,7 +110,7 @@ async def code_vector_search_tool(
     include_fields = ["metadatas", "documents", "distances"]
 
     try:
-        embedder = OpenAICompatibleEmbedder.from_env()
+        embedder = embedder_from_env()
     except Exception as e:
         return _to_json_str({"error": f"embedder config missing: {e}"})
 
@@ -0,0 +1,170 @@
+"""Token counting for embedding batch packing.
+
+Batches sent to the embeddings endpoint are packed against the provider's
+token limit. The default `EstimatingTokenCounter` keeps the historic
+`len(text) // 4` estimate, which is cheap but badly off for symbol-heavy code
+and non-ASCII identifiers. `BPETokenCounter` counts with a real byte-level
+BPE vocabulary loaded from a file, so batches can be packed close to the
+limit and oversized inputs can be cut at token boundaries.
+
+Counters also `split` a text into consecutive pieces of at most `max_tokens`
+tokens each; the embedder uses that for its `oversize` policy.
+"""
+
+from __future__ import annotations
+
+import base64
+import functools
+import re
+from typing import Iterable, Mapping, Protocol
+
+# Approximate token estimation: ~4 characters per token for English.
+# This is a rough estimate; real tokenization depends on the model.
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+# GPT-style pre-tokenizer written for the stdlib `re` module: contractions,
+# letter runs with one leading non-letter, digit groups of up to three,
+# punctuation runs and whitespace. BPE merges never cross these pieces.
+_PRETOKENIZE = re.compile(
+    r"""'(?i:[sdmt]|ll|ve|re)"""
+    r"""|(?:[^\r\n\w]|_)?[^\W\d_]+"""
+    r"""|\d{1,3}"""
+    r"""| ?(?:[^\s\w]|_)+[\r\n]*"""
+    r"""|\s*[\r\n]+"""
+    r"""|\s+(?!\S)"""
+    r"""|\s+"""
+)
+
+
+class TokenCounter(Protocol):
+    def count(self, text: str) -> int: ...
+
+    def split(self, text: str, max_tokens: int) -> list[str]: ...
+
+
+class EstimatingTokenCounter:
+    """`len(text) // CHARS_PER_TOKEN_ESTIMATE`, at least 1."""
+
+    def __init__(self, chars_per_token: int = CHARS_PER_TOKEN_ESTIMATE) -> None:
+        if chars_per_token <= 0:
+            raise ValueError("chars_per_token must be > 0")
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return max(1, len(text) // self.chars_per_token)
+
+    def split(self, text: str, max_tokens: int) -> list[str]:
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be > 0")
+        # Any window shorter than (max_tokens + 1) * chars_per_token counts
+        # as at most max_tokens.
+        step = (max_tokens + 1) * self.chars_per_token - 1
+        return [text[i : i + step] for i in range(0, len(text), step)] or [text]
+
+
+class BPETokenCounter:
+    """Byte-level BPE counter over a mergeable-ranks vocabulary.
+
+    `ranks` maps token bytes to merge priority (lower merges first), as in
+    tiktoken's `.tiktoken` files, which `from_file` reads. Pre-tokenization is
+    an stdlib-regex approximation of the GPT pattern, so counts can differ from
+    the provider's tokenizer by a token here and there; pack with a little
+    headroom in `token_limit` if that matters.
+
+    Piece counts are memoized in a bounded dict and whole-text counts in an
+    LRU cache, so counting the same chunk again (coalescer, batching, rate
+    limiter) is a lookup.
+    """
+
+    def __init__(self, ranks: Mapping[bytes, int], *, cache_size: int = 65536) -> None:
+        if not ranks:
+            raise ValueError("ranks must not be empty")
+        self.ranks = dict(ranks)
+        self.cache_size = cache_size
+        self._piece_counts: dict[bytes, int] = {}
+        self._count_cached = functools.lru_cache(maxsize=cache_size)(self._count)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "BPETokenCounter":
+        """Load a tiktoken-style file: one `<base64 token> <rank>` per line."""
+
+        ranks: dict[bytes, int] = {}
+        with open(path, "rb") as f:
+            for lineno, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    token, rank = line.split()
+                    ranks[base64.b64decode(token)] = int(rank)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{lineno}: invalid BPE rank line") from e
+        return cls(ranks, **kwargs)
+
+    def count(self, text: str) -> int:
+        return self._count_cached(text)
+
+    def _count(self, text: str) -> int:
+        return sum(self._piece_count(p) for p in _pieces(text))
+
+    def _piece_count(self, piece: str) -> int:
+        data = piece.encode("utf-8", "surrogatepass")
+        n = self._piece_counts.get(data)
+        if n is None:
+            n = len(self._merge(data))
+            if len(self._piece_counts) >= self.cache_size:
+                self._piece_counts.clear()
+            self._piece_counts[data] = n
+        return n
+
+    def _merge(self, data: bytes) -> list[bytes]:
+        if data in self.ranks:
+            return [data]
+        ranks = self.ranks
+        parts = [data[i : i + 1] for i in range(len(data))]
+        while len(parts) > 1:
+            best = -1
+            best_rank = None
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best, best_rank = i, rank
+            if best < 0:
+                break
+            parts[best : best + 2] = [parts[best] + parts[best + 1]]
+        return parts
+
+    def split(self, text: str, max_tokens: int) -> list[str]:
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be > 0")
+        out: list[str] = []
+        current: list[str] = []
+        current_tokens = 0
+        for piece in _pieces(text):
+            n = self._piece_count(piece)
+            if n > max_tokens:
+                if current:
+                    out.append("".join(current))
+                    current, current_tokens = [], 0
+                out.extend(self._split_piece(piece, max_tokens))
+                continue
+            if current and current_tokens + n > max_tokens:
+                out.append("".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += n
+        if current:
+            out.append("".join(current))
+        return out or [text]
+
+    def _split_piece(self, piece: str, max_tokens: int) -> list[str]:
+        # One pre-token longer than the limit (e.g. a long base64 literal):
+        # halve it by characters until every part fits.
+        if len(piece) <= 1 or self._piece_count(piece) <= max_tokens:
+            return [piece]
+        mid = len(piece) // 2
+        return self._split_piece(piece[:mid], max_tokens) + self._split_piece(piece[mid:], max_tokens)
+
+
+def _pieces(text: str) -> Iterable[str]:
+    return _PRETOKENIZE.findall(text)
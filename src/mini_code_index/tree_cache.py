@@ -0,0 +1,216 @@
+"""Opt-in parse tree cache for incremental re-chunking.
+
+Watch mode and repeated re-indexing chunk the same files over and over, and
+usually only a few lines changed. With a `TreeCache` passed to
+`TreeSitterChunker.chunk(..., tree_cache=...)`:
+
+- the byte-level edit against the previous content of the path (common
+  prefix / suffix) is applied to the cached tree with `Tree.edit`, and the
+  new content is parsed incrementally (`parser.parse(new, old_tree)`);
+- the walker output of the previous run is kept in *segments*: runs of
+  top-level nodes that end where the walker holds no buffered text, so
+  their chunks don't depend on what follows. Segments outside the edited
+  range whose top-level nodes are unchanged are reused (shifted to their new
+  rows); only the segments touching the edit are walked again.
+
+Output is identical to chunking from scratch. Tree-sitter may recover from
+syntax errors differently in an incremental parse, so when the cached or the
+new tree has errors the file is parsed and chunked from scratch instead. Only
+`mode="function"` and `mode="type"` use segment reuse; other modes chunk
+normally.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+# (row, column), 0-indexed like tree-sitter points.
+RawPoint = tuple[int, int]
+
+
+@dataclass(frozen=True)
+class TextEdit:
+    """A single replaced byte range, in the shape `Tree.edit` expects."""
+
+    start_byte: int
+    old_end_byte: int
+    new_end_byte: int
+    start_point: RawPoint
+    old_end_point: RawPoint
+    new_end_point: RawPoint
+
+    @property
+    def delta(self) -> int:
+        return self.new_end_byte - self.old_end_byte
+
+    def as_tree_edit(self) -> dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+def _common_prefix_len(a: bytes, b: bytes) -> int:
+    # Grow the matched prefix by halving steps; each comparison is a memcmp.
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_len(a: bytes, b: bytes, limit: int) -> int:
+    lo, hi = 0, limit
+    la, lb = len(a), len(b)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la - mid : la - lo] == b[lb - mid : lb - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _point_at(data: bytes, pos: int) -> RawPoint:
+    row = data.count(b"\n", 0, pos)
+    return row, pos - (data.rfind(b"\n", 0, pos) + 1)
+
+
+def compute_edit(old: bytes, new: bytes) -> Optional[TextEdit]:
+    """The smallest single edit turning `old` into `new`, or None if equal."""
+
+    if old == new:
+        return None
+    prefix = _common_prefix_len(old, new)
+    suffix = _common_suffix_len(old, new, min(len(old), len(new)) - prefix)
+    old_end = len(old) - suffix
+    new_end = len(new) - suffix
+    return TextEdit(
+        start_byte=prefix,
+        old_end_byte=old_end,
+        new_end_byte=new_end,
+        start_point=_point_at(old, prefix),
+        old_end_point=_point_at(old, old_end),
+        new_end_point=_point_at(new, new_end),
+    )
+
+
+class PointShifter:
+    """Moves chunk positions that lie after an edit to their new rows/columns."""
+
+    def __init__(self, edit: TextEdit) -> None:
+        self._row = edit.old_end_point[0]
+        self._drow = edit.new_end_point[0] - edit.old_end_point[0]
+        self._dcol = edit.new_end_point[1] - edit.old_end_point[1]
+        self._scopes: dict[int, Any] = {}
+
+    def point(self, p: Any) -> Any:
+        if p is None:
+            return None
+        # Chunk points are 1-indexed rows.
+        row0 = p.row - 1
+        column = p.column + self._dcol if row0 == self._row else p.column
+        return type(p)(row=p.row + self._drow, column=column)
+
+    def scope(self, sc: Any) -> Any:
+        shifted = self._scopes.get(id(sc))
+        if shifted is None:
+            # Scopes are immutable and shared; one shifted copy per scope.
+            shifted = dataclasses.replace(sc, start=self.point(sc.start), end=self.point(sc.end))
+            self._scopes[id(sc)] = shifted
+        return shifted
+
+    def chunk(self, c: Any) -> Any:
+        out = clone(c)
+        out.start = self.point(c.start)
+        out.end = self.point(c.end)
+        out.scope_start = self.point(c.scope_start)
+        out.scope_end = self.point(c.scope_end)
+        out.scope_path = [self.scope(s) for s in c.scope_path]
+        out.contained_scopes = [self.scope(s) for s in c.contained_scopes]
+        return out
+
+
+def clone(obj: Any) -> Any:
+    """Shallow copy of a slotted dataclass instance (e.g. a `Chunk`).
+
+    Faster than `dataclasses.replace`, which re-runs `__init__` with every
+    field.
+    """
+
+    cls = type(obj)
+    out = object.__new__(cls)
+    for name in cls.__slots__:
+        object.__setattr__(out, name, getattr(obj, name))
+    return out
+
+
+@dataclass
+class Segment:
+    """Walker output for a run of top-level nodes."""
+
+    # End of the previous segment's last node (0 for the first segment).
+    start_byte: int
+    # End of this segment's last node.
+    end_byte: int
+    first: bool
+    # Ends at a clean walker state (False only for a trailing segment).
+    closed: bool
+    # (type, start, end) of the top-level nodes, relative to start_byte.
+    nodes: tuple[tuple[str, int, int], ...]
+    chunks: list = field(default_factory=list)
+
+
+@dataclass
+class TreeEntry:
+    fingerprint: str
+    language: str
+    content: bytes
+    tree: Any
+    segments: list[Segment]
+
+
+class TreeCache:
+    """LRU map of path -> last parse tree, content and chunk segments.
+
+    Entries are taken out while a file is being chunked, so concurrent
+    chunking of the same path simply misses instead of sharing a tree.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        if max_entries <= 0:
+            raise ValueError("max_entries must be > 0")
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, TreeEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.incremental_parses = 0
+        self.full_parses = 0
+        self.segments_reused = 0
+        self.segments_chunked = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def take(self, path: str) -> Optional[TreeEntry]:
+        with self._lock:
+            return self._entries.pop(path, None)
+
+    def put(self, path: str, entry: TreeEntry) -> None:
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, path: str) -> None:
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,323 @@
+"""Watch mode: keep an index continuously up to date.
+
+Instead of re-running a full `index_directory` on a timer, `watch_directory`
+listens for filesystem events and pushes only the affected paths through the
+normal scan -> chunk -> embed -> write pipeline (`index_directory(paths=...)`).
+
+- Events come from `watchfiles` (inotify/FSEvents/ReadDirectoryChangesW,
+  optional dependency: `pip install mini-code-index[watch]`). Without it, a
+  polling fallback diffs stat snapshots every `poll_interval_s`.
+- Events are filtered with the same include/exclude/hidden/ignore-file rules
+  as `iter_candidate_files`, so churn under `.git/` or ignored build output
+  never wakes the indexer.
+- Bursts (git checkout, formatter runs) are debounced: a batch is flushed once
+  no new event arrived for `debounce_s`, or at most `max_delay_s` after its
+  first event. Paths are coalesced in a set, so a rename (delete + create) or
+  repeated saves cost one pass; deleted paths are removed from the store.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Optional
+
+from .chunking import Config as ChunkConfig
+from .db import VectorStore
+from .embedding import Embedder
+from .ignore import is_ignored
+from .indexing import (
+    IndexConfig,
+    IndexStats,
+    _path_matcher,
+    index_directory,
+    is_candidate_path,
+    iter_candidate_files,
+)
+from .tree_cache import TreeCache
+
+try:  # watchfiles is optional; we fall back to polling without it
+    import watchfiles  # type: ignore
+
+    _HAS_WATCHFILES = True
+except Exception:  # pragma: nocover
+    watchfiles = None  # type: ignore
+    _HAS_WATCHFILES = False
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WatchConfig:
+    # Quiet period after the last event before a batch is indexed.
+    debounce_s: float = 0.5
+    # Upper bound on how long a batch may keep growing under constant churn.
+    max_delay_s: float = 5.0
+    # Interval of the polling fallback (and of watchfiles' own poller).
+    poll_interval_s: float = 2.0
+    # Poll even when native events are available (e.g. network filesystems).
+    force_polling: bool = False
+    # Run a full `index_directory` before watching, to catch up on changes
+    # made while nobody was watching.
+    initial_sync: bool = True
+    # Keep parse trees of indexed files between batches, so an edited file
+    # is reparsed incrementally and only the changed region is re-chunked.
+    incremental_parse: bool = False
+
+    def __post_init__(self) -> None:
+        if self.debounce_s < 0:
+            raise ValueError("debounce_s must be >= 0")
+        if self.max_delay_s < self.debounce_s:
+            raise ValueError("max_delay_s must be >= debounce_s")
+        if self.poll_interval_s <= 0:
+            raise ValueError("poll_interval_s must be > 0")
+
+
+def _is_relevant(cfg: IndexConfig, path: str) -> bool:
+    """Cheap event filter.
+
+    Existing files must be indexing candidates. Anything else (deleted paths,
+    directories) passes unless it is hidden or excluded: it may stand for a
+    deleted file or a whole renamed directory, which `index_directory` resolves.
+    """
+
+    if os.path.isfile(path):
+        return is_candidate_path(cfg, path)
+    root = os.path.abspath(cfg.root_dir)
+    rel = os.path.relpath(os.path.abspath(path), root)
+    if rel == "." or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return False
+    parts = rel.split(os.sep)
+    if not cfg.include_hidden and any(part.startswith(".") for part in parts):
+        return False
+    rel_posix = "/".join(parts)
+    matcher = _path_matcher(cfg)
+    # Directory-style excludes ("**/.venv/**") only match paths below the
+    # directory, so check the path as a directory too.
+    if matcher.excludes(rel_posix) or matcher.excludes_dir(rel_posix):
+        return False
+    return not (
+        cfg.ignore_files
+        and is_ignored(root, rel_posix, is_dir=os.path.isdir(path), names=tuple(cfg.ignore_files))
+    )
+
+
+def _snapshot(cfg: IndexConfig) -> dict[str, tuple[int, int, int]]:
+    snap: dict[str, tuple[int, int, int]] = {}
+    for path in iter_candidate_files(cfg):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        snap[path] = (int(st.st_mtime_ns), int(st.st_size), int(st.st_ino))
+    return snap
+
+
+async def _poll_events(
+    cfg: IndexConfig, watch_cfg: WatchConfig, stop_event: asyncio.Event
+) -> AsyncIterator[set[str]]:
+    previous = await asyncio.to_thread(_snapshot, cfg)
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=watch_cfg.poll_interval_s)
+            return
+        except asyncio.TimeoutError:
+            pass
+        current = await asyncio.to_thread(_snapshot, cfg)
+        changed = {p for p, sig in current.items() if previous.get(p) != sig}
+        changed.update(p for p in previous if p not in current)
+        previous = current
+        if changed:
+            yield changed
+
+
+async def _native_events(
+    cfg: IndexConfig, watch_cfg: WatchConfig, stop_event: asyncio.Event
+) -> AsyncIterator[set[str]]:
+    assert watchfiles is not None
+    async for changes in watchfiles.awatch(
+        os.path.abspath(cfg.root_dir),
+        watch_filter=lambda _change, path: _is_relevant(cfg, path),
+        # watchfiles groups raw events itself; our own debounce spans batches.
+        debounce=max(1, int(watch_cfg.debounce_s * 1000)),
+        stop_event=stop_event,
+        force_polling=watch_cfg.force_polling or None,
+        poll_delay_ms=int(watch_cfg.poll_interval_s * 1000),
+    ):
+        yield {path for _change, path in changes}
+
+
+def iter_change_batches(
+    cfg: IndexConfig, watch_cfg: WatchConfig, stop_event: asyncio.Event
+) -> AsyncIterator[set[str]]:
+    """Raw sets of changed paths, from native events or the polling fallback."""
+
+    if _HAS_WATCHFILES:
+        return _native_events(cfg, watch_cfg, stop_event)
+    logger.info("watchfiles not installed; polling every %.1fs", watch_cfg.poll_interval_s)
+    return _poll_events(cfg, watch_cfg, stop_event)
+
+
+async def watch_directory(
+    *,
+    cfg: IndexConfig,
+    chunk_cfg: Optional[ChunkConfig] = None,
+    embedder: Embedder,
+    store: VectorStore,
+    watch_cfg: Optional[WatchConfig] = None,
+    stop_event: Optional[asyncio.Event] = None,
+    on_batch: Optional[Callable[[IndexStats], None]] = None,
+    **index_kwargs,
+) -> None:
+    """Index `cfg.root_dir`, then keep it in sync until `stop_event` is set.
+
+    `on_batch` is called with the stats of every incremental run. Extra keyword
+    arguments are forwarded to `index_directory`. A failing batch is logged
+    and the watcher keeps running; the next full sync repairs what it missed.
+    """
+
+    if cfg.dry_run:
+        raise ValueError("watch mode needs dry_run=False")
+    watch_cfg = watch_cfg or WatchConfig()
+    if watch_cfg.incremental_parse:
+        index_kwargs.setdefault("tree_cache", TreeCache())
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    pending: set[str] = set()
+    first_event_at: Optional[float] = None
+    last_event_at = 0.0
+    wakeup = asyncio.Event()
+
+    async def _collect() -> None:
+        nonlocal first_event_at, last_event_at
+        async for paths in iter_change_batches(cfg, watch_cfg, stop_event):
+            paths = {p for p in paths if _is_relevant(cfg, p)}
+            if not paths:
+                continue
+            now = loop.time()
+            if not pending:
+                first_event_at = now
+            pending.update(paths)
+            last_event_at = now
+            wakeup.set()
+
+    async def _next_batch() -> Optional[set[str]]:
+        nonlocal first_event_at
+        while not pending:
+            wakeup.clear()
+            stop_wait = asyncio.ensure_future(stop_event.wait())
+            wake_wait = asyncio.ensure_future(wakeup.wait())
+            await asyncio.wait({stop_wait, wake_wait}, return_when=asyncio.FIRST_COMPLETED)
+            stop_wait.cancel()
+            wake_wait.cancel()
+            if stop_event.is_set():
+                return None
+        # Debounce: wait for a quiet period, bounded by max_delay_s.
+        while not stop_event.is_set():
+            assert first_event_at is not None
+            now = loop.time()
+            quiet_at = last_event_at + watch_cfg.debounce_s
+            deadline = first_event_at + watch_cfg.max_delay_s
+            delay = min(quiet_at, deadline) - now
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        batch = set(pending)
+        pending.clear()
+        first_event_at = None
+        return batch
+
+    if watch_cfg.initial_sync:
+        stats = await index_directory(
+            cfg=cfg, chunk_cfg=chunk_cfg, embedder=embedder, store=store, **index_kwargs
+        )
+        logger.info("[WATCH] initial sync: %s", stats)
+
+    collector = asyncio.ensure_future(_collect())
+    logger.info("[WATCH] watching %s", os.path.abspath(cfg.root_dir))
+    try:
+        while not stop_event.is_set():
+            batch = await _next_batch()
+            if collector.done() and collector.exception() is not None:
+                raise collector.exception()  # type: ignore[misc]
+            if not batch:
+                continue
+            logger.info("[WATCH] %d changed path(s)", len(batch))
+            try:
+                stats = await index_directory(
+                    cfg=cfg,
+                    chunk_cfg=chunk_cfg,
+                    embedder=embedder,
+                    store=store,
+                    paths=sorted(batch),
+                    **index_kwargs,
+                )
+            except Exception:
+                logger.exception("[WATCH] indexing %d path(s) failed", len(batch))
+                continue
+            if on_batch is not None:
+                on_batch(stats)
+    finally:
+        stop_event.set()
+        collector.cancel()
+        await asyncio.gather(collector, return_exceptions=True)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m mini_code_index.watch")
+    p.add_argument("root_dir", help="Directory to index and watch")
+    p.add_argument(
+        "--chroma-url",
+        default=os.environ.get("CHROMADB_HOST") or os.environ.get("CHROMA_URL") or "http://127.0.0.1:8010",
+        help="ChromaDB server URL (default: $CHROMADB_HOST)",
+    )
+    p.add_argument("--debounce", type=float, default=0.5, help="Quiet period in seconds (default: %(default)s)")
+    p.add_argument(
+        "--poll",
+        action="store_true",
+        help="Poll instead of using native filesystem events",
+    )
+    p.add_argument("--mode", default="function", help="Chunking mode (default: %(default)s)")
+    p.add_argument(
+        "--incremental-parse",
+        action="store_true",
+        help="Keep parse trees between batches and re-chunk only edited regions",
+    )
+    return p
+
+
+def main(argv: list[str] | None = None) -> int:
+    from .db import ChromaStore
+    from .embedding import embedder_from_env
+    from .logging_utils import setup_logging
+
+    args = _build_parser().parse_args(argv)
+    setup_logging()
+    root = os.path.abspath(args.root_dir)
+
+    async def _run() -> None:
+        await watch_directory(
+            cfg=IndexConfig(root_dir=root, dry_run=False),
+            chunk_cfg=ChunkConfig(mode=args.mode),
+            embedder=embedder_from_env(),
+            store=ChromaStore(base_url=args.chroma_url, root_dir=root),
+            watch_cfg=WatchConfig(
+                debounce_s=args.debounce,
+                force_polling=args.poll,
+                incremental_parse=args.incremental_parse,
+            ),
+        )
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
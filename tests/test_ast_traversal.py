@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import pytest
+
+from mini_code_index.chunking import (
+    Config,
+    TreeSitterChunker,
+    _HAS_TREESITTER,
+    _ScopeIndex,
+    pooled_parser,
+    walk_preorder,
+)
+
+needs_treesitter = pytest.mark.skipif(not _HAS_TREESITTER, reason="tree-sitter not installed")
+
+PY_SRC = """\
+import os
+
+
+class Outer:
+    def a(self):
+        def inner():
+            return 1
+        return inner
+
+    class Nested:
+        def b(self):
+            return 2
+
+
+def top(x):
+    return [x for x in range(3)]
+"""
+
+
+def _recursive_preorder(node) -> list:
+    out = [node]
+    for ch in node.children:
+        out.extend(_recursive_preorder(ch))
+    return out
+
+
+@needs_treesitter
+def test_walk_preorder_matches_recursive_walk() -> None:
+    tree = pooled_parser("python").parse(PY_SRC.encode())
+    expected = [(n.type, n.start_byte, n.end_byte) for n in _recursive_preorder(tree.root_node)]
+    assert [(n.type, n.start_byte, n.end_byte) for n in walk_preorder(tree.root_node)] == expected
+
+    # A walk started below the root stays inside that subtree.
+    cls = tree.root_node.children[1]
+    assert [n.id for n in walk_preorder(cls)] == [n.id for n in _recursive_preorder(cls)]
+
+
+@needs_treesitter
+def test_scope_index_subtree_lookup() -> None:
+    src = PY_SRC.encode()
+    tree = pooled_parser("python").parse(src)
+    chunker = TreeSitterChunker(Config(mode="function"))
+    index = _ScopeIndex(list(chunker._iter_scopes(tree.root_node, language="python", text_bytes=src)))
+    assert [sc.name for _, sc in index.entries] == ["Outer", "a", "inner", "Nested", "b", "top"]
+
+    for node in walk_preorder(tree.root_node):
+        expected = [sc.name for _, sc in chunker._iter_scopes(node, language="python", text_bytes=src)]
+        assert [sc.name for sc in index.within(node)] == expected
+
+
+@needs_treesitter
+@pytest.mark.parametrize("mode", ["function", "type", "auto_ast", "file"])
+def test_deep_nesting_does_not_hit_recursion_limit(mode: str) -> None:
+    depth = 3000
+    src = "".join(f'{{"k{i}": ' for i in range(depth)) + "1" + "}" * depth
+    chunks = list(TreeSitterChunker(Config(chunk_size=200, mode=mode)).chunk_str(src, path="deep.json"))
+    assert chunks
+    assert "".join(c.text for c in chunks).count('"k') >= depth
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+from mini_code_index.chunking import Config, TreeSitterChunker, _HAS_TREESITTER
+
+BENCH_PATH = Path(__file__).resolve().parent.parent / "benchmarks" / "bench_chunking.py"
+
+needs_treesitter = pytest.mark.skipif(not _HAS_TREESITTER, reason="tree-sitter not installed")
+
+
+@pytest.fixture(scope="module")
+def bench():
+    spec = importlib.util.spec_from_file_location("bench_chunking", BENCH_PATH)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["bench_chunking"] = module
+    spec.loader.exec_module(module)
+    yield module
+    sys.modules.pop("bench_chunking", None)
+
+
+@needs_treesitter
+def test_run_reports_every_cell(bench, tmp_path: Path) -> None:
+    results = bench.run(
+        modes=("file", "function"),
+        corpora=["python-nested", "json-huge"],
+        scale=0.05,
+        repeat=1,
+        work_dir=tmp_path,
+    )
+    assert [r.key for r in results] == [
+        "python-nested/file",
+        "python-nested/function",
+        "json-huge/file",
+        "json-huge/function",
+    ]
+    for r in results:
+        assert r.chunks > 0 and r.bytes > 0 and r.peak_bytes > 0
+        assert 0 < r.parse_seconds <= r.seconds
+        assert r.mb_per_s > 0 and r.chunks_per_s > 0
+    assert "json-huge/function" in bench.format_table(results)
+
+    payload = bench.to_payload(results, calibration_s=0.01, scale=0.05)
+    assert bench.compare(results, json.loads(json.dumps(payload)), calibration_s=0.01) == []
+
+
+def test_compare_flags_regressions(bench) -> None:
+    base = bench.Result("c", "function", 1, 1000, 10, 0.100, 0.05, 1_000_000)
+    baseline = bench.to_payload([base], calibration_s=0.01, scale=1.0)
+
+    slower = bench.Result("c", "function", 1, 1000, 10, 0.200, 0.05, 1_000_000)
+    assert len(bench.compare([slower], baseline, calibration_s=0.01)) == 1
+    # A machine measured twice as slow gets proportionally more room.
+    assert bench.compare([slower], baseline, calibration_s=0.02) == []
+
+    changed = bench.Result("c", "function", 1, 1000, 11, 0.100, 0.05, 2_000_000)
+    problems = bench.compare([changed], baseline, calibration_s=0.01)
+    assert any("chunk count" in p for p in problems)
+    assert any("peak memory" in p for p in problems)
+
+
+@needs_treesitter
+def test_baseline_chunk_counts_are_current(bench) -> None:
+    """Chunking output changes must come with a refreshed baseline."""
+
+    baseline = json.loads(bench.DEFAULT_BASELINE.read_text(encoding="utf-8"))
+    files = [(str(p), p.read_bytes()) for p in bench.project_files()]
+    for mode in bench.MODES:
+        chunks, _ = bench._chunk_files(TreeSitterChunker(Config(mode=mode)), files)
+        assert baseline["results"][f"project/{mode}"]["chunks"] == chunks
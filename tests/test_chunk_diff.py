@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+import pytest
+
+from mini_code_index.chunking import Config as ChunkConfig
+from mini_code_index.indexing import IndexConfig, index_directory
+
+
+class CountingEmbedder:
+    def __init__(self) -> None:
+        self.texts: list[str] = []
+
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        self.texts.extend(texts)
+        return [[0.0] for _ in texts]
+
+
+class RecordingStore:
+    """In-memory store that records every write operation by chunk id."""
+
+    collection_name = "diff-test"
+
+    def __init__(self) -> None:
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.state: dict[str, Any] = {}
+        self.upserted: list[str] = []
+        self.deleted: list[str] = []
+        self.updated: list[str] = []
+        self.id_lookups = 0
+
+    def reset_log(self) -> None:
+        self.upserted.clear()
+        self.deleted.clear()
+        self.updated.clear()
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        return next((m for m in self.rows.values() if m["path"] == path), None)
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        wanted = set(paths)
+        return {
+            m["path"]: m["sha256"]
+            for m in self.rows.values()
+            if m["path"] in wanted and m["chunk_kind"] == "relpath"
+        }
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        self.id_lookups += 1
+        return [i for i, m in self.rows.items() if m["path"] == path]
+
+    async def delete_by_path(self, *, path: str) -> None:
+        for i in [i for i, m in self.rows.items() if m["path"] == path]:
+            self.deleted.append(i)
+            del self.rows[i]
+
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        for i in ids:
+            self.deleted.append(i)
+            self.rows.pop(i, None)
+
+    async def update_metadatas(self, *, ids: Sequence[str], metadatas: Sequence[Mapping[str, Any]]) -> None:
+        for i, meta in zip(ids, metadatas):
+            assert i in self.rows
+            self.updated.append(i)
+            self.rows[i] = dict(meta)
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.upserted.append(i)
+            self.rows[i] = dict(meta)
+
+    async def get_index_state(self) -> dict[str, Any]:
+        return dict(self.state)
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        self.state.update(state)
+
+
+@pytest.mark.parametrize("use_manifest", [True, False])
+def test_edit_rewrites_only_changed_chunks(tmp_path: Path, use_manifest: bool) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    funcs = [f"def f{i}(x):\n    return x + {i}\n" for i in range(8)]
+    src = root / "mod.py"
+    src.write_text("\n\n".join(funcs), encoding="utf8")
+
+    store = RecordingStore()
+    embedder = CountingEmbedder()
+    cfg = IndexConfig(
+        root_dir=str(root),
+        dry_run=False,
+        use_manifest=use_manifest,
+        manifest_path=str(tmp_path / "manifest.json"),
+        use_embedding_cache=False,
+    )
+    chunk_cfg = ChunkConfig(chunk_size=40, mode="function")
+
+    first = asyncio.run(index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=embedder, store=store))
+    ids_before = set(store.rows)
+    assert first.chunks_embedded == first.chunks_emitted == len(ids_before)
+
+    funcs[5] = "def f5(x):\n    return x * 5\n"
+    src.write_text("\n\n".join(funcs), encoding="utf8")
+    store.reset_log()
+    embedder.texts.clear()
+
+    second = asyncio.run(index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=embedder, store=store))
+
+    assert second.files_indexed == 1
+    assert second.chunks_embedded == 1
+    assert second.chunks_deleted == 1
+    assert len(store.upserted) == 1 and len(store.deleted) == 1
+    assert "x * 5" in embedder.texts[0]
+    assert set(store.rows) == (ids_before - set(store.deleted)) | set(store.upserted)
+    # Kept chunks were refreshed to the new file version.
+    shas = {m["sha256"] for m in store.rows.values()}
+    assert len(shas) == 1
+    # With a manifest the stored ids come from it, without one from the store.
+    assert store.id_lookups == (0 if use_manifest else 1)
+
+
+def test_chunk_ids_are_deterministic(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.py").write_text("def a():\n    pass\n\n\ndef a():\n    pass\n", encoding="utf8")
+
+    def run() -> set[str]:
+        store = RecordingStore()
+        asyncio.run(
+            index_directory(
+                cfg=IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False, use_embedding_cache=False),
+                chunk_cfg=ChunkConfig(chunk_size=40, mode="function"),
+                embedder=CountingEmbedder(),
+                store=store,
+            )
+        )
+        return set(store.rows)
+
+    first = run()
+    assert first == run()
+    # Duplicate chunks in one file still get distinct ids.
+    assert any(i.endswith("-1") for i in first)
+
+
+class FailingStore(RecordingStore):
+    """Raises on the `fail_at`-th write call (upsert, delete or metadata update)."""
+
+    def __init__(self, fail_at: Optional[int] = None) -> None:
+        super().__init__()
+        self.fail_at = fail_at
+        self.writes = 0
+
+    def _write(self) -> None:
+        self.writes += 1
+        if self.writes == self.fail_at:
+            raise RuntimeError("store went away")
+
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        self._write()
+        await super().delete_by_ids(ids=ids)
+
+    async def update_metadatas(self, *, ids: Sequence[str], metadatas: Sequence[Mapping[str, Any]]) -> None:
+        self._write()
+        await super().update_metadatas(ids=ids, metadatas=metadatas)
+
+    async def upsert(self, **kwargs: Any) -> None:
+        self._write()
+        await super().upsert(**kwargs)
+
+
+@pytest.mark.parametrize("edit", [False, True])
+def test_interrupted_write_is_redone_next_run(tmp_path: Path, edit: bool) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    funcs = [f"def f{i}(x):\n    return x + {i}\n" for i in range(6)]
+    src = root / "mod.py"
+    chunk_cfg = ChunkConfig(chunk_size=40, mode="function")
+
+    def run(store: FailingStore) -> Any:
+        cfg = IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False, use_embedding_cache=False)
+        return asyncio.run(
+            index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=CountingEmbedder(), store=store, batch_size=2)
+        )
+
+    def prepare(fail_at: Optional[int] = None) -> FailingStore:
+        store = FailingStore()
+        src.write_text("\n\n".join(funcs), encoding="utf8")
+        if edit:
+            run(store)
+            src.write_text("\n\n".join(funcs[:2] + ["def g(x):\n    return -x\n"] + funcs[3:]), encoding="utf8")
+        store.writes, store.fail_at = 0, fail_at
+        return store
+
+    probe = prepare()
+    run(probe)
+    total = probe.writes
+    assert total >= 3
+
+    for fail_at in range(1, total + 1):
+        store = prepare(fail_at)
+        with pytest.raises(RuntimeError):
+            run(store)
+        stats = run(store)
+        assert stats.files_indexed == 1, fail_at
+        assert {m["sha256"] for m in store.rows.values()} == {m["sha256"] for m in probe.rows.values()}
+        assert set(store.rows) == set(probe.rows)
+
+
+def test_chroma_metadata_update_drops_removed_keys() -> None:
+    chromadb = pytest.importorskip("chromadb")
+    from mini_code_index.db import ChromaStore
+
+    store = ChromaStore(collection_name="chunk-diff-update-test", _client=chromadb.EphemeralClient())
+
+    async def main() -> Any:
+        await store.upsert(
+            ids=["c1"],
+            documents=["def f(): pass"],
+            embeddings=[[0.0, 1.0]],
+            metadatas=[{"path": "/a.py", "group_id": "g1", "group_index": 0}],
+        )
+        # Kept chunk that is no longer part of a group.
+        await store.update_metadatas(ids=["c1"], metadatas=[{"path": "/a.py", "start_line": 3}])
+        return await store.get_one_by_path(path="/a.py")
+
+    assert dict(asyncio.run(main()) or {}) == {"path": "/a.py", "start_line": 3}
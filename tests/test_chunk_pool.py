@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+from mini_code_index.chunk_pool import ProcessChunkPool
+from mini_code_index.chunking import Config as ChunkConfig, TreeSitterChunker, pack_chunks, unpack_chunks
+from mini_code_index.indexing import IndexConfig, index_directory
+from mini_code_index.pipeline import PipelineConfig
+
+SOURCE = '''
+class Greeter:
+    """Says hello."""
+
+    def hello(self, name):
+        return f"hello {name}"
+
+    def bye(self, name):
+        return f"bye {name}"
+
+
+def main():
+    print(Greeter().hello("world"))
+'''
+
+
+def _write_sources(root: Path, n: int) -> list[Path]:
+    root.mkdir()
+    paths = []
+    for i in range(n):
+        p = root / f"mod{i}.py"
+        p.write_text(SOURCE.replace("Greeter", f"Greeter{i}"), encoding="utf8")
+        paths.append(p)
+    return paths
+
+
+def test_pack_unpack_roundtrip(tmp_path: Path) -> None:
+    (path,) = _write_sources(tmp_path / "repo", 1)
+    cfg = ChunkConfig(chunk_size=80, mode="function")
+    chunks = list(TreeSitterChunker(cfg).chunk(str(path)))
+    assert chunks
+
+    restored = unpack_chunks(pack_chunks(chunks))
+    assert restored == chunks
+
+
+def test_process_pool_matches_in_process_chunking(tmp_path: Path) -> None:
+    paths = _write_sources(tmp_path / "repo", 3)
+    cfg = ChunkConfig(chunk_size=80, mode="function")
+
+    async def main() -> list[list[Any]]:
+        with ProcessChunkPool(2) as pool:
+            return list(await asyncio.gather(*(pool.chunk(str(p), cfg) for p in paths)))
+
+    pooled = asyncio.run(main())
+    expected = [list(TreeSitterChunker(cfg).chunk(str(p))) for p in paths]
+    assert pooled == expected
+
+
+class ZeroEmbedder:
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        return [[0.0] for _ in texts]
+
+
+class DocStore:
+    def __init__(self) -> None:
+        self.docs: list[tuple[str, str, str]] = []
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        return None
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        return {}
+
+    async def delete_by_path(self, *, path: str) -> None:
+        return None
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for doc, meta in zip(documents, metadatas):
+            self.docs.append((meta["path"], meta["chunk_kind"], doc))
+
+
+def test_index_directory_process_backend(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    _write_sources(root, 4)
+
+    def run(backend: str) -> list[tuple[str, str, str]]:
+        store = DocStore()
+        asyncio.run(
+            index_directory(
+                cfg=IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False),
+                chunk_cfg=ChunkConfig(chunk_size=80, mode="function"),
+                embedder=ZeroEmbedder(),
+                store=store,
+                pipeline_cfg=PipelineConfig(chunk_backend=backend, chunk_processes=2),
+            )
+        )
+        return sorted(store.docs)
+
+    assert run("process") == run("thread")
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+from mini_code_index.chunking import Config as ChunkConfig
+from mini_code_index.embedding_cache import CachedEmbedder, EmbeddingCache, cache_key
+from mini_code_index.indexing import IndexConfig, index_directory
+
+
+class ModelEmbedder:
+    model = "fake-model"
+    dimensions = None
+
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(t)), 0.5] for t in texts]
+
+
+def _as_lists(found: Mapping[bytes, Sequence[float]]) -> dict[bytes, list[float]]:
+    return {k: [float(x) for x in v] for k, v in found.items()}
+
+
+def test_cache_roundtrip_and_lru_eviction(tmp_path: Path) -> None:
+    cache = EmbeddingCache(str(tmp_path / "c.sqlite"), max_entries=10)
+    keys = [cache_key(f"t{i}", model="m", dimensions=None) for i in range(10)]
+    cache.put_many((k, [float(i)]) for i, k in enumerate(keys))
+
+    # Touch the first key so it survives eviction.
+    assert _as_lists(cache.get_many([keys[0]])) == {keys[0]: [0.0]}
+    cache.put_many([(cache_key("new", model="m", dimensions=None), [1.0])])
+
+    assert len(cache) <= 10
+    assert keys[0] in cache.get_many(keys)
+    assert keys[1] not in cache.get_many(keys)
+    assert cache.hits > 0 and cache.misses > 0
+    cache.close()
+
+
+def test_cache_tracks_its_size_without_counting(tmp_path: Path) -> None:
+    path = str(tmp_path / "c.sqlite")
+    cache = EmbeddingCache(path, max_entries=8)
+    keys = [cache_key(f"t{i}", model="m", dimensions=None) for i in range(6)]
+    cache.put_many((k, [float(i)]) for i, k in enumerate(keys))
+    # Overwriting existing keys replaces the vectors but adds no rows.
+    cache.put_many((k, [-1.0]) for k in keys[:3])
+    assert cache._count == len(cache) == 6
+    assert _as_lists(cache.get_many([keys[0]])) == {keys[0]: [-1.0]}
+    cache.close()
+
+    cache = EmbeddingCache(path, max_entries=8)
+    assert cache._count == 6
+    cache.put_many((cache_key(f"n{i}", model="m", dimensions=None), [0.0]) for i in range(3))
+    assert cache._count == len(cache) == 7
+    cache.close()
+
+
+def test_cache_key_depends_on_model_and_dimensions() -> None:
+    a = cache_key("x", model="m1", dimensions=None)
+    assert a != cache_key("x", model="m2", dimensions=None)
+    assert a != cache_key("x", model="m1", dimensions=256)
+
+
+def test_cached_embedder_only_sends_misses(tmp_path: Path) -> None:
+    inner = ModelEmbedder()
+
+    async def main() -> tuple[list[list[float]], list[list[float]]]:
+        embedder = CachedEmbedder(inner, EmbeddingCache(str(tmp_path / "c.sqlite")))
+        first = await embedder.embed(["a", "bb", "a"])
+        second = await embedder.embed(["bb", "ccc"])
+        await embedder.close()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert [[float(x) for x in v] for v in first] == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert [[float(x) for x in v] for v in second] == [[2.0, 0.5], [3.0, 0.5]]
+    assert inner.embedded == ["a", "bb", "ccc"]
+
+
+class MemoryStore:
+    collection_name = "cache-test"
+
+    def __init__(self) -> None:
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.state: dict[str, Any] = {}
+
+    async def ping(self) -> bool:
+        return True
+
+    def _ids_for(self, path: str) -> list[str]:
+        return [i for i, m in self.rows.items() if m["path"] == path]
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        ids = self._ids_for(path)
+        return self.rows[ids[0]] if ids else None
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        wanted = set(paths)
+        return {
+            m["path"]: m["sha256"]
+            for m in self.rows.values()
+            if m["path"] in wanted and m["chunk_kind"] == "relpath"
+        }
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        return self._ids_for(path)
+
+    async def delete_by_path(self, *, path: str) -> None:
+        for i in self._ids_for(path):
+            del self.rows[i]
+
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        for i in ids:
+            self.rows.pop(i, None)
+
+    async def update_metadatas(self, *, ids: Sequence[str], metadatas: Sequence[Mapping[str, Any]]) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def get_index_state(self) -> dict[str, Any]:
+        return dict(self.state)
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        self.state.update(state)
+
+
+def test_reembedding_an_edited_file_only_misses_changed_chunks(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    funcs = [f"def f{i}(x):\n    return x + {i}\n" for i in range(10)]
+    src = root / "big.py"
+    src.write_text("\n\n".join(funcs), encoding="utf8")
+
+    inner = ModelEmbedder()
+    store = MemoryStore()
+    cfg = IndexConfig(
+        root_dir=str(root),
+        dry_run=False,
+        use_manifest=False,
+        embedding_cache_path=str(tmp_path / "emb.sqlite"),
+    )
+    chunk_cfg = ChunkConfig(chunk_size=40, mode="function")
+
+    stats = asyncio.run(index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=inner, store=store))
+    assert stats.files_indexed == 1
+    first_total = len(inner.embedded)
+    assert first_total >= 10
+
+    funcs[3] = "def f3(x):\n    return x * 3\n"
+    src.write_text("\n\n".join(funcs), encoding="utf8")
+    inner.embedded.clear()
+    # Force re-embedding every chunk so all of them go through the cache.
+    stats = asyncio.run(
+        index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=inner, store=store, force_upsert=True)
+    )
+
+    assert stats.files_indexed == 1
+    assert len(inner.embedded) == 1
+    assert "x * 3" in inner.embedded[0]
+    assert stats.embedding_cache_misses == 1
+    assert stats.embedding_cache_hits == stats.chunks_emitted - 1
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+import pytest
+
+from mini_code_index.chunking import Config as ChunkConfig
+from mini_code_index.embedding import EmbeddingCoalescer, EmbeddingError
+from mini_code_index.indexing import IndexConfig, index_directory
+
+
+class RecordingEmbedder:
+    """Returns one-element vectors holding each text's length."""
+
+    batch_size = 8
+    token_limit: Optional[int] = None
+
+    def __init__(self) -> None:
+        self.batches: list[list[str]] = []
+        self.closed = False
+
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        self.batches.append(list(texts))
+        await asyncio.sleep(0)
+        return [[float(len(t))] for t in texts]
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def test_coalescer_merges_callers_and_routes_vectors_back() -> None:
+    inner = RecordingEmbedder()
+
+    async def main() -> list[list[list[float]]]:
+        coalescer = EmbeddingCoalescer(inner, max_wait_s=0.01)
+        calls = [coalescer.embed(["x" * (i + 1), "y" * (i + 10)]) for i in range(6)]
+        results = await asyncio.gather(*calls)
+        await coalescer.close()
+        return results
+
+    results = asyncio.run(main())
+
+    assert results == [[[float(i + 1)], [float(i + 10)]] for i in range(6)]
+    # 12 texts with batch_size=8 -> two requests instead of six.
+    assert [len(b) for b in inner.batches] == [8, 4]
+    assert inner.closed
+
+
+def test_coalescer_respects_token_limit() -> None:
+    inner = RecordingEmbedder()
+    inner.token_limit = 10
+
+    async def main() -> None:
+        coalescer = EmbeddingCoalescer(inner, max_wait_s=0.01)
+        await asyncio.gather(*(coalescer.embed(["a" * 16]) for _ in range(5)))
+        with pytest.raises(EmbeddingError):
+            await coalescer.embed(["a" * 400])
+        await coalescer.flush()
+
+    asyncio.run(main())
+
+    # 4 tokens each, limit 10 -> at most two texts per request.
+    assert all(len(b) <= 2 for b in inner.batches)
+    assert sum(len(b) for b in inner.batches) == 5
+
+
+def test_coalescer_failure_reaches_every_waiting_caller() -> None:
+    class FailingEmbedder(RecordingEmbedder):
+        async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+            raise EmbeddingError("down")
+
+    async def main() -> list[Any]:
+        coalescer = EmbeddingCoalescer(FailingEmbedder(), max_wait_s=0.01)
+        return await asyncio.gather(
+            coalescer.embed(["a"]), coalescer.embed(["b"]), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, EmbeddingError) for r in results)
+
+
+class DictStore:
+    def __init__(self) -> None:
+        self.rows: dict[str, tuple[str, Sequence[float]]] = {}
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        return None
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        return {}
+
+    async def delete_by_path(self, *, path: str) -> None:
+        return None
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for chunk_id, doc, emb in zip(ids, documents, embeddings):
+            self.rows[chunk_id] = (doc, emb)
+
+
+def test_index_directory_coalesces_small_files(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    for i in range(20):
+        (root / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n", encoding="utf8")
+
+    inner = RecordingEmbedder()
+    inner.batch_size = 128
+    store = DictStore()
+    stats = asyncio.run(
+        index_directory(
+            cfg=IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False),
+            chunk_cfg=ChunkConfig(chunk_size=200, mode="function"),
+            embedder=inner,
+            store=store,
+        )
+    )
+
+    assert stats.files_indexed == 20
+    assert len(inner.batches) < 20
+    # Every stored vector belongs to its own document.
+    assert all(emb == [float(len(doc))] for doc, emb in store.rows.values())
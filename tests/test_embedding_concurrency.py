@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Sequence
+
+import pytest
+
+from mini_code_index.embedding import EmbeddingError, OpenAICompatibleEmbedder
+
+
+class FakeEmbedder(OpenAICompatibleEmbedder):
+    """Answers requests locally; later batches finish first to shuffle completion order."""
+
+    def __init__(self, *, fail_on: str | None = None, **kwargs: Any) -> None:
+        super().__init__(api_key="test", **kwargs)
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.peak = 0
+        self.started: list[str] = []
+        self.finished: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def _request(self, inputs: Sequence[str]) -> dict[str, Any]:
+        first = inputs[0]
+        self.started.append(first)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            if first == self.fail_on:
+                await asyncio.sleep(0.02)
+                raise EmbeddingError("boom")
+            await asyncio.sleep(0.06 / len(self.started))
+        except asyncio.CancelledError:
+            self.cancelled.append(first)
+            raise
+        finally:
+            self.in_flight -= 1
+        self.finished.append(first)
+        return {
+            "data": [{"index": i, "embedding": [float(t[1:])]} for i, t in enumerate(inputs)]
+        }
+
+
+def _texts(n: int) -> list[str]:
+    return [f"t{i}" for i in range(n)]
+
+
+def _rows(vectors) -> list[list[float]]:
+    """Vectors as plain float lists (the embedder may return a numpy matrix)."""
+
+    return [[float(x) for x in v] for v in vectors]
+
+
+def test_batches_run_concurrently_and_keep_order() -> None:
+    embedder = FakeEmbedder(batch_size=2, max_in_flight=3)
+    vectors = asyncio.run(embedder.embed(_texts(13)))
+
+    assert _rows(vectors) == [[float(i)] for i in range(13)]
+    assert embedder.peak == 3
+    assert len(embedder.started) == 7
+    assert embedder.finished != sorted(embedder.finished, key=lambda t: int(t[1:]))
+
+
+def test_max_in_flight_one_sends_batches_in_turn() -> None:
+    embedder = FakeEmbedder(batch_size=4, max_in_flight=1)
+    vectors = asyncio.run(embedder.embed(_texts(10)))
+
+    assert _rows(vectors) == [[float(i)] for i in range(10)]
+    assert embedder.peak == 1
+    assert embedder.finished == ["t0", "t4", "t8"]
+
+
+def test_first_failure_cancels_the_rest() -> None:
+    embedder = FakeEmbedder(batch_size=1, max_in_flight=2, fail_on="t1")
+    with pytest.raises(EmbeddingError, match="boom"):
+        asyncio.run(embedder.embed(_texts(8)))
+
+    # t0 was in flight next to the failing batch; the queued batches never started.
+    assert embedder.started == ["t0", "t1"]
+    assert embedder.cancelled == ["t0"]
+    assert embedder.finished == []
+    assert embedder.in_flight == 0
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+from array import array
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from mini_code_index.embedding import (
+    EmbeddingError,
+    OpenAICompatibleEmbedder,
+    _HAS_NUMPY,
+    _parse_openai_embeddings_response,
+)
+from mini_code_index.embedding_cache import CachedEmbedder, EmbeddingCache
+
+needs_numpy = pytest.mark.skipif(not _HAS_NUMPY, reason="numpy not installed")
+
+
+def _b64(values: list[float]) -> str:
+    packed = array("f", values)
+    if array("f", [1.0]).tobytes() != b"\x00\x00\x80\x3f":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: Any) -> None:
+        self.status = status
+        self.reason = "fake"
+        self.headers: dict[str, str] = {}
+        self._raw = json.dumps(body)
+
+    async def text(self) -> str:
+        return self._raw
+
+    async def __aenter__(self) -> "FakeResponse":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+
+class FakeSession:
+    """Answers in the requested encoding; optionally rejects encoding_format."""
+
+    closed = False
+
+    def __init__(self, *, reject_encoding: bool = False) -> None:
+        self.reject_encoding = reject_encoding
+        self.bodies: list[dict[str, Any]] = []
+
+    def post(self, url: str, *, json: dict[str, Any], headers: dict[str, str]) -> FakeResponse:
+        self.bodies.append(dict(json))
+        if self.reject_encoding and "encoding_format" in json:
+            return FakeResponse(400, {"error": {"message": "Unknown parameter: 'encoding_format'"}})
+        inputs = json["input"] if isinstance(json["input"], list) else [json["input"]]
+        data = []
+        for i, t in enumerate(inputs):
+            vec = [float(len(t)), 0.5]
+            data.append({"index": i, "embedding": _b64(vec) if json.get("encoding_format") == "base64" else vec})
+        return FakeResponse(200, {"data": data})
+
+
+def _rows(vectors) -> list[list[float]]:
+    return [[float(x) for x in v] for v in vectors]
+
+
+@needs_numpy
+def test_base64_response_decodes_to_float32_matrix() -> None:
+    payload = {
+        "data": [
+            {"index": 1, "embedding": _b64([3.0, -1.5, 0.25])},
+            {"index": 0, "embedding": _b64([1.0, 2.0, 4.0])},
+        ]
+    }
+    mat = _parse_openai_embeddings_response(payload, n_expected=2)
+    assert mat.dtype == "float32" and mat.shape == (2, 3)  # type: ignore[attr-defined]
+    assert _rows(mat) == [[1.0, 2.0, 4.0], [3.0, -1.5, 0.25]]
+
+    floats = {"data": [{"index": 0, "embedding": [1, 2.5]}]}
+    assert _rows(_parse_openai_embeddings_response(floats, n_expected=1)) == [[1.0, 2.5]]
+
+
+def test_malformed_embeddings_are_rejected() -> None:
+    with pytest.raises(EmbeddingError):
+        _parse_openai_embeddings_response({"data": [{"index": 0, "embedding": "not base64!"}]}, 1)
+    with pytest.raises(EmbeddingError):
+        _parse_openai_embeddings_response({"data": [{"index": 0, "embedding": ["x", "y"]}]}, 1)
+
+
+@needs_numpy
+def test_embedder_requests_base64_and_returns_one_matrix() -> None:
+    session = FakeSession()
+    embedder = OpenAICompatibleEmbedder(api_key="test", batch_size=2)
+    embedder._session = session  # type: ignore[assignment]
+
+    vectors = asyncio.run(embedder.embed(["a", "bb", "ccc"]))
+
+    assert [b["encoding_format"] for b in session.bodies] == ["base64", "base64"]
+    assert getattr(vectors, "shape", None) == (3, 2)
+    assert _rows(vectors) == [[1.0, 0.5], [2.0, 0.5], [3.0, 0.5]]
+
+
+def test_embedder_falls_back_when_base64_is_rejected() -> None:
+    session = FakeSession(reject_encoding=True)
+    embedder = OpenAICompatibleEmbedder(api_key="test", max_retries=2)
+    embedder._session = session  # type: ignore[assignment]
+
+    vectors = asyncio.run(embedder.embed(["abcd"]))
+
+    assert _rows(vectors) == [[4.0, 0.5]]
+    assert ["encoding_format" in b for b in session.bodies] == [True, False]
+    assert embedder.encoding_format is None
+
+
+def test_encoding_fallback_does_not_spend_a_retry() -> None:
+    session = FakeSession(reject_encoding=True)
+    embedder = OpenAICompatibleEmbedder(api_key="test", max_retries=1)
+    embedder._session = session  # type: ignore[assignment]
+
+    assert _rows(asyncio.run(embedder.embed(["abc"]))) == [[3.0, 0.5]]
+    assert len(session.bodies) == 2
+
+
+@needs_numpy
+def test_cache_stores_matrix_rows_without_conversion(tmp_path: Path) -> None:
+    session = FakeSession()
+    inner = OpenAICompatibleEmbedder(api_key="test")
+    inner._session = session  # type: ignore[assignment]
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    embedder = CachedEmbedder(inner, cache)
+
+    first = asyncio.run(embedder.embed(["a", "bb"]))
+    again = asyncio.run(embedder.embed(["bb", "a"]))
+
+    assert len(session.bodies) == 1
+    assert _rows(first) == [[1.0, 0.5], [2.0, 0.5]]
+    assert _rows(again) == [[2.0, 0.5], [1.0, 0.5]]
+    # Warm hits come back as one float32 matrix, like fresh embeddings.
+    assert getattr(again, "dtype", None) == "float32" and again.shape == (2, 2)  # type: ignore[attr-defined]
+
+    mixed = asyncio.run(embedder.embed(["a", "dddd"]))
+    assert len(session.bodies) == 2
+    assert getattr(mixed, "dtype", None) == "float32"
+    assert _rows(mixed) == [[1.0, 0.5], [4.0, 0.5]]
+    cache.close()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+import pytest
+
+from mini_code_index.chunking import Config as ChunkConfig
+from mini_code_index.git_changes import changes_since, current_state
+from mini_code_index.indexing import IndexConfig, IndexStats, index_directory
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+
+
+def _git(root: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-C", str(root), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        check=True,
+        capture_output=True,
+    )
+
+
+class ZeroEmbedder:
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        return [[0.0] for _ in texts]
+
+
+class MemoryStore:
+    collection_name = "git-test"
+
+    def __init__(self) -> None:
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.state: dict[str, Any] = {}
+
+    def paths(self) -> set[str]:
+        return {m["path"] for m in self.rows.values()}
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        return next((m for m in self.rows.values() if m["path"] == path), None)
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        wanted = set(paths)
+        return {
+            m["path"]: m["sha256"]
+            for m in self.rows.values()
+            if m["path"] in wanted and m["chunk_kind"] == "relpath"
+        }
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        return [i for i, m in self.rows.items() if m["path"] == path]
+
+    async def delete_by_path(self, *, path: str) -> None:
+        for i in [i for i, m in self.rows.items() if m["path"] == path]:
+            del self.rows[i]
+
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        for i in ids:
+            self.rows.pop(i, None)
+
+    async def update_metadatas(self, *, ids: Sequence[str], metadatas: Sequence[Mapping[str, Any]]) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def get_index_state(self) -> dict[str, Any]:
+        return dict(self.state)
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        self.state.update(state)
+
+
+def _index(root: Path, store: MemoryStore, tmp_path: Path) -> IndexStats:
+    cfg = IndexConfig(
+        root_dir=str(root),
+        dry_run=False,
+        change_detection="git",
+        manifest_path=str(tmp_path / "manifest.json"),
+        use_embedding_cache=False,
+    )
+    return asyncio.run(
+        index_directory(
+            cfg=cfg,
+            chunk_cfg=ChunkConfig(chunk_size=200, mode="function"),
+            embedder=ZeroEmbedder(),
+            store=store,
+        )
+    )
+
+
+def test_git_mode_indexes_only_the_diff(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    _git(root, "init", "-q")
+    for i in range(6):
+        (root / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n", encoding="utf8")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "init")
+
+    store = MemoryStore()
+    first = _index(root, store, tmp_path)
+    assert first.files_seen == 6  # no history yet -> full scan
+    assert store.state["git_commit"]
+
+    (root / "m1.py").write_text("def f1():\n    return 'changed'\n", encoding="utf8")
+    (root / "m2.py").unlink()
+    _git(root, "commit", "-q", "-am", "edit")
+    (root / "new.py").write_text("def n():\n    return 0\n", encoding="utf8")
+    (root / "m3.py").write_text("def f3():\n    return 'dirty'\n", encoding="utf8")
+
+    second = _index(root, store, tmp_path)
+    # m1 (committed), m3 (dirty), new.py (untracked); m2 deleted.
+    assert second.files_seen == 3
+    assert second.files_deleted == 1
+    assert store.paths() == {str(root / f"m{i}.py") for i in (0, 1, 3, 4, 5)} | {str(root / "new.py")}
+
+    # Reverting a dirty file shows up neither in the diff nor in status; it is
+    # re-checked because it was dirty at the previous run.
+    _git(root, "checkout", "--", "m3.py")
+    third = _index(root, store, tmp_path)
+    assert third.files_indexed == 1
+    m3_sha = hashlib.sha256((root / "m3.py").read_bytes()).hexdigest()
+    m3_rows = [m for m in store.rows.values() if m["path"] == str(root / "m3.py")]
+    assert m3_rows and all(m["sha256"] == m3_sha for m in m3_rows)
+
+
+def test_git_history_unavailable_falls_back(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    assert current_state(str(root)) is None  # not a repo
+    _git(root, "init", "-q")
+    (root / "a.py").write_text("x = 1\n", encoding="utf8")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "init")
+    assert changes_since(str(root), None) is None
+    assert changes_since(str(root), "0" * 40) is None
+    state = current_state(str(root))
+    assert state is not None and changes_since(str(root), state.head) is not None
+
+
+def test_chunk_config_change_forces_full_scan(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    _git(root, "init", "-q")
+    (root / "a.py").write_text("def a():\n    return 1\n", encoding="utf8")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "init")
+
+    store = MemoryStore()
+    _index(root, store, tmp_path)
+    store.state["chunk_fingerprint"] = "something-else"
+    stats = _index(root, store, tmp_path)
+    assert stats.files_seen == 1
+
+
+def test_symlinked_root_reports_paths_under_the_link(tmp_path: Path) -> None:
+    real = tmp_path / "real"
+    (real / "pkg").mkdir(parents=True)
+    _git(real, "init", "-q")
+    (real / "pkg" / "a.py").write_text("x = 1\n", encoding="utf8")
+    (real / "top.py").write_text("y = 1\n", encoding="utf8")
+    _git(real, "add", "-A")
+    _git(real, "commit", "-q", "-m", "init")
+    link = tmp_path / "link"
+    link.symlink_to(real, target_is_directory=True)
+
+    state = current_state(str(link))
+    assert state is not None
+    (real / "pkg" / "a.py").write_text("x = 2\n", encoding="utf8")
+    (real / "top.py").write_text("y = 2\n", encoding="utf8")
+    _git(real, "commit", "-q", "-am", "edit")
+    (real / "pkg" / "b.py").write_text("z = 1\n", encoding="utf8")
+
+    changes = changes_since(str(link / "pkg"), state.head)
+    assert changes is not None
+    assert sorted(changes.paths) == [str(link / "pkg" / "a.py"), str(link / "pkg" / "b.py")]
+    assert changes.dirty == [str(link / "pkg" / "b.py")]
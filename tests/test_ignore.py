@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from mini_code_index.ignore import IgnoreStack, is_ignored, iter_unignored_files, parse_ignore_lines
+from mini_code_index.indexing import IndexConfig, _resolve_explicit_paths, is_candidate_path, iter_candidate_files
+
+
+def _write(path: Path, text: str = "x\n") -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+@pytest.mark.parametrize(
+    "lines,path,is_dir,expected",
+    [
+        (["*.log"], "a.log", False, True),
+        (["*.log"], "deep/x/a.log", False, True),
+        (["*.log", "!keep.log"], "keep.log", False, False),
+        (["/build"], "build", True, True),
+        (["/build"], "src/build", True, None),
+        (["out/"], "out", True, True),
+        (["out/"], "out", False, None),
+        (["docs/*.md"], "docs/a.md", False, True),
+        (["docs/*.md"], "docs/sub/a.md", False, None),
+        (["**/gen"], "a/b/gen", True, True),
+        (["# comment", "", "\\#literal"], "#literal", False, True),
+        (["trailing   "], "trailing", False, True),
+    ],
+)
+def test_gitignore_syntax(lines, path, is_dir, expected) -> None:
+    rules = parse_ignore_lines(lines)
+    assert rules is not None
+    assert rules.match(path, is_dir) is expected
+
+
+def _tree(tmp_path: Path) -> Path:
+    root = tmp_path / "repo"
+    _write(root / ".gitignore", "build/\n*.log\n")
+    _write(root / ".mciignore", "fixtures/\n")
+    _write(root / "src" / "a.py")
+    _write(root / "src" / "debug.log")
+    _write(root / "src" / ".ignore", "gen_*.py\n!gen_keep.py\n")
+    _write(root / "src" / "gen_x.py")
+    _write(root / "src" / "gen_keep.py")
+    _write(root / "src" / "sub" / "gen_y.py")
+    _write(root / "build" / "out.py")
+    _write(root / "fixtures" / "data.py")
+    _write(root / "pkg" / ".gitignore", "!*.log\n")
+    _write(root / "pkg" / "keep.log")
+    return root
+
+
+def test_scan_honors_nested_ignore_files(tmp_path: Path) -> None:
+    root = _tree(tmp_path)
+    cfg = IndexConfig(root_dir=str(root))
+    rel = sorted(Path(p).relative_to(root).as_posix() for p in iter_candidate_files(cfg))
+    assert rel == ["pkg/keep.log", "src/a.py", "src/gen_keep.py"]
+
+    # Single-path checks agree with the scan.
+    assert not is_candidate_path(cfg, str(root / "build" / "out.py"))
+    assert not is_candidate_path(cfg, str(root / "src" / "sub" / "gen_y.py"))
+    assert is_candidate_path(cfg, str(root / "src" / "gen_keep.py"))
+
+    # Explicit paths (watch mode) use the same rules.
+    to_index, to_remove = _resolve_explicit_paths(
+        cfg, [str(root / "src"), str(root / "fixtures")], known=[str(root / "fixtures" / "data.py")]
+    )
+    assert sorted(Path(p).relative_to(root).as_posix() for p in to_index) == ["src/a.py", "src/gen_keep.py"]
+    assert to_remove == [str(root / "fixtures" / "data.py")]
+
+    cfg_all = IndexConfig(root_dir=str(root), ignore_files=[])
+    assert len(list(iter_candidate_files(cfg_all))) == 8
+
+
+def test_ignored_directories_are_pruned(tmp_path: Path, monkeypatch) -> None:
+    root = _tree(tmp_path)
+    _write(root / "build" / "deep" / "x.py")
+    visited: list[str] = []
+    real_scandir = os.scandir
+
+    def _scandir(path):
+        visited.append(os.path.relpath(path, root))
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", _scandir)
+    list(iter_candidate_files(IndexConfig(root_dir=str(root))))
+    assert not any(v.startswith(("build", "fixtures")) for v in visited)
+
+
+def test_rules_reload_when_ignore_file_changes(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    _write(root / "a.txt")
+    _write(root / ".gitignore", "a.txt\n")
+    assert is_ignored(str(root), "a.txt")
+
+    gitignore = root / ".gitignore"
+    gitignore.write_text("b.txt\n", encoding="utf-8")
+    st = gitignore.stat()
+    os.utime(gitignore, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert not is_ignored(str(root), "a.txt")
+
+
+def test_git_info_exclude_and_local_search_walk(tmp_path: Path) -> None:
+    root = _tree(tmp_path)
+    _write(root / ".git" / "info" / "exclude", "src/a.py\n")
+    _write(root / ".git" / "HEAD", "ref: refs/heads/main\n")
+
+    assert IgnoreStack.for_root(str(root)).ignored("src/a.py")
+    rel = sorted(r for _, r in iter_unignored_files(str(root)))
+    assert rel == [
+        ".gitignore",
+        ".mciignore",
+        "pkg/.gitignore",
+        "pkg/keep.log",
+        "src/.ignore",
+        "src/gen_keep.py",
+    ]
@@ -93,6 +93,9 @@ class CaptureStore(VectorStore):
     async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
         return None
 
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        return {}
+
     async def delete_by_path(self, *, path: str) -> None:
         self.deleted_paths.append(path)
 
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+import builtins
+import hashlib
+import mmap
+from pathlib import Path
+
+from mini_code_index import indexing
+from mini_code_index.chunking import Config as ChunkConfig, TreeSitterChunker
+from mini_code_index.indexing import IndexConfig, _ingest_file_sync, index_directory
+
+
+def test_ingest_sniffs_and_hashes_one_buffer(tmp_path: Path, monkeypatch) -> None:
+    small = tmp_path / "small.py"
+    small.write_text("def f():\n    return 1\n", encoding="utf-8")
+    big = tmp_path / "big.py"
+    big.write_text("x = 1\n" * 200, encoding="utf-8")
+    binary = tmp_path / "blob.dat"
+    binary.write_bytes(b"\x00\x01\x02" * 100)
+    cfg = ChunkConfig(encoding="utf8")
+
+    monkeypatch.setattr(indexing, "_MMAP_THRESHOLD", 1024)
+    data, sha = _ingest_file_sync(str(small), size=small.stat().st_size, chunk_cfg=cfg)
+    assert isinstance(data, bytes)
+    assert sha == hashlib.sha256(small.read_bytes()).hexdigest()
+
+    data, sha = _ingest_file_sync(str(big), size=big.stat().st_size, chunk_cfg=cfg)
+    assert isinstance(data, mmap.mmap)
+    assert sha == hashlib.sha256(big.read_bytes()).hexdigest()
+    data.close()
+
+    assert _ingest_file_sync(str(binary), size=binary.stat().st_size, chunk_cfg=cfg) is None
+
+
+def test_chunker_uses_supplied_content_and_digest(tmp_path: Path) -> None:
+    path = tmp_path / "a.py"
+    path.write_text("def f():\n    return 1\n", encoding="utf-8")
+    chunker = TreeSitterChunker(ChunkConfig(encoding="utf8"))
+
+    from_disk = list(chunker.chunk(str(path)))
+    from_buffer = list(chunker.chunk(str(path), data=path.read_bytes(), sha256="cafe"))
+    assert [c.text for c in from_buffer] == [c.text for c in from_disk]
+    assert {c.sha256 for c in from_buffer} == {"cafe"}
+
+
+def test_each_file_is_opened_once_per_run(tmp_path: Path, monkeypatch) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    for i in range(3):
+        (root / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n" * 50, encoding="utf-8")
+
+    opened: list[str] = []
+    real_open = builtins.open
+
+    def _open(file, *args, **kwargs):
+        if isinstance(file, str) and file.startswith(str(root)):
+            opened.append(file)
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", _open)
+    # Exercise the mmap path for some of the files.
+    monkeypatch.setattr(indexing, "_MMAP_THRESHOLD", 1000)
+    stats = asyncio.run(
+        index_directory(
+            cfg=IndexConfig(root_dir=str(root), dry_run=True, use_manifest=False),
+            chunk_cfg=ChunkConfig(encoding="utf8"),
+            embedder=None,  # type: ignore[arg-type]
+            store=None,  # type: ignore[arg-type]
+            force_upsert=False,
+        )
+    )
+    assert stats.files_indexed == 3
+    assert sorted(opened) == sorted(str(p) for p in root.glob("*.py"))
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import struct
+from pathlib import Path
+
+import pytest
+
+from mini_code_index.local_embedding import _HAS_ONNX, _length_batches
+
+needs_onnx = pytest.mark.skipif(not _HAS_ONNX, reason="onnxruntime/tokenizers not installed")
+
+VOCAB = ["[PAD]", "[UNK]", "def", "class", "return", "x", "y", "(", ")", ":"]
+DIM = 4
+
+
+# --- a tiny ONNX model, hand-encoded (the `onnx` package is not required) ---
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _int(field: int, value: int) -> bytes:
+    return _varint(field << 3) + _varint(value)
+
+
+def _bytes(field: int, value: bytes) -> bytes:
+    return _varint((field << 3) | 2) + _varint(len(value)) + value
+
+
+def _str(field: int, value: str) -> bytes:
+    return _bytes(field, value.encode("utf-8"))
+
+
+def _value_info(name: str, elem_type: int, dims: list) -> bytes:
+    shape = b"".join(
+        _bytes(1, _str(2, d) if isinstance(d, str) else _int(1, d)) for d in dims
+    )
+    tensor_type = _int(1, elem_type) + _bytes(2, shape)
+    return _str(1, name) + _bytes(2, _bytes(1, tensor_type))
+
+
+def _embedding_table() -> list[list[float]]:
+    # Token i embeds as a one-hot-ish vector so pooled outputs are predictable.
+    return [[float((i + j) % 3 == 0) * (i + 1) for j in range(DIM)] for i in range(len(VOCAB))]
+
+
+def _write_model(path: Path) -> None:
+    table = _embedding_table()
+    raw = struct.pack(f"<{len(VOCAB) * DIM}f", *[x for row in table for x in row])
+    initializer = _int(1, len(VOCAB)) + _int(1, DIM) + _int(2, 1) + _str(8, "E") + _bytes(9, raw)
+    node = (
+        _str(1, "E")
+        + _str(1, "input_ids")
+        + _str(2, "last_hidden_state")
+        + _str(4, "Gather")
+        + _bytes(5, _str(1, "axis") + _int(3, 0) + _int(20, 2))
+    )
+    graph = (
+        _bytes(1, node)
+        + _str(2, "tiny")
+        + _bytes(5, initializer)
+        + _bytes(11, _value_info("input_ids", 7, ["batch", "seq"]))
+        + _bytes(11, _value_info("attention_mask", 7, ["batch", "seq"]))
+        + _bytes(12, _value_info("last_hidden_state", 1, ["batch", "seq", DIM]))
+    )
+    model = _int(1, 8) + _bytes(8, _str(1, "") + _int(2, 13)) + _bytes(7, graph)
+    path.write_bytes(model)
+
+
+def _write_tokenizer(path: Path, pad_token: str = "") -> None:
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+
+    tok = Tokenizer(WordLevel({t: i for i, t in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tok.pre_tokenizer = Whitespace()
+    if pad_token:
+        tok.enable_padding(pad_id=VOCAB.index(pad_token), pad_token=pad_token)
+    tok.save(str(path))
+
+
+@pytest.fixture
+def model_dir(tmp_path: Path) -> Path:
+    d = tmp_path / "tiny-model"
+    (d / "onnx").mkdir(parents=True)
+    _write_model(d / "onnx" / "model.onnx")
+    _write_tokenizer(d / "tokenizer.json")
+    return d
+
+
+def _expected(text: str) -> list[float]:
+    table = _embedding_table()
+    # Same split as the Whitespace pre-tokenizer; unknown words map to [UNK].
+    ids = [VOCAB.index(t) if t in VOCAB else 1 for t in re.findall(r"\w+|[^\w\s]+", text)]
+    mean = [sum(table[i][j] for i in ids) / len(ids) for j in range(DIM)]
+    norm = sum(x * x for x in mean) ** 0.5
+    return [x / norm for x in mean]
+
+
+def test_length_batches_bound_padded_tokens() -> None:
+    lengths = [5, 1, 40, 3, 3, 12, 2, 40]
+    batches = _length_batches(lengths, batch_size=3, max_batch_tokens=40)
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+    for b in batches:
+        assert len(b) <= 3
+        assert len(b) * max(lengths[i] for i in b) <= 40 or len(b) == 1
+    # Shortest texts are batched together, the long ones alone.
+    assert batches[0] == [1, 6, 3]
+    assert [2] in batches and [7] in batches
+
+
+@needs_onnx
+def test_embeds_in_process_with_mean_pooling(model_dir: Path) -> None:
+    from mini_code_index.local_embedding import OnnxEmbedder
+
+    texts = ["def x ( ) :", "return y", "class x", "zzz return return return x y"]
+    embedder = OnnxEmbedder(model_path=str(model_dir), inference_batch_size=2, threads=1)
+    assert embedder.model is not None
+    assert embedder.model.startswith("local:tiny-model:mean:norm:512:")
+
+    vectors = asyncio.run(embedder.embed(texts))
+
+    assert getattr(vectors, "shape", None) == (4, DIM)
+    for text, vec in zip(texts, vectors):
+        assert [float(x) for x in vec] == pytest.approx(_expected(text), abs=1e-6)
+    assert asyncio.run(embedder.embed([])) == []
+
+
+@needs_onnx
+def test_cache_key_tracks_settings_and_model_file(model_dir: Path) -> None:
+    import os
+
+    from mini_code_index.embedding import EmbeddingError
+    from mini_code_index.local_embedding import OnnxEmbedder
+
+    key = OnnxEmbedder(model_path=str(model_dir)).model
+    assert OnnxEmbedder(model_path=str(model_dir)).model == key
+    assert OnnxEmbedder(model_path=str(model_dir), pooling="cls").model != key
+    assert OnnxEmbedder(model_path=str(model_dir), normalize=False).model != key
+    assert OnnxEmbedder(model_path=str(model_dir), max_length=128).model != key
+
+    model_file = model_dir / "onnx" / "model.onnx"
+    st = model_file.stat()
+    os.utime(model_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert OnnxEmbedder(model_path=str(model_dir)).model != key
+
+    assert asyncio.run(OnnxEmbedder(model_path=str(model_dir), dimensions=DIM).embed(["x"])).shape == (1, DIM)
+    with pytest.raises(EmbeddingError):
+        asyncio.run(OnnxEmbedder(model_path=str(model_dir), dimensions=DIM + 1).embed(["x"]))
+
+
+@needs_onnx
+def test_padding_uses_the_tokenizer_pad_id(model_dir: Path) -> None:
+    from mini_code_index.local_embedding import OnnxEmbedder
+
+    _write_tokenizer(model_dir / "tokenizer.json", pad_token="[UNK]")
+    embedder = OnnxEmbedder(model_path=str(model_dir))
+    [(_, feeds)] = embedder._prepare(["def x ( )", "x"])
+    assert feeds["input_ids"].tolist() == [[5, 1, 1, 1], [2, 5, 7, 8]]
+    assert feeds["attention_mask"].tolist() == [[1, 0, 0, 0], [1, 1, 1, 1]]
+
+    assert "_session" not in repr(embedder)
+    with pytest.raises(TypeError):
+        OnnxEmbedder(model_path=str(model_dir), _session=object())  # type: ignore[call-arg]
+
+
+@needs_onnx
+def test_concurrent_first_calls_share_one_tokenizer(model_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    import threading
+    import time
+
+    from mini_code_index import local_embedding
+    from mini_code_index.local_embedding import OnnxEmbedder
+
+    loads: list[int] = []
+    real_from_file = local_embedding.Tokenizer.from_file
+
+    class SlowTokenizer:
+        @staticmethod
+        def from_file(path: str):
+            loads.append(1)
+            time.sleep(0.05)
+            return real_from_file(path)
+
+    monkeypatch.setattr(local_embedding, "Tokenizer", SlowTokenizer)
+    embedder = OnnxEmbedder(model_path=str(model_dir))
+    seen: list[object] = []
+    threads = [threading.Thread(target=lambda: seen.append(embedder._get_tokenizer())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(loads) == 1
+    assert all(tok is seen[0] for tok in seen)
+
+
+@needs_onnx
+def test_process_pool_matches_in_process(model_dir: Path) -> None:
+    from mini_code_index.local_embedding import OnnxEmbedder
+
+    texts = [" ".join(VOCAB[2 + (i * j) % 8] for j in range(1 + i % 7)) for i in range(20)]
+    local = OnnxEmbedder(model_path=str(model_dir / "onnx" / "model.onnx"), inference_batch_size=4)
+    pooled = OnnxEmbedder(
+        model_path=str(model_dir), inference_batch_size=4, processes=2, threads=2
+    )
+
+    async def main():
+        async with pooled:
+            return await local.embed(texts), await pooled.embed(texts)
+
+    a, b = asyncio.run(main())
+    assert [float(x) for v in b for x in v] == pytest.approx([float(x) for v in a for x in v])
+    assert pooled._pool is None
+
+
+@needs_onnx
+def test_backend_is_selected_from_env(model_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from mini_code_index.embedding import EmbeddingError, embedder_from_env
+    from mini_code_index.local_embedding import OnnxEmbedder
+
+    monkeypatch.setenv("EMBEDDING_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_EMBEDDING_MODEL", str(model_dir))
+    monkeypatch.setenv("LOCAL_EMBEDDING_THREADS", "2")
+    embedder = embedder_from_env()
+    assert isinstance(embedder, OnnxEmbedder) and embedder.threads == 2
+
+    monkeypatch.setenv("EMBEDDING_BACKEND", "carrier-pigeon")
+    with pytest.raises(EmbeddingError):
+        embedder_from_env()
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import asyncio
+import mmap
+import os
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+from mini_code_index import indexing
+from mini_code_index.chunking import Config as ChunkConfig
+from mini_code_index.indexing import IndexConfig, index_directory
+from mini_code_index.manifest import FileManifest, ManifestEntry
+
+
+class CountingEmbedder:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        self.calls += 1
+        return [[0.0] for _ in texts]
+
+
+class MemoryStore:
+    """In-memory store keyed by path, with a stable collection identity."""
+
+    collection_name = "test-collection"
+
+    def __init__(self) -> None:
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.state: dict[str, Any] = {}
+        self.lookups = 0
+
+    async def ping(self) -> bool:
+        return True
+
+    def _ids_for(self, path: str) -> list[str]:
+        return [i for i, m in self.rows.items() if m["path"] == path]
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        ids = self._ids_for(path)
+        return self.rows[ids[0]] if ids else None
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        self.lookups += 1
+        wanted = set(paths)
+        return {
+            m["path"]: m["sha256"]
+            for m in self.rows.values()
+            if m["path"] in wanted and m["chunk_kind"] == "relpath"
+        }
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        return self._ids_for(path)
+
+    async def delete_by_path(self, *, path: str) -> None:
+        for i in self._ids_for(path):
+            del self.rows[i]
+
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        for i in ids:
+            self.rows.pop(i, None)
+
+    async def update_metadatas(self, *, ids: Sequence[str], metadatas: Sequence[Mapping[str, Any]]) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def get_index_state(self) -> dict[str, Any]:
+        return dict(self.state)
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        self.state.update(state)
+
+
+def _age(path: Path, seconds: int = 60) -> None:
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 1_000_000_000))
+
+
+def _run(root: Path, store: MemoryStore, embedder: CountingEmbedder, manifest_path: str, **kwargs: Any):
+    cfg = IndexConfig(root_dir=str(root), dry_run=False, manifest_path=manifest_path)
+    chunk_cfg = kwargs.pop("chunk_cfg", None) or ChunkConfig(chunk_size=200, mode="function")
+    return asyncio.run(
+        index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=embedder, store=store, **kwargs)
+    )
+
+
+def test_manifest_roundtrip(tmp_path: Path) -> None:
+    path = str(tmp_path / "m" / "manifest.json")
+    manifest = FileManifest(path)
+    manifest.set(
+        "/a.py",
+        ManifestEntry(size=1, mtime_ns=2, inode=3, sha256="x", chunk_ids=["i"], chunk_fingerprint="f"),
+    )
+    manifest.save()
+
+    loaded = FileManifest.load(path)
+    assert loaded.get("/a.py") == manifest.get("/a.py")
+    assert FileManifest.load(str(tmp_path / "missing.json")).get("/a.py") is None
+
+
+def test_unchanged_files_skip_hashing_and_store(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    a = root / "a.py"
+    b = root / "b.py"
+    a.write_text("def a():\n    return 1\n", encoding="utf8")
+    b.write_text("def b():\n    return 2\n", encoding="utf8")
+    _age(a)
+    _age(b)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    store = MemoryStore()
+    embedder = CountingEmbedder()
+    stats = _run(root, store, embedder, manifest_path)
+    assert stats.files_indexed == 2
+
+    store.lookups = 0
+    embedder.calls = 0
+    stats = _run(root, store, embedder, manifest_path)
+    assert stats.files_indexed == 0
+    assert stats.files_unchanged == 2
+    assert store.lookups == 0
+    assert embedder.calls == 0
+
+    b.write_text("def b():\n    return 3\n", encoding="utf8")
+    stats = _run(root, store, embedder, manifest_path)
+    assert stats.files_indexed == 1
+    assert store.lookups == 1
+
+
+def test_chunk_config_change_reindexes(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    a = root / "a.py"
+    a.write_text("def a():\n    return 1\n", encoding="utf8")
+    _age(a)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    store = MemoryStore()
+    embedder = CountingEmbedder()
+    _run(root, store, embedder, manifest_path)
+    stats = _run(root, store, embedder, manifest_path, chunk_cfg=ChunkConfig(chunk_size=300, mode="type"))
+    assert stats.files_indexed == 1
+
+
+def test_manifest_is_discarded_for_a_different_store(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    a = root / "a.py"
+    a.write_text("def a():\n    return 1\n", encoding="utf8")
+    _age(a)
+    manifest_path = str(tmp_path / "manifest.json")
+
+    embedder = CountingEmbedder()
+    first = MemoryStore()
+    _run(root, first, embedder, manifest_path)
+    assert FileManifest.load(manifest_path).store_token == first.state["manifest_token"]
+
+    # Same collection name, but empty (reset, or another server).
+    fresh = MemoryStore()
+    stats = _run(root, fresh, embedder, manifest_path)
+    assert stats.files_indexed == 1
+    assert stats.files_unchanged == 0
+    assert fresh.rows
+    assert fresh.state["manifest_token"] != first.state["manifest_token"]
+
+    stats = _run(root, fresh, embedder, manifest_path)
+    assert stats.files_unchanged == 1
+
+
+def test_store_lookup_is_batched_and_skips_known_files(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    for i in range(5):
+        (root / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n", encoding="utf8")
+
+    store = MemoryStore()
+    embedder = CountingEmbedder()
+    cfg = IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False)
+    chunk_cfg = ChunkConfig(chunk_size=200, mode="function")
+
+    stats = asyncio.run(index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=embedder, store=store))
+    assert stats.files_indexed == 5
+    assert store.lookups == 1
+
+    stats = asyncio.run(index_directory(cfg=cfg, chunk_cfg=chunk_cfg, embedder=embedder, store=store))
+    assert stats.files_indexed == 0
+    assert stats.files_unchanged == 5
+    assert store.lookups == 2
+
+
+def test_skipped_files_unmap_their_content(tmp_path: Path, monkeypatch) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    a = root / "a.py"
+    a.write_text("def a():\n    return 1\n" * 20, encoding="utf8")
+    _age(a)
+    manifest_path = str(tmp_path / "manifest.json")
+    store = MemoryStore()
+    embedder = CountingEmbedder()
+    _run(root, store, embedder, manifest_path)
+
+    mapped: list[mmap.mmap] = []
+    real_read = indexing._read_file_sync
+
+    def _read(path: str, size: int):
+        data = real_read(path, size)
+        if isinstance(data, mmap.mmap):
+            mapped.append(data)
+        return data
+
+    monkeypatch.setattr(indexing, "_MMAP_THRESHOLD", 1)
+    monkeypatch.setattr(indexing, "_read_file_sync", _read)
+
+    # Manifest sha256 match: touched, not modified.
+    os.utime(a)
+    assert _run(root, store, embedder, manifest_path).files_unchanged == 1
+    # Store sha256 match: no manifest to consult.
+    cfg = IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False)
+    stats = asyncio.run(
+        index_directory(cfg=cfg, chunk_cfg=ChunkConfig(chunk_size=200, mode="function"), embedder=embedder, store=store)
+    )
+    assert stats.files_unchanged == 1
+
+    assert len(mapped) == 2
+    assert all(m.closed for m in mapped)
+
+
+def test_full_scan_removes_newly_ignored_files(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    (root / "gen").mkdir(parents=True)
+    (root / "a.py").write_text("def a():\n    return 1\n", encoding="utf8")
+    (root / "gen" / "out.py").write_text("def g():\n    return 2\n", encoding="utf8")
+    manifest_path = str(tmp_path / "manifest.json")
+    store = MemoryStore()
+    embedder = CountingEmbedder()
+    generated = str(root / "gen" / "out.py")
+
+    assert _run(root, store, embedder, manifest_path).files_indexed == 2
+    assert store._ids_for(generated)
+
+    (root / ".gitignore").write_text("gen/\n", encoding="utf8")
+    stats = _run(root, store, embedder, manifest_path)
+
+    assert stats.files_deleted == 1
+    assert store._ids_for(generated) == []
+    assert store._ids_for(str(root / "a.py"))
+    assert generated not in FileManifest.load(manifest_path)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+import pytest
+from pygments.lexers import find_lexer_class_for_filename
+
+from mini_code_index.chunking import (
+    Config,
+    TreeSitterChunker,
+    _HAS_TREESITTER,
+    guess_lexer_class,
+    pooled_parser,
+    shared_chunker,
+)
+
+
+@pytest.mark.parametrize(
+    "name,content",
+    [
+        ("a.py", ""),
+        ("Makefile", ""),
+        ("CMakeLists.txt", ""),
+        ("x.h", "#include <stdio.h>\nint main(void) { return 0; }\n"),
+        ("x.m", "@interface Foo : NSObject\n@end\n"),
+        ("archive.tar.gz", ""),
+        ("Dockerfile", "FROM python:3.11\n"),
+        ("no_extension", ""),
+    ],
+)
+def test_guess_matches_pygments(name: str, content: str) -> None:
+    assert guess_lexer_class(name, content) is find_lexer_class_for_filename(name, content or None)
+
+
+def test_parsers_are_reused_per_thread() -> None:
+    if not _HAS_TREESITTER:
+        pytest.skip("tree-sitter not installed")
+
+    assert pooled_parser("python") is pooled_parser("python")
+    other: list[object] = []
+    t = threading.Thread(target=lambda: other.append(pooled_parser("python")))
+    t.start()
+    t.join()
+    assert other[0] is not pooled_parser("python")
+
+    with pytest.raises(LookupError):
+        pooled_parser("definitely-not-a-language")
+
+
+def test_shared_chunker_is_keyed_by_config(tmp_path: Path) -> None:
+    a = shared_chunker(Config(chunk_size=100, mode="function"))
+    assert shared_chunker(Config(chunk_size=100, mode="function")) is a
+    assert shared_chunker(Config(chunk_size=200, mode="function")) is not a
+
+    if not _HAS_TREESITTER:
+        return
+    path = tmp_path / "m.py"
+    path.write_text("def f():\n    return 1\n", encoding="utf-8")
+    fresh = [c.text for c in TreeSitterChunker(Config(chunk_size=100, mode="function")).chunk(str(path))]
+    assert [c.text for c in a.chunk(str(path))] == fresh
+    # A second file through the same instance sees no state from the first.
+    assert [c.text for c in a.chunk(str(path))] == fresh
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from mini_code_index.indexing import IndexConfig, iter_candidate_files
+from mini_code_index.pathfilter import PathMatcher
+
+
+@pytest.mark.parametrize(
+    "pattern,path,expected",
+    [
+        ("**/*", "a.py", True),
+        ("**/*", "a/b/c.py", True),
+        ("*.py", "a.py", True),
+        ("*.py", "pkg/a.py", True),
+        ("*.py", "a.pyc", False),
+        ("src/*.py", "src/a.py", True),
+        ("src/*.py", "src/pkg/a.py", False),
+        ("src/**/*.py", "src/a.py", True),
+        ("src/**/*.py", "src/pkg/deep/a.py", True),
+        ("**/.git/**", ".git/HEAD", True),
+        ("**/.git/**", "a/.git/objects/x", True),
+        ("**/.git/**", "a/.gitignore", False),
+        ("**/node_modules/**", "web/node_modules/react/index.js", True),
+        ("**/node_modules/**", "web/node_modules", False),
+        ("a?c.txt", "abc.txt", True),
+        ("a?c.txt", "a/c.txt", False),
+        ("[ab].md", "b.md", True),
+        ("[!ab].md", "b.md", False),
+    ],
+)
+def test_glob_semantics(pattern: str, path: str, expected: bool) -> None:
+    assert PathMatcher([pattern], []).matches(path) is expected
+
+
+def test_directory_pruning_patterns() -> None:
+    m = PathMatcher(["**/*"], ["**/node_modules/**", "build/**", "*.log"])
+    assert m.excludes_dir("node_modules")
+    assert m.excludes_dir("web/node_modules")
+    assert m.excludes_dir("build")
+    assert not m.excludes_dir("src/build")
+    assert not m.excludes_dir("src")
+    assert not m.matches("logs/x.log")
+    assert m.matches("src/x.py")
+
+
+def test_iter_candidate_files_prunes_excluded_dirs(tmp_path: Path, monkeypatch) -> None:
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("a = 1\n", encoding="utf8")
+    (tmp_path / "top.py").write_text("t = 1\n", encoding="utf8")
+    nm = tmp_path / "web" / "node_modules" / "pkg"
+    nm.mkdir(parents=True)
+    (nm / "index.js").write_text("x\n", encoding="utf8")
+    (tmp_path / ".hidden").mkdir()
+    (tmp_path / ".hidden" / "h.py").write_text("h = 1\n", encoding="utf8")
+
+    scanned: list[str] = []
+    real_scandir = os.scandir
+
+    def spy(path):
+        scanned.append(str(path))
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", spy)
+    cfg = IndexConfig(
+        root_dir=str(tmp_path),
+        exclude_globs=["**/node_modules/**"],
+    )
+    found = sorted(iter_candidate_files(cfg))
+
+    assert found == [str(tmp_path / "src" / "a.py"), str(tmp_path / "top.py")]
+    assert not any("node_modules" in p or ".hidden" in p for p in scanned)
+
+
+def test_iter_candidate_files_non_recursive(tmp_path: Path) -> None:
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "a.py").write_text("a = 1\n", encoding="utf8")
+    (tmp_path / "b.py").write_text("b = 1\n", encoding="utf8")
+    cfg = IndexConfig(root_dir=str(tmp_path), recursive=False)
+    assert list(iter_candidate_files(cfg)) == [str(tmp_path / "b.py")]
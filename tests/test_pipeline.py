@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+import pytest
+
+from mini_code_index.chunking import Config as ChunkConfig
+from mini_code_index.indexing import IndexConfig, index_directory
+from mini_code_index.pipeline import PipelineConfig, Stage, run_pipeline
+
+
+def test_run_pipeline_fans_out_and_batches() -> None:
+    seen_batches: list[list[int]] = []
+    results: list[int] = []
+
+    async def source(emit) -> None:
+        for i in range(10):
+            await emit(i)
+
+    async def double(item: int, emit) -> None:
+        await emit(item * 2)
+
+    async def batch(items: list[int], emit) -> None:
+        seen_batches.append(list(items))
+        for item in items:
+            await emit(item)
+
+    async def sink(item: int, _emit) -> None:
+        results.append(item)
+
+    stages = [
+        Stage("double", double, workers=3),
+        Stage("batch", batch, batch_size=4, linger_s=0.05),
+        Stage("sink", sink, workers=2),
+    ]
+    asyncio.run(run_pipeline(source, stages, queue_size=2))
+
+    assert sorted(results) == [i * 2 for i in range(10)]
+    assert all(len(b) <= 4 for b in seen_batches)
+    assert sum(len(b) for b in seen_batches) == 10
+
+
+def test_run_pipeline_propagates_first_failure() -> None:
+    async def source(emit) -> None:
+        for i in range(100):
+            await emit(i)
+
+    async def boom(item: int, _emit) -> None:
+        if item == 3:
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(run_pipeline(source, [Stage("boom", boom, workers=2)], queue_size=1))
+
+
+def test_pipeline_config_validates() -> None:
+    with pytest.raises(ValueError):
+        PipelineConfig(write_workers=0)
+
+
+class SlowEmbedder:
+    """Tracks how many embed calls overlap, to check files are embedded concurrently."""
+
+    def __init__(self) -> None:
+        self.active = 0
+        self.peak = 0
+
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.02)
+        self.active -= 1
+        return [[0.0] for _ in texts]
+
+
+class ListStore:
+    def __init__(self) -> None:
+        self.rows: dict[str, Mapping[str, Any]] = {}
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        return None
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        return {}
+
+    async def delete_by_path(self, *, path: str) -> None:
+        return None
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for chunk_id, meta in zip(ids, metadatas):
+            self.rows[chunk_id] = meta
+
+
+def test_index_directory_embeds_files_concurrently(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    for i in range(6):
+        (root / f"m{i}.py").write_text(f"def f{i}():\n    return {i}\n", encoding="utf8")
+
+    embedder = SlowEmbedder()
+    store = ListStore()
+    stats = asyncio.run(
+        index_directory(
+            cfg=IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False),
+            chunk_cfg=ChunkConfig(chunk_size=200, mode="function"),
+            embedder=embedder,
+            store=store,
+            pipeline_cfg=PipelineConfig(embed_requests=3, write_workers=1, coalesce_embeddings=False),
+        )
+    )
+
+    assert stats.files_indexed == 6
+    assert {m["path"] for m in store.rows.values()} == {str(root / f"m{i}.py") for i in range(6)}
+    assert embedder.peak > 1
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, Optional
+
+from mini_code_index.embedding import OpenAICompatibleEmbedder
+from mini_code_index.ratelimit import (
+    AdaptiveRateLimiter,
+    parse_reset_duration,
+    shared_rate_limiter,
+)
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: Any, headers: Optional[dict[str, str]] = None) -> None:
+        self.status = status
+        self.reason = "fake"
+        self.headers = headers or {}
+        self._raw = json.dumps(body)
+
+    async def text(self) -> str:
+        return self._raw
+
+    async def __aenter__(self) -> "FakeResponse":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+
+class FakeSession:
+    """Rejects the first request (429 by default), then answers every request."""
+
+    closed = False
+
+    def __init__(self, retry_after: float = 0.0, first_status: int = 429) -> None:
+        self.retry_after = retry_after
+        self.first_status = first_status
+        self.posts: list[float] = []
+
+    def post(self, url: str, *, json: dict[str, Any], headers: dict[str, str]) -> FakeResponse:
+        self.posts.append(time.monotonic())
+        if len(self.posts) == 1:
+            return FakeResponse(self.first_status, {}, {"Retry-After": str(self.retry_after)})
+        inputs = json["input"] if isinstance(json["input"], list) else [json["input"]]
+        data = [{"index": i, "embedding": [float(len(t))]} for i, t in enumerate(inputs)]
+        return FakeResponse(200, {"data": data}, {"x-ratelimit-limit-requests": "6000"})
+
+
+def test_parse_reset_duration() -> None:
+    assert parse_reset_duration("1s") == 1.0
+    assert parse_reset_duration("6m0s") == 360.0
+    assert parse_reset_duration("250ms") == 0.25
+    assert parse_reset_duration("1m30.5s") == 90.5
+    assert parse_reset_duration("2") == 2.0
+    assert parse_reset_duration("soon") is None
+
+
+def test_request_bucket_paces_callers() -> None:
+    async def main() -> list[float]:
+        # 600/min at 90% headroom -> 9 requests/s with a one-second burst.
+        limiter = AdaptiveRateLimiter(requests_per_min=600)
+        start = time.monotonic()
+        times = []
+        for _ in range(12):
+            async with limiter.slot():
+                times.append(time.monotonic() - start)
+        return times
+
+    times = asyncio.run(main())
+    assert times[8] < 0.05
+    assert times[9] >= 0.08
+    assert times[11] >= 0.25
+
+
+def test_throttle_pauses_everyone_and_aimd_recovers() -> None:
+    async def main() -> tuple[AdaptiveRateLimiter, float]:
+        limiter = AdaptiveRateLimiter(max_concurrency=8, decrease_cooldown_s=10.0)
+        assert limiter.on_throttle(0.1) == 0.1
+        limiter.on_throttle(0.1)  # same burst: no second decrease
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(4)))
+        elapsed = time.monotonic() - start
+        for _ in range(4):
+            limiter.release()
+        return limiter, elapsed
+
+    limiter, elapsed = asyncio.run(main())
+    assert elapsed >= 0.09
+    assert limiter.concurrency == 4
+    assert limiter.throttled == 2
+    # Additive increase: roughly one slot per round of `concurrency` successes.
+    for _ in range(5):
+        limiter.on_success()
+    assert limiter.concurrency == 5
+
+
+def test_concurrency_limit_bounds_active_slots() -> None:
+    async def main() -> int:
+        limiter = AdaptiveRateLimiter(max_concurrency=3)
+        peak = 0
+
+        async def worker() -> None:
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.active)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(worker() for _ in range(10)))
+        assert limiter.active == 0
+        return peak
+
+    assert asyncio.run(main()) == 3
+
+
+def test_headers_set_quota_and_exhaustion_pauses() -> None:
+    async def main() -> float:
+        limiter = AdaptiveRateLimiter()
+        limiter.observe_headers(
+            {
+                "x-ratelimit-limit-tokens": "60000",
+                "x-ratelimit-remaining-tokens": "0",
+                "x-ratelimit-reset-tokens": "150ms",
+            }
+        )
+        start = time.monotonic()
+        await limiter.acquire(10)
+        limiter.release()
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 0.14
+
+
+def test_shared_limiter_is_per_endpoint_and_model() -> None:
+    a = shared_rate_limiter("https://test.invalid/v1/embeddings", "m1", requests_per_min=100)
+    b = shared_rate_limiter("https://test.invalid/v1/embeddings", "m1", requests_per_min=50)
+    c = shared_rate_limiter("https://test.invalid/v1/embeddings", "m2")
+    assert a is b and a is not c
+    assert a._configured["requests"] == 50
+
+
+def test_embedder_waits_out_retry_after_together() -> None:
+    session = FakeSession(retry_after=0.1)
+    limiter = AdaptiveRateLimiter(max_concurrency=1)
+    embedder = OpenAICompatibleEmbedder(
+        api_key="test", batch_size=1, max_in_flight=4, rate_limiter=limiter
+    )
+    embedder._session = session  # type: ignore[assignment]
+
+    vectors = asyncio.run(embedder.embed(["a", "bb", "ccc"]))
+
+    assert [[float(x) for x in v] for v in vectors] == [[1.0], [2.0], [3.0]]
+    # One 429 and no herd: every later request waited for the pause.
+    assert len(session.posts) == 4
+    assert all(t - session.posts[0] >= 0.09 for t in session.posts[1:])
+    assert limiter.throttled == 1
+    assert limiter._buckets["requests"] is not None
+
+
+def test_server_error_backoff_releases_the_slot() -> None:
+    session = FakeSession(first_status=503)
+    limiter = AdaptiveRateLimiter(max_concurrency=1)
+    embedder = OpenAICompatibleEmbedder(
+        api_key="test", batch_size=1, max_in_flight=2, retry_delay_s=0.3, rate_limiter=limiter
+    )
+    embedder._session = session  # type: ignore[assignment]
+
+    vectors = asyncio.run(embedder.embed(["a", "bb"]))
+
+    assert [[float(x) for x in v] for v in vectors] == [[1.0], [2.0]]
+    assert len(session.posts) == 3
+    # The other batch went out while the failed one was backing off...
+    assert session.posts[1] - session.posts[0] < 0.2
+    # ...and the retry waited for its backoff.
+    assert session.posts[2] - session.posts[0] >= 0.29
+    assert limiter.active == 0
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from mini_code_index.chunking import Config, Point, RollingStringChunker, StringChunker
+
+
+def _windows(chunker, data: str, start_pos=None) -> list[tuple]:
+    return [(c.text, tuple(c.start), tuple(c.end)) for c in chunker.chunk(data, start_pos=start_pos)]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_string_chunker(seed: int) -> None:
+    rng = random.Random(seed)
+    alphabet = ["a", "b", " ", "\t", "é", "\n", "\n", "\r\n", "\r", "\x0c"]
+    for _ in range(500):
+        pool = alphabet[: rng.choice([6, 8, 10])]
+        data = "".join(rng.choice(pool) for _ in range(rng.randrange(60)))
+        cfg = Config(
+            chunk_size=rng.choice([-1, 1, 2, 5, 13, 40]),
+            overlap_ratio=rng.choice([0.0, 0.2, 0.5, 0.9]),
+            mode="file",
+        )
+        start_pos = rng.choice([None, Point(row=3, column=4)])
+        expected = _windows(StringChunker(cfg), data, start_pos)
+        assert _windows(RollingStringChunker(cfg), data, start_pos) == expected
+
+
+def test_line_snap_cuts_windows_at_line_breaks() -> None:
+    data = "".join(f"line {i} " + "x" * (i % 13) + "\n" for i in range(200)) + "tail" + "y" * 100
+    cfg = Config(chunk_size=60, overlap_ratio=0.2, mode="file", fallback_line_snap=True)
+    chunks = list(RollingStringChunker(cfg).chunk(data))
+
+    for c in chunks[:-2]:
+        assert c.text.endswith("\n")
+        assert c.start.column == 0
+        assert c.end.column == -1
+    # The unbroken tail is still covered, in raw windows.
+    assert chunks[-1].text.endswith("y" * 10)
+    starts = [data.index(c.text) for c in chunks[:-2]]
+    assert starts == sorted(set(starts))
+    assert "".join(c.text for c in chunks).count("line 199 ") >= 1
+
+
+def test_line_snap_is_part_of_the_fingerprint() -> None:
+    assert Config(mode="file").fingerprint() != Config(mode="file", fallback_line_snap=True).fingerprint()
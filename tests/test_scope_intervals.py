@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from mini_code_index.chunking import Config, IntervalIndex, TreeSitterChunker, _HAS_TREESITTER
+
+
+def _brute_force(intervals, lo, hi) -> list[int]:
+    return [i for i, (s, e) in enumerate(intervals) if not (hi < s or e < lo)]
+
+
+def test_interval_index_matches_brute_force() -> None:
+    rng = random.Random(3)
+    for n in (0, 1, 2, 7, 64, 300):
+        intervals = []
+        for _ in range(n):
+            s = (rng.randrange(200), rng.randrange(40))
+            e = (s[0] + rng.randrange(30), rng.randrange(40))
+            intervals.append((s, max(s, e)))
+        index = IntervalIndex(intervals)
+        assert len(index) == n
+        for _ in range(50):
+            lo = (rng.randrange(220), rng.randrange(40))
+            hi = max(lo, (lo[0] + rng.randrange(20), rng.randrange(40)))
+            assert index.overlapping(lo, hi) == _brute_force(intervals, lo, hi)
+
+
+def test_touching_ends_overlap() -> None:
+    index = IntervalIndex([((1, 0), (3, 5)), ((4, 0), (6, 0))])
+    assert index.overlapping((3, 5), (3, 9)) == [0]
+    assert index.overlapping((3, 6), (3, 9)) == []
+    assert index.overlapping((3, 6), (4, 0)) == [1]
+
+
+@pytest.mark.skipif(not _HAS_TREESITTER, reason="tree-sitter not installed")
+def test_file_mode_contained_scopes_in_tree_order() -> None:
+    lines = ["class A:"]
+    for i in range(40):
+        lines += [f"    def m{i}(self):", f"        return {i}", ""]
+    lines += ["def m0():", "    return 0", ""]
+    chunks = list(TreeSitterChunker(Config(chunk_size=120, mode="file")).chunk_str("\n".join(lines), path="a.py"))
+
+    assert len(chunks) > 5
+    for c in chunks:
+        names = [s.name for s in c.contained_scopes]
+        # The class spans every window; a (kind, name) is reported once.
+        assert names[0] == "A"
+        assert len(names) == len(set(names))
+    assert "m0" in [s.name for s in chunks[0].contained_scopes]
+    # The trailing window reaches the top-level m0, not the method.
+    last = chunks[-1].contained_scopes
+    assert [s.name for s in last][-1] == "m0"
+    assert last[-1].start.row == len(lines) - 2
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import dataclasses
+import pickle
+
+import pytest
+
+from mini_code_index.chunking import (
+    Chunk,
+    Config,
+    Scope,
+    ScopeKind,
+    ScopeTable,
+    TreeSitterChunker,
+    _HAS_TREESITTER,
+    pack_chunks,
+    unpack_chunks,
+)
+
+
+def test_chunks_and_scopes_are_slotted() -> None:
+    scope = Scope(kind=ScopeKind.FUNCTION, name="f")
+    chunk = Chunk(text="x")
+    assert not hasattr(scope, "__dict__")
+    assert not hasattr(chunk, "__dict__")
+    assert chunk.scope_path == () and chunk.contained_scopes == ()
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        scope.name = "g"  # type: ignore[misc]
+    chunk.text = "y"
+    assert chunk.text == "y"
+
+    assert pickle.loads(pickle.dumps(scope)) == scope
+    assert pickle.loads(pickle.dumps(chunk)) == chunk
+
+
+def test_scope_table_interns_scopes_and_paths() -> None:
+    table = ScopeTable()
+    a1 = Scope(kind=ScopeKind.FILE, name="m", raw_type="file")
+    a2 = Scope(kind=ScopeKind.FILE, name="m", raw_type="file")
+    f = Scope(kind=ScopeKind.FUNCTION, name="f")
+
+    p1 = table.path([a1, f])
+    p2 = table.path((a2, f))
+    assert p1 is p2
+    assert p1[0] is a1
+    assert table.intern(a2) is a1
+    assert table.ids([f, a2]) == (1, 0)
+    assert len(table) == 2
+
+
+@pytest.mark.skipif(not _HAS_TREESITTER, reason="tree-sitter not installed")
+def test_chunks_of_a_file_share_scope_tuples() -> None:
+    src = "class A:\n" + "".join(f"    def m{i}(self):\n        return {i}\n\n" for i in range(20))
+    chunks = list(TreeSitterChunker(Config(chunk_size=60, mode="type")).chunk_str(src, path="a.py"))
+    assert len(chunks) > 3
+
+    paths = {id(c.scope_path) for c in chunks}
+    assert len(paths) < len(chunks)
+    assert all(isinstance(c.scope_path, tuple) for c in chunks)
+    type_scopes = {id(s) for c in chunks for s in c.scope_path if s.kind == ScopeKind.TYPE}
+    assert len(type_scopes) == 1
+
+    restored = unpack_chunks(pack_chunks(chunks))
+    assert [c.scope_path for c in restored] == [c.scope_path for c in chunks]
+    assert restored[1].scope_path is restored[2].scope_path
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+import pytest
+
+from mini_code_index.chunking import Config as ChunkConfig, _HAS_TREESITTER
+from mini_code_index.indexing import (
+    IndexConfig,
+    _iter_chunk_windows_sync,
+    _prepare_chunks_for_file_sync,
+    index_directory,
+)
+from mini_code_index.pipeline import PipelineConfig
+
+needs_treesitter = pytest.mark.skipif(not _HAS_TREESITTER, reason="tree-sitter not installed")
+
+
+class BatchEmbedder:
+    def __init__(self) -> None:
+        self.calls: list[int] = []
+
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        self.calls.append(len(texts))
+        return [[0.0] for _ in texts]
+
+
+class MemoryStore:
+    collection_name = "stream-test"
+
+    def __init__(self) -> None:
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.state: dict[str, Any] = {}
+        self.ops: list[str] = []
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        return next((m for m in self.rows.values() if m["path"] == path), None)
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        return {
+            m["path"]: m["sha256"]
+            for m in self.rows.values()
+            if m["path"] in set(paths) and m["chunk_kind"] == "relpath"
+        }
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        return [i for i, m in self.rows.items() if m["path"] == path]
+
+    async def delete_by_path(self, *, path: str) -> None:
+        for i in await self.get_ids_by_path(path=path):
+            del self.rows[i]
+
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        self.ops.append("delete")
+        for i in ids:
+            self.rows.pop(i, None)
+
+    async def update_metadatas(self, *, ids: Sequence[str], metadatas: Sequence[Mapping[str, Any]]) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.ops.append(f"update:{meta['chunk_kind']}")
+            self.rows[i] = dict(meta)
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.ops.append(f"upsert:{meta['chunk_kind']}")
+            self.rows[i] = dict(meta)
+
+    async def get_index_state(self) -> dict[str, Any]:
+        return dict(self.state)
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        self.state.update(state)
+
+
+def _source(n: int, *, body: int = 12) -> str:
+    parts = []
+    for i in range(n):
+        lines = "".join(f"        v{j} = x + {i * j}\n" for j in range(body))
+        parts.append(f"class C{i}:\n    def m(self, x):\n{lines}        return x\n\n")
+    return "".join(parts)
+
+
+def _comparable(rows: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    out = {}
+    for chunk_id, meta in rows.items():
+        out[chunk_id] = {k: v for k, v in meta.items() if k not in {"created_at", "group_id"}}
+        out[chunk_id]["grouped"] = "group_id" in meta
+    return out
+
+
+@needs_treesitter
+@pytest.mark.parametrize("mode", ["function", "type", "file"])
+def test_windows_match_whole_file_chunking(tmp_path: Path, mode: str) -> None:
+    path = tmp_path / "big.py"
+    path.write_text(_source(30), encoding="utf-8")
+    data = path.read_bytes()
+    cfg = ChunkConfig(chunk_size=120, mode=mode)
+    kwargs = dict(file_path=str(path), rel_path="big.py", file_sha256="s", chunk_cfg=cfg, data=data)
+
+    whole = _prepare_chunks_for_file_sync(**kwargs)
+    windows = list(_iter_chunk_windows_sync(window=7, **kwargs))
+    assert len(windows) > 3
+    assert [last for _, last in windows] == [False] * (len(windows) - 1) + [True]
+    streamed = [item for w, _ in windows for item in w]
+
+    def key(items):
+        return sorted(
+            (kind, c.text, c.start, c.group_index, c.group_id is not None) for c, kind in items
+        )
+
+    assert key(streamed) == key(whole)
+    # Split scopes are linked the same way: same members, one id per group.
+    groups: dict[str, set[str]] = {}
+    for c, _ in streamed:
+        if c.group_id is not None:
+            groups.setdefault(c.group_id, set()).add(c.text)
+    expected: dict[str, set[str]] = {}
+    for c, _ in whole:
+        if c.group_id is not None:
+            expected.setdefault(c.group_id, set()).add(c.text)
+    assert sorted(map(sorted, groups.values())) == sorted(map(sorted, expected.values()))
+
+
+@needs_treesitter
+def test_streamed_index_matches_buffered_index(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    src = root / "big.py"
+    src.write_text(_source(40), encoding="utf-8")
+    chunk_cfg = ChunkConfig(chunk_size=150, mode="function")
+
+    def _run(store: MemoryStore, embedder: BatchEmbedder, stream_min_bytes: Optional[int]):
+        cfg = IndexConfig(root_dir=str(root), dry_run=False, use_manifest=False, use_embedding_cache=False)
+        pipeline_cfg = PipelineConfig(
+            stream_min_bytes=stream_min_bytes, stream_window=16, coalesce_embeddings=False
+        )
+        return asyncio.run(
+            index_directory(
+                cfg=cfg,
+                chunk_cfg=chunk_cfg,
+                embedder=embedder,
+                store=store,
+                pipeline_cfg=pipeline_cfg,
+                batch_size=8,
+            )
+        )
+
+    buffered, streamed = MemoryStore(), MemoryStore()
+    buffered_stats = _run(buffered, BatchEmbedder(), None)
+    embedder = BatchEmbedder()
+    stats = _run(streamed, embedder, 0)
+    assert _comparable(streamed.rows) == _comparable(buffered.rows)
+    assert stats.chunks_emitted == buffered_stats.chunks_emitted == len(streamed.rows)
+    assert stats.chunks_embedded == len(streamed.rows)
+    assert max(embedder.calls) <= 8
+
+    # An edit re-embeds only the changed chunks; stale ids go with the last
+    # window and the relpath chunk is refreshed after them.
+    src.write_text(_source(40).replace("v3 = x + 30\n", "v3 = x - 30\n"), encoding="utf-8")
+    _run(buffered, BatchEmbedder(), None)
+    streamed.ops.clear()
+    embedder = BatchEmbedder()
+    stats = _run(streamed, embedder, 0)
+    assert _comparable(streamed.rows) == _comparable(buffered.rows)
+    assert stats.chunks_embedded == sum(embedder.calls) == 1
+    assert stats.chunks_deleted == 1
+    assert streamed.ops.index("delete") < streamed.ops.index("update:relpath")
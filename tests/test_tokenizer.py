@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import math
+from pathlib import Path
+from typing import Any, Sequence
+
+import pytest
+
+from mini_code_index.embedding import (
+    EmbeddingCoalescer,
+    EmbeddingError,
+    OpenAICompatibleEmbedder,
+    _create_token_aware_batches,
+)
+from mini_code_index.tokenizer import BPETokenCounter, EstimatingTokenCounter
+
+
+def _ranks() -> dict[bytes, int]:
+    ranks = {bytes([i]): i for i in range(256)}
+    for merge in [b"re", b"ret", b"retu", b"return", b" return", b"de", b"def", b" x", b"xx", b"xxxx"]:
+        ranks[merge] = len(ranks)
+    return ranks
+
+
+class CharCounter:
+    """One token per character."""
+
+    def count(self, text: str) -> int:
+        return max(1, len(text))
+
+    def split(self, text: str, max_tokens: int) -> list[str]:
+        return [text[i : i + max_tokens] for i in range(0, len(text), max_tokens)]
+
+
+def _rows(vectors) -> list[list[float]]:
+    """Vectors as plain float lists (the embedder may return a numpy matrix)."""
+
+    return [[float(x) for x in v] for v in vectors]
+
+
+class FakeEmbedder(OpenAICompatibleEmbedder):
+    """Embeds each text as [1, number of "b" characters]."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(api_key="test", token_counter=CharCounter(), **kwargs)
+        self.sent: list[list[str]] = []
+
+    async def _request(self, inputs: Sequence[str]) -> dict[str, Any]:
+        self.sent.append(list(inputs))
+        return {
+            "data": [
+                {"index": i, "embedding": [1.0, float(t.count("b"))]} for i, t in enumerate(inputs)
+            ]
+        }
+
+
+def test_bpe_counts_merged_tokens(tmp_path: Path) -> None:
+    vocab = tmp_path / "tiny.tiktoken"
+    vocab.write_bytes(
+        b"".join(base64.b64encode(tok) + b" " + str(rank).encode() + b"\n" for tok, rank in _ranks().items())
+    )
+    counter = BPETokenCounter.from_file(str(vocab))
+
+    assert counter.count("def") == 1
+    assert counter.count(" return") == 1
+    # "def" | " f" | "():\n" | " return" | " x"
+    assert counter.count("def f():\n return x") == 1 + 2 + 4 + 1 + 1
+    assert counter.count("xxxxxxxxx") == 3
+    # Symbol-heavy code is far denser than the chars/4 estimate assumes.
+    code = "{[(<>)]};;" * 10
+    assert counter.count(code) > 2 * EstimatingTokenCounter().count(code)
+
+    counter.count("def f():\n return x")
+    assert counter._count_cached.cache_info().hits >= 1
+
+
+def test_split_respects_the_limit_and_keeps_the_text() -> None:
+    counter = BPETokenCounter(_ranks())
+    text = "def f():\n    return x\n" * 20 + "q" * 50
+    pieces = counter.split(text, 7)
+    assert "".join(pieces) == text
+    assert all(counter.count(p) <= 7 for p in pieces)
+
+    estimate = EstimatingTokenCounter()
+    pieces = estimate.split("a" * 101, 5)
+    assert "".join(pieces) == "a" * 101
+    assert all(estimate.count(p) <= 5 for p in pieces)
+
+
+def test_batches_pack_against_the_counter() -> None:
+    texts = ["ab", "abcd", "a", "abcdef", "abc"]
+    batches = _create_token_aware_batches(texts, batch_size=10, token_limit=7, counter=CharCounter())
+    assert batches == [["ab", "abcd", "a"], ["abcdef"], ["abc"]]
+
+    with pytest.raises(EmbeddingError):
+        _create_token_aware_batches(["a" * 9], batch_size=10, token_limit=7, counter=CharCounter())
+    batches = _create_token_aware_batches(
+        ["a", "a" * 9, "a"], batch_size=10, token_limit=7, counter=CharCounter(), oversize="split"
+    )
+    assert batches == [["a"], ["a" * 9], ["a"]]
+
+    # Small inputs still honour batch_size.
+    assert len(_create_token_aware_batches(["a"] * 5, batch_size=2, token_limit=100)) == 3
+
+
+def test_oversize_policies() -> None:
+    text = "a" * 6 + "b" * 4  # 10 tokens; split at 4 -> "aaaa", "aabb", "bb"
+
+    with pytest.raises(EmbeddingError):
+        asyncio.run(FakeEmbedder(token_limit=4, oversize="error").embed([text]))
+
+    truncating = FakeEmbedder(token_limit=4, oversize="truncate")
+    assert _rows(asyncio.run(truncating.embed(["xy", text]))) == [[1.0, 0.0], [1.0, 0.0]]
+    assert truncating.sent == [["xy"], ["aaaa"]]
+
+    splitting = FakeEmbedder(token_limit=4, oversize="split", max_in_flight=1)
+    vectors = _rows(asyncio.run(splitting.embed(["bb", text, "b"])))
+    assert [t for batch in splitting.sent for t in batch] == ["bb", "aaaa", "aabb", "bb", "b"]
+    assert vectors[0] == [1.0, 2.0] and vectors[2] == [1.0, 1.0]
+    # Token-weighted mean of [1,0], [1,2], [1,2] (weights 4, 4, 2) = [1, 1.2],
+    # rescaled to the pieces' mean norm.
+    target = (1.0 + 2 * math.sqrt(5.0)) / 3
+    scale = target / math.sqrt(1.0 + 1.2**2)
+    assert vectors[1] == pytest.approx([scale, 1.2 * scale])
+
+    with pytest.raises(ValueError):
+        FakeEmbedder(oversize="drop")
+
+
+def test_coalescer_hands_oversized_inputs_to_the_embedder() -> None:
+    inner = FakeEmbedder(token_limit=4, batch_size=8, oversize="split")
+
+    async def main() -> list[list[list[float]]]:
+        coalescer = EmbeddingCoalescer(inner, max_wait_s=0.01)
+        results = await asyncio.gather(coalescer.embed(["b", "bb"]), coalescer.embed(["b" * 9]))
+        await coalescer.close()
+        return list(results)
+
+    small, big = asyncio.run(main())
+    assert _rows(small) == [[1.0, 1.0], [1.0, 2.0]]
+    assert len(big) == 1 and big[0][0] > 0
+    assert ["b" * 9] not in inner.sent
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from pathlib import Path
+
+import pytest
+
+from mini_code_index.chunking import Config, TreeSitterChunker, _HAS_TREESITTER
+from mini_code_index.indexing import IndexConfig, index_directory
+from mini_code_index.tree_cache import TreeCache, compute_edit
+
+needs_treesitter = pytest.mark.skipif(not _HAS_TREESITTER, reason="tree-sitter not installed")
+
+
+def _source(nfuncs: int) -> str:
+    parts = ["import os\n\n# header comment\n"]
+    for i in range(nfuncs):
+        if i % 7 == 0:
+            parts.append(f"# comment for f{i}\n")
+        if i % 11 == 0:
+            parts.append(f"class C{i}:\n    x = {i}\n    def m(self):\n        return {i}\n\n")
+        parts.append(f"def f{i}(a, b):\n    '''doc {i}'''\n    return a + b * {i}\n\n")
+    return "".join(parts)
+
+
+def _key(chunks) -> list[tuple]:
+    return [
+        (c.text, c.start, c.end, c.scope_path, c.contained_scopes, c.scope_start, c.scope_end)
+        for c in chunks
+    ]
+
+
+def test_compute_edit() -> None:
+    assert compute_edit(b"abc", b"abc") is None
+
+    edit = compute_edit(b"a\nbc\nd\n", b"a\nbXc\nd\n")
+    assert edit is not None
+    assert (edit.start_byte, edit.old_end_byte, edit.new_end_byte) == (3, 3, 4)
+    assert edit.start_point == (1, 1)
+    assert edit.new_end_point == (1, 2)
+    assert edit.delta == 1
+
+    # Deleting a line: the suffix match must not overlap the prefix.
+    edit = compute_edit(b"x\nx\nx\n", b"x\nx\n")
+    assert edit is not None
+    assert edit.new_end_byte >= edit.start_byte
+    assert edit.old_end_byte - edit.start_byte == 2
+
+
+@needs_treesitter
+@pytest.mark.parametrize("mode", ["function", "type"])
+def test_incremental_chunks_match_full_chunking(mode: str) -> None:
+    cfg = Config(chunk_size=150, mode=mode, overlap_ratio=0.1)
+    chunker = TreeSitterChunker(cfg)
+    cache = TreeCache()
+    path = "/repo/mod.py"
+    src = _source(60)
+    list(chunker.chunk_str(src, path=path, tree_cache=cache))
+
+    rng = random.Random(7)
+    for _ in range(25):
+        lines = src.split("\n")
+        k = rng.randrange(len(lines))
+        op = rng.random()
+        if op < 0.3:
+            lines.insert(k, rng.choice(["    y = 1", "# note", "def g():", "", "class Q:", "x = ("]))
+        elif op < 0.6:
+            del lines[k]
+        else:
+            lines[k] += rng.choice([" ", "1", "  # c", "("])
+        src = "\n".join(lines)
+        got = _key(chunker.chunk_str(src, path=path, tree_cache=cache))
+        assert got == _key(TreeSitterChunker(cfg).chunk_str(src, path=path))
+
+    # Edits that leave syntax errors behind are chunked from scratch.
+    assert cache.incremental_parses + cache.full_parses == 26
+
+
+@needs_treesitter
+@pytest.mark.parametrize("mode", ["function", "type"])
+def test_valid_edits_reuse_segments(mode: str) -> None:
+    cfg = Config(chunk_size=150, mode=mode, overlap_ratio=0.1)
+    chunker = TreeSitterChunker(cfg)
+    cache = TreeCache()
+    path = "/repo/mod.py"
+    src = _source(60)
+    list(chunker.chunk_str(src, path=path, tree_cache=cache))
+
+    rng = random.Random(11)
+    for _ in range(25):
+        lines = src.split("\n")
+        k = rng.randrange(len(lines))
+        op = rng.random()
+        if op < 0.4:
+            lines.insert(k, " " * (len(lines[k]) - len(lines[k].lstrip())) + "# note")
+        elif op < 0.7:
+            lines[k] += "  # c"
+        else:
+            lines[k] += " "
+        src = "\n".join(lines)
+        got = _key(chunker.chunk_str(src, path=path, tree_cache=cache))
+        assert got == _key(TreeSitterChunker(cfg).chunk_str(src, path=path))
+
+    assert cache.incremental_parses == 25
+    assert cache.segments_reused > cache.segments_chunked
+
+
+@needs_treesitter
+def test_syntax_errors_fall_back_to_a_full_parse() -> None:
+    cfg = Config(chunk_size=150, mode="function")
+    chunker = TreeSitterChunker(cfg)
+    cache = TreeCache()
+    path = "/repo/mod.py"
+    src = _source(20)
+    list(chunker.chunk_str(src, path=path, tree_cache=cache))
+
+    broken = src.replace("def f3(a, b):", "def f3(a, b:")
+    got = _key(chunker.chunk_str(broken, path=path, tree_cache=cache))
+    assert got == _key(TreeSitterChunker(cfg).chunk_str(broken, path=path))
+    # The cached tree has errors now: the repair is parsed from scratch too.
+    list(chunker.chunk_str(src, path=path, tree_cache=cache))
+    assert cache.incremental_parses == 0
+    assert cache.full_parses == 3
+
+
+@needs_treesitter
+def test_cache_is_bounded_and_keyed_by_config() -> None:
+    cache = TreeCache(max_entries=2)
+    chunker = TreeSitterChunker(Config(chunk_size=150, mode="function"))
+    for name in ("a", "b", "c"):
+        list(chunker.chunk_str(_source(3), path=f"/repo/{name}.py", tree_cache=cache))
+    assert len(cache) == 2
+    assert cache.take("/repo/a.py") is None
+
+    # A different chunking config never reuses another config's segments.
+    other = TreeSitterChunker(Config(chunk_size=90, mode="function"))
+    src = _source(3)
+    got = _key(other.chunk_str(src, path="/repo/c.py", tree_cache=cache))
+    assert got == _key(TreeSitterChunker(Config(chunk_size=90, mode="function")).chunk_str(src, path="/repo/c.py"))
+    assert cache.incremental_parses == 0
+
+
+@needs_treesitter
+def test_index_directory_uses_tree_cache(tmp_path: Path) -> None:
+    root = tmp_path / "repo"
+    root.mkdir()
+    path = root / "m.py"
+    path.write_text(_source(20), encoding="utf-8")
+    cache = TreeCache()
+
+    def _run() -> None:
+        asyncio.run(
+            index_directory(
+                cfg=IndexConfig(root_dir=str(root), dry_run=True, use_manifest=False),
+                chunk_cfg=Config(mode="function"),
+                embedder=None,  # type: ignore[arg-type]
+                store=None,  # type: ignore[arg-type]
+                tree_cache=cache,
+            )
+        )
+
+    _run()
+    assert cache.full_parses == 1
+    path.write_text(_source(20).replace("return a + b * 5", "return a - b * 5"), encoding="utf-8")
+    _run()
+    assert cache.incremental_parses == 1
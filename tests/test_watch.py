@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+import pytest
+
+from mini_code_index import watch
+from mini_code_index.chunking import Config as ChunkConfig
+from mini_code_index.indexing import IndexConfig, IndexStats
+from mini_code_index.watch import WatchConfig, watch_directory
+
+
+class ZeroEmbedder:
+    async def embed(self, texts: Sequence[str]) -> list[list[float]]:
+        return [[0.0] for _ in texts]
+
+
+class MemoryStore:
+    collection_name = "watch-test"
+
+    def __init__(self) -> None:
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.state: dict[str, Any] = {}
+
+    def paths(self) -> set[str]:
+        return {m["path"] for m in self.rows.values()}
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get_one_by_path(self, *, path: str) -> Optional[Mapping[str, Any]]:
+        return next((m for m in self.rows.values() if m["path"] == path), None)
+
+    async def get_sha_by_paths(self, *, paths: Sequence[str]) -> dict[str, str]:
+        wanted = set(paths)
+        return {
+            m["path"]: m["sha256"]
+            for m in self.rows.values()
+            if m["path"] in wanted and m["chunk_kind"] == "relpath"
+        }
+
+    async def get_ids_by_path(self, *, path: str) -> list[str]:
+        return [i for i, m in self.rows.items() if m["path"] == path]
+
+    async def delete_by_path(self, *, path: str) -> None:
+        for i in [i for i, m in self.rows.items() if m["path"] == path]:
+            del self.rows[i]
+
+    async def delete_by_ids(self, *, ids: Sequence[str]) -> None:
+        for i in ids:
+            self.rows.pop(i, None)
+
+    async def update_metadatas(self, *, ids: Sequence[str], metadatas: Sequence[Mapping[str, Any]]) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def upsert(
+        self,
+        *,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadatas: Sequence[Mapping[str, Any]],
+    ) -> None:
+        for i, meta in zip(ids, metadatas):
+            self.rows[i] = dict(meta)
+
+    async def get_index_state(self) -> dict[str, Any]:
+        return dict(self.state)
+
+    async def set_index_state(self, *, state: Mapping[str, Any]) -> None:
+        self.state.update(state)
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_watch_indexes_changes_and_deletions(tmp_path: Path, monkeypatch, native: bool) -> None:
+    if native and not watch._HAS_WATCHFILES:
+        pytest.skip("watchfiles not installed")
+    if not native:
+        monkeypatch.setattr(watch, "_HAS_WATCHFILES", False)
+
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.py").write_text("def a():\n    return 1\n", encoding="utf8")
+    (root / "pkg").mkdir()
+    (root / "pkg" / "b.py").write_text("def b():\n    return 2\n", encoding="utf8")
+
+    store = MemoryStore()
+    cfg = IndexConfig(
+        root_dir=str(root),
+        dry_run=False,
+        manifest_path=str(tmp_path / "manifest.json"),
+        use_embedding_cache=False,
+    )
+
+    async def main() -> list[IndexStats]:
+        stop = asyncio.Event()
+        batches: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(
+            watch_directory(
+                cfg=cfg,
+                chunk_cfg=ChunkConfig(chunk_size=200, mode="function"),
+                embedder=ZeroEmbedder(),
+                store=store,
+                watch_cfg=WatchConfig(debounce_s=0.1, max_delay_s=1.0, poll_interval_s=0.1),
+                stop_event=stop,
+                on_batch=batches.put_nowait,
+            )
+        )
+        seen: list[IndexStats] = []
+
+        async def wait_until(cond) -> None:
+            while not cond():
+                seen.append(await asyncio.wait_for(batches.get(), timeout=10))
+
+        # Initial sync, then let the watcher start.
+        await asyncio.sleep(0.5)
+        assert store.paths() == {str(root / "a.py"), str(root / "pkg" / "b.py")}
+
+        (root / "c.py").write_text("def c():\n    return 3\n", encoding="utf8")
+        (root / ".hidden.py").write_text("def h():\n    pass\n", encoding="utf8")
+        await wait_until(lambda: str(root / "c.py") in store.paths())
+
+        (root / "a.py").unlink()
+        await wait_until(lambda: str(root / "a.py") not in store.paths())
+
+        # Renaming a directory drops the old paths and indexes the new ones.
+        (root / "pkg").rename(root / "lib")
+        await wait_until(lambda: str(root / "lib" / "b.py") in store.paths())
+        await wait_until(lambda: str(root / "pkg" / "b.py") not in store.paths())
+
+        stop.set()
+        await asyncio.wait_for(task, timeout=10)
+        return seen
+
+    asyncio.run(main())
+    assert store.paths() == {str(root / "c.py"), str(root / "lib" / "b.py")}
+
+
+def test_relevance_filter(tmp_path: Path) -> None:
+    cfg = IndexConfig(root_dir=str(tmp_path), dry_run=False)
+    (tmp_path / "a.py").write_text("x = 1\n", encoding="utf8")
+    assert watch._is_relevant(cfg, str(tmp_path / "a.py"))
+    assert watch._is_relevant(cfg, str(tmp_path / "gone.py"))
+    assert not watch._is_relevant(cfg, str(tmp_path / ".git" / "index"))
+    assert not watch._is_relevant(cfg, str(tmp_path / "__pycache__"))
+    assert not watch._is_relevant(cfg, str(tmp_path.parent / "other.py"))